@@ -1,7 +1,9 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import base64
 import boto3
+import json
 import os
 import sys
 
@@ -13,6 +15,7 @@ USER_POOL_APP_CLIENT_ID = ''
 client = boto3.client('cognito-idp')
 
 def lambda_handler(event, context):
+    event = get_request_fields(event)
     if 'username' not in event or 'password' not in event:
         return {
             'status': 'fail',
@@ -29,6 +32,19 @@ def lambda_handler(event, context):
         'tokens': resp['AuthenticationResult']
     }
 
+# REST API integrations pass the request body as the event.  HTTP API proxy
+# integrations wrap it, so unwrap the body in that case.
+def get_request_fields(event):
+    if 'body' not in event:
+        return event
+    body = event['body'] or '{}'
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    try:
+        return json.loads(body)
+    except ValueError:
+        return {}
+
 def initiate_auth(username, password):
     try:
         resp = client.initiate_auth(
@@ -14,7 +14,7 @@ game_lift = boto3.client("gamelift")
 def lambda_handler(event, context):
     response = {}
     # Find an game session with availability then create a new player session on it
-    game_session = find_available_game_session()
+    game_session = find_available_game_session(preferred_location(event))
     if (game_session is not None):
         player_session = game_lift.create_player_session(GameSessionId =  game_session['GameSessionId'], PlayerId = str(uuid.uuid4()))
         response = player_session
@@ -25,13 +25,41 @@ def lambda_handler(event, context):
         }
     return json.dumps(response, default = myconverter).encode('UTF-8')
 
+# The fleet location with the lowest latency the client reported, as a body of
+# {"latencyInMs": {"us-west-2": 40}} or a ?latencies=us-west-2:40 query string.
+# HTTP APIs pass the body on as a json string
+def preferred_location(event):
+    try:
+        query = (event.get('queryStringParameters') or {}).get('latencies')
+        if query:
+            latencies = dict(p.split(':') for p in query.split(','))
+        else:
+            body = event.get('body')
+            latencies = (json.loads(body) if isinstance(body, str) and body else event).get('latencyInMs') or {}
+        latencies = {k: float(v) for k, v in latencies.items() if k in fleet_locations()}
+    except (AttributeError, TypeError, ValueError, game_lift.exceptions.ClientError):
+        # a malformed latency or a role without
+        # gamelift:DescribeFleetLocationAttributes: no preference
+        return None
+    return min(latencies, key = latencies.get) if latencies else None
+
+fleet_location_names = None
+
+def fleet_locations():
+    global fleet_location_names
+    if fleet_location_names is None:
+        response = game_lift.describe_fleet_location_attributes(FleetId = GAMELIFT_FLEET_ID)
+        fleet_location_names = [a['LocationState']['Location'] for a in response['LocationAttributes']]
+    return fleet_location_names
+
 # Find existing game session with available player sessions, otherwise create a new game session on the fleet
-def find_available_game_session():
-    game_sessions = game_lift.search_game_sessions(FleetId = GAMELIFT_FLEET_ID, FilterExpression = "hasAvailablePlayerSessions=true")
+def find_available_game_session(location = None):
+    where = {'Location': location} if location else {}
+    game_sessions = game_lift.search_game_sessions(FleetId = GAMELIFT_FLEET_ID, FilterExpression = "hasAvailablePlayerSessions=true", **where)
     game_session = {}
     if (len(game_sessions['GameSessions']) == 0):
         # Create a new game session
-        game_session = game_lift.create_game_session(FleetId = GAMELIFT_FLEET_ID, MaximumPlayerSessionCount = 16)['GameSession']
+        game_session = game_lift.create_game_session(FleetId = GAMELIFT_FLEET_ID, MaximumPlayerSessionCount = 16, **where)['GameSession']
         # Wait for game session status to leave ACTIVATING state
         game_session_status = "ACTIVATING"
         while (game_session_status == "ACTIVATING"):
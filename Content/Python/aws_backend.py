@@ -17,19 +17,49 @@ import os
 import argparse
 import time
 import logging
+import logging.handlers
 import json
-import zipfile
+import queue
+import atexit
 import io
-import subprocess
 import re
+import shlex
 import uuid
+import weakref
+import csv
+import base64
+import datetime
+import collections
+import hashlib
+import contextlib
+import contextvars
+import functools
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import webbrowser
-import boto3
-from botocore.exceptions import ClientError,ProfileNotFound
+from aws_backend_trace import tracer, DEFAULT_TRACE_FILE
 
 OK_STRING="...ok"
 
+
+# boto3 and botocore are most of this module's import time, and the metadata
+# and config requests (what the editor asks first) never touch AWS.  The first
+# AwsBackend imports them.  Other modules only the AWS side uses (zipfile,
+# tempfile, webbrowser, urllib.request, statistics) are imported where they
+# are used.
+# aws_backend_bench.py imports checks that importing this module stays cheap.
+def load_aws_sdk():
+    global boto3, ClientError, ProfileNotFound
+    if "boto3" not in globals():
+        from botocore.exceptions import ClientError, ProfileNotFound
+        import boto3
+
+
+def open_in_browser(url):
+    import webbrowser
+    webbrowser.open(url)
+
 fleet_description = \
     '<Header>GameLift Starter Script</>\n' \
     '<a id=\"source\" href=\"[FILE_PATH]" style=\"Hyperlink\">aws_backend.py</>\n\n' \
@@ -107,12 +137,14 @@ fleet_metadata_json = {
         "Button actions:\n"
         " \u2022 Check: Is there a fleet with the expected name AND in the ACTIVE state\n"
         " \u2022 Launch: Creates the fleet.  Takes awhile, see above.\n"
+        " \u2022 Progress: Shows the new launch events and an estimate of the time left\n"
         " \u2022 Delete: Requests deletion of the fleet.  Note that GameLift won't allow deletion until the fleet is ACTIVE\n"
         " \u2022 AWS: Opens the AWS fleet console\n"
         ,
 		"Requests": [
             { "Name": "Check", "RequestPath": "/deployment/fleet/check" },
             { "Name": "Launch", "RequestPath": "/deployment/fleet/create" },
+            { "Name": "Progress", "RequestPath": "/deployment/fleet/progress" },
             { "Name": "Delete", "RequestPath": "/deployment/fleet/delete" },
             { "Name": "AWS", "RequestPath": "/deployment/fleet/browse" },
         ]
@@ -125,9 +157,9 @@ fleet_metadata_json = {
         "\n"
         "Button actions:\n"
         " \u2022 Check: Is there a user pool with the expected name?\n"
-        " \u2022 Create: Creates the user pool and creates 32 test accounts:\n"
-        "                    user1/pass12\n"
-        "                    user2/pass12 etc...\n"
+        " \u2022 Create: Creates the user pool and test accounts (32 by default, see user_pool_test_user_count):\n"
+        "                    user0/test12\n"
+        "                    user1/test12 etc...\n"
         " \u2022 Delete: Deletes the user pool \n"
         " \u2022 AWS: Opens the AWS Cognito home page\n",
 		"Requests": [
@@ -222,6 +254,7 @@ can_gamelift_session_control_policy_json = {
                     "gamelift:CreateGameSession",
                     "gamelift:CreatePlayerSession",
                     "gamelift:CreatePlayerSessions",
+                    "gamelift:DescribeFleetLocationAttributes",
                     "gamelift:DescribeGameSessionDetails",
                     "gamelift:DescribeGameSessions",
                     "gamelift:ListFleets",
@@ -233,6 +266,72 @@ can_gamelift_session_control_policy_json = {
         ]
     }
 
+can_cognito_import_policy_json = {
+            "Version": "2012-10-17",
+            "Statement": [
+                {
+                    "Effect": "Allow",
+                    "Principal": {
+                        "Service": "cognito-idp.amazonaws.com"
+                    },
+                    "Action": "sts:AssumeRole"
+                }
+            ]
+        }
+
+# user import jobs report their progress to cloudwatch logs
+can_write_cognito_import_logs_json = {
+            "Version": "2012-10-17",
+            "Statement": [
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "logs:CreateLogGroup",
+                    "logs:CreateLogStream",
+                    "logs:DescribeLogStreams",
+                    "logs:PutLogEvents"
+                ],
+                "Resource": "arn:aws:logs:*:*:log-group:/aws/cognito/*"
+            }
+        ]
+    }
+
+user_pool_policies = {
+    "PasswordPolicy": {
+        "MinimumLength": 6,
+        "RequireUppercase": False,
+        "RequireLowercase": False,
+        "RequireNumbers": False,
+        "RequireSymbols": False
+    }
+}
+
+user_pool_schema = [{"Name": "email",
+    "AttributeDataType": "String",
+    "DeveloperOnlyAttribute": False,
+    "Mutable": True,
+    "Required": True,
+    "StringAttributeConstraints": {
+        "MinLength": "0",
+        "MaxLength": "2048"
+    }}]
+
+user_pool_redirect_uri = "https://aws.amazon.com"
+
+# every resource AwsBackend creates is tagged with STACK_TAG_KEY=<prefix> so
+# the whole stack can be found with one resource groups tagging api query
+STACK_TAG_KEY = "GameLiftStarterPrefix"
+
+# arn pattern -> (state file key, which part of the arn is the id)
+stack_arn_patterns = [
+    (re.compile(r"^arn:aws[\w-]*:gamelift:[^:]*:[^:]*:build/(.+)$"), "build_id"),
+    (re.compile(r"^arn:aws[\w-]*:gamelift:[^:]*:[^:]*:fleet/(.+)$"), "fleet_id"),
+    (re.compile(r"^arn:aws[\w-]*:cognito-idp:[^:]*:[^:]*:userpool/(.+)$"), "user_pool_id"),
+    (re.compile(r"^arn:aws[\w-]*:apigateway:[^:]*::/restapis/([^/]+)$"), "rest_api_id"),
+    (re.compile(r"^arn:aws[\w-]*:apigateway:[^:]*::/apis/([^/]+)$"), "http_api_id"),
+    (re.compile(r"^arn:aws[\w-]*:lambda:[^:]*:[^:]*:function:([^:]+)$"), "lambda_function"),
+]
+
 aws_logger = logging.getLogger(__name__)
 
 log_debug = aws_logger.debug    # detailed information
@@ -242,6 +341,318 @@ log_error = aws_logger.error    # something failed
 log_exception = aws_logger.exception    # level is ERROR. log the exception too
 log_critical = aws_logger.critical      # program failed
 
+
+#
+# log routing.  Each request or background job can carry its own sink (a
+# logging.Handler, e.g. the websocket that asked for it) in current_log_sink.
+# The one handler on aws_logger sends every record to the sink of whoever
+# logged it, so concurrent requests don't need to share or swap a handler.
+#
+
+# kept across importlib.reload, like deployment_jobs, so threads that set
+# them before a reload are still seen
+if "current_log_sink" not in globals():
+    current_log_sink = contextvars.ContextVar("aws_backend_log_sink", default=None)
+
+
+class ContextLogRouter(logging.Handler):
+    '''sends each record to current_log_sink, or to default_handler when the
+    record was logged outside any sink'''
+    def __init__(self):
+        super().__init__()
+        self.default_handler = None
+
+    # no handler-wide lock: each sink serializes its own output
+    def handle(self, record):
+        if self.filter(record):
+            self.emit(record)
+        return record
+
+    def emit(self, record):
+        route_log_record(current_log_sink.get() or self.default_handler, record)
+
+
+def route_log_record(sink, record):
+    if sink is not None and record.levelno >= sink.level:
+        sink.handle(record)
+
+
+# the region a thread of a multi-region run works in (see run_in_regions)
+if "current_region" not in globals():
+    current_region = contextvars.ContextVar("aws_backend_region", default=None)
+
+
+class RegionLogFilter(logging.Filter):
+    '''prefixes what one region of a multi-region run logs with [region]'''
+    def filter(self, record):
+        region_name = current_region.get()
+        if region_name is not None:
+            record.msg = f"[{region_name}] {record.getMessage()}"
+            record.args = ()
+        return True
+
+
+for log_filter in list(aws_logger.filters):
+    # the filter of the module before a reload
+    if type(log_filter).__name__ == "RegionLogFilter":
+        aws_logger.removeFilter(log_filter)
+aws_logger.addFilter(RegionLogFilter())
+
+log_router = ContextLogRouter()
+for handler in list(aws_logger.handlers):
+    # the router of the module before a reload
+    if type(handler).__name__ == "ContextLogRouter":
+        log_router.default_handler = handler.default_handler
+        aws_logger.removeHandler(handler)
+aws_logger.addHandler(log_router)
+
+
+@contextlib.contextmanager
+def log_sink(handler):
+    '''route what this thread (and the workers it starts) logs to handler'''
+    token = current_log_sink.set(handler)
+    try:
+        yield
+    finally:
+        current_log_sink.reset(token)
+
+
+#
+# queued log delivery.  Writing a record to a slow sink (an editor websocket,
+# the console) would otherwise hold up the thread that logged it, AWS work
+# included.  A QueuedLogSink only queues the record; the sink's own listener
+# thread delivers its queue in batches.  Each sink has its own bounded queue
+# and thread, so a slow sink falls behind (and drops records) on its own and
+# never holds up the logfile, the console or another request.  When a sink's
+# queue is full the logging thread waits a little (longer for warnings and
+# errors) and then drops the record, so a sink that falls behind costs at most
+# LOG_QUEUE_MAX_RECORDS records of memory.  Each sink counts what it dropped
+# and how far behind it delivered, which handle_request returns as
+# "Log Pipeline".
+#
+
+# per sink
+LOG_QUEUE_MAX_RECORDS = 10000
+LOG_BATCH_MAX_RECORDS = 200
+# how long a logging thread waits for room in a full queue before dropping the record
+LOG_QUEUE_WAIT_SECONDS = 0.05
+LOG_QUEUE_WARNING_WAIT_SECONDS = 1.0
+# how long a request waits for its log to be delivered before responding
+LOG_DRAIN_SECONDS = 2.0
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    '''takes up to max_batch of sink's queued records at a time and gives them
+    to the sink together'''
+    def __init__(self, sink, max_batch):
+        super().__init__(sink.queue)
+        self.sink = sink
+        self.max_batch = max_batch
+        self.stopping = False
+
+    def start(self):
+        self.stopping = False
+        super().start()
+
+    # a list of records, or the sentinel once the listener should stop
+    def dequeue(self, block):
+        if self.stopping:
+            return self._sentinel
+        record = self.queue.get(block)
+        if record is self._sentinel:
+            return record
+        records = [record]
+        while len(records) < self.max_batch:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is self._sentinel:
+                self.stopping = True
+                break
+            records.append(record)
+        return records
+
+    def handle(self, records):
+        self.sink.deliver(records)
+
+    def stop(self, timeout=None):
+        '''deliver what is already queued, waiting at most timeout seconds'''
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(self._sentinel, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+    def discard(self):
+        '''stop after the batch being delivered, dropping the rest.  Doesn't wait'''
+        if self._thread is None:
+            return
+        self.stopping = True
+        try:
+            # wakes a listener waiting on an empty queue
+            self.queue.put_nowait(self._sentinel)
+        except queue.Full:
+            pass
+        self._thread = None
+
+
+class RequestLogCount:
+    '''what one request (and its workers) queued on sink, so the request waits
+    for its own records and not for everything else the sink is sent'''
+    def __init__(self, sink):
+        self.sink = sink
+        self.queued = 0
+        self.delivered = 0
+        self.dropped = 0
+
+
+if "current_request_log" not in globals():
+    current_request_log = contextvars.ContextVar("aws_backend_request_log", default=None)
+
+
+class QueuedLogSink(logging.handlers.QueueHandler):
+    '''queues records for target.  Its listener thread, started with the first
+    record, delivers them'''
+    def __init__(self, target):
+        super().__init__(queue.Queue(LOG_QUEUE_MAX_RECORDS))
+        self.target = target
+        self.setLevel(target.level)
+        self.listener = BatchingQueueListener(self, LOG_BATCH_MAX_RECORDS)
+        self.counters = threading.Condition()
+        self.queued = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.dropped_reported = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.closed = False
+        # set by handle_request once the request it was made for has responded
+        self.request_finished = False
+        log_sinks.add(self)
+
+    # no handler-wide lock: the queue is thread safe
+    def handle(self, record):
+        if self.filter(record):
+            self.emit(record)
+        return record
+
+    def enqueue(self, record):
+        if self.listener._thread is None:
+            with self.counters:
+                if self.closed:
+                    return
+                if self.listener._thread is None:
+                    self.listener.start()
+        request_log = current_request_log.get()
+        if request_log is not None and request_log.sink is not self:
+            request_log = None
+        # record is this sink's copy (see prepare)
+        record.request_log = request_log
+        wait = LOG_QUEUE_WARNING_WAIT_SECONDS if record.levelno >= logging.WARNING else LOG_QUEUE_WAIT_SECONDS
+        try:
+            self.queue.put(record, timeout=wait)
+        except queue.Full:
+            with self.counters:
+                self.dropped += 1
+                if request_log is not None:
+                    request_log.dropped += 1
+            return
+        with self.counters:
+            self.queued += 1
+            if request_log is not None:
+                request_log.queued += 1
+
+    # on the listener thread: a batch of this sink's records
+    def deliver(self, records):
+        target = self.target
+        target.acquire()
+        try:
+            dropped = self.dropped - self.dropped_reported
+            if dropped:
+                self.dropped_reported += dropped
+                target.handle(logging.makeLogRecord({"name": aws_logger.name, "levelno": logging.WARNING,
+                    "levelname": "WARNING", "msg": f"log queue full, dropped {dropped} log records"}))
+            for record in records:
+                if record.levelno >= target.level:
+                    target.handle(record)
+            target.flush()
+        except Exception:
+            target.handleError(records[-1])
+        finally:
+            target.release()
+        now = time.time()
+        with self.counters:
+            self.delivered += len(records)
+            for record in records:
+                if record.request_log is not None:
+                    record.request_log.delivered += 1
+            self.lag = now - records[-1].created
+            self.max_lag = max(self.max_lag, now - records[0].created)
+            self.counters.notify_all()
+
+    def wait_until_delivered(self, timeout, request_log=None):
+        '''wait for request_log's records, or without one for the records queued
+        so far, to be delivered'''
+        with self.counters:
+            if request_log is not None:
+                return self.counters.wait_for(lambda: request_log.delivered >= request_log.queued, timeout)
+            queued = self.queued
+            return self.counters.wait_for(lambda: self.delivered >= queued, timeout)
+
+    # request_log: count only that request's records
+    def stats(self, request_log=None):
+        counts = self if request_log is None else request_log
+        with self.counters:
+            return {
+                "Queued": counts.queued,
+                "Delivered": counts.delivered,
+                "Dropped": counts.dropped,
+                "Lag": self.lag,
+                "Max Lag": self.max_lag,
+                "Queue Depth": self.queue.qsize(),
+            }
+
+    def close(self, drain=False):
+        '''stop delivering.  What is still queued is delivered if drain (without
+        waiting for it) or else dropped'''
+        with self.counters:
+            self.closed = True
+            if drain:
+                self.listener.stop(0)
+            self.listener.discard()
+        super().close()
+
+
+def stop_log_sinks(timeout):
+    '''deliver what every sink has queued, waiting at most timeout seconds in all'''
+    deadline = time.monotonic() + timeout
+    for sink in list(log_sinks):
+        sink.listener.stop(max(deadline - time.monotonic(), 0))
+
+
+# the sinks whose queues are delivered at exit.  Kept across importlib.reload
+# so records queued before a reload are still delivered
+if "log_sinks" not in globals():
+    log_sinks = weakref.WeakSet()
+    # registered after logging's own exit handler, so it runs first
+    atexit.register(stop_log_sinks, LOG_DRAIN_SECONDS)
+
+
+# by name, so sinks made by the module before a reload count too
+def is_queued_log_sink(handler):
+    return type(handler).__name__ == "QueuedLogSink"
+
+
+def wait_for_log_delivery(sinks, timeout=LOG_DRAIN_SECONDS):
+    for sink in sinks:
+        if is_queued_log_sink(sink):
+            sink.wait_until_delivered(timeout)
+
+
 def PopOneOrBadRequest(queue):
     try:
         item1 = queue.popleft()
@@ -259,55 +670,1271 @@ def PopTwoOrBadRequest(queue):
     return item1,item2
 
 
-def handle_request(part_queue, query_dict, verb):
+# error codes that mean "slow down" rather than "this call is wrong"
+THROTTLING_ERROR_CODES = {
+    "TooManyRequestsException",
+    "ThrottlingException",
+    "Throttling",
+    "ThrottledException",
+    "RequestLimitExceeded",
+}
+
+def is_throttling_error(e):
+    return isinstance(e, ClientError) and \
+        e.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+class TokenBucket:
+    '''rate limiter for one service.  Halves its rate when the service throttles
+    and creeps back up towards the configured rate on success'''
+    def __init__(self, rate, burst=1):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.last_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate)
+        self.last_time = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    def on_throttled(self):
+        with self.lock:
+            self._refill()
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = 0
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class BulkResult:
+    '''what happened to each item of a BulkExecutor.map call'''
+    def __init__(self, description, items):
+        self.description = description
+        self.items = items
+        self.results = {}
+        self.errors = {}
+        self.throttled_count = 0
+        self.elapsed = 0.0
+
+    @property
+    def succeeded(self):
+        return len(self.errors) == 0
+
+    def summary(self):
+        return f"{self.description}: {len(self.results)} ok, {len(self.errors)} failed, " \
+            f"{self.throttled_count} throttled retries, {self.elapsed:.1f}s"
+
+
+class BulkExecutor:
+    '''runs many independent AWS calls on a bounded pool of threads.  Each
+    service gets its own adaptive TokenBucket; throttled calls are retried once
+    the bucket allows it.'''
+    def __init__(self, max_workers, service_rates, max_retries=8):
+        self.max_workers = max_workers
+        self.service_rates = service_rates
+        self.max_retries = max_retries
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, service_name):
+        with self.lock:
+            if service_name not in self.buckets:
+                rate = self.service_rates.get(service_name, self.service_rates.get("default", 5.0))
+                self.buckets[service_name] = TokenBucket(rate)
+            return self.buckets[service_name]
+
+    def map(self, service_name, description, fn, items, progress_interval=0):
+        '''call fn(item) for every item and return a BulkResult'''
+        result = BulkResult(description, items)
+        bucket = self.bucket(service_name)
+        lock = threading.Lock()
+        start_time = time.monotonic()
+
+        def run_one(item):
+            throttled_count = 0
+            for attempt in range(self.max_retries + 1):
+                check_cancelled()
+                bucket.acquire()
+                try:
+                    ret = fn(item)
+                    bucket.on_success()
+                    error = None
+                    break
+                except DeploymentCancelled:
+                    raise
+                except Exception as e:
+                    # a failure of this item, e.g. a bad parameter, not of the whole map
+                    error = e
+                    if not is_throttling_error(e) or attempt == self.max_retries:
+                        break
+                    bucket.on_throttled()
+                    throttled_count += 1
+            with lock:
+                result.throttled_count += throttled_count
+                if error is None:
+                    result.results[item] = ret
+                else:
+                    log_warn(f"{description}: {item}: {error}")
+                    result.errors[item] = error
+                done = len(result.results) + len(result.errors)
+                if progress_interval > 0 and done % progress_interval == 0:
+                    log_info(f"{description}: {done}/{len(items)} done")
+                    report_progress(f"{description}: {done}/{len(items)} done")
+
+        if len(items) > 0:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+                # carry the caller's context (e.g. the current trace span) into the workers
+                futures = [executor.submit(contextvars.copy_context().run, run_one, item) for item in items]
+                for future in futures:
+                    future.result()
+        result.elapsed = time.monotonic() - start_time
+        if result.succeeded:
+            log_info(result.summary())
+        else:
+            log_error(result.summary())
+        return result
+
+
+def parse_bulk_service_rates(service_rates_string):
+    '''"cognito-idp=20,gamelift=5" -> {"cognito-idp": 20.0, "gamelift": 5.0}.
+    Every value must be above 0'''
+    service_rates = {}
+    for entry in service_rates_string.split(","):
+        if entry.strip():
+            service_name, rate = entry.split("=")
+            rate = float(rate)
+            if not rate > 0:
+                raise ValueError(f"{service_name.strip()}={rate}: must be above 0")
+            service_rates[service_name.strip()] = rate
+    return service_rates
+
+
+# buckets are shared by every AwsBackend talking to the same account and
+# region, since that is the scope AWS throttles at
+bulk_executors = {}
+bulk_executors_lock = threading.Lock()
+
+def get_bulk_executor(backend_config):
+    key = (backend_config["profile_name"], backend_config["region_name"],
+        backend_config["bulk_max_concurrency"], backend_config["bulk_service_rates"])
+    with bulk_executors_lock:
+        if key not in bulk_executors:
+            bulk_executors[key] = BulkExecutor(
+                backend_config["bulk_max_concurrency"],
+                parse_bulk_service_rates(backend_config["bulk_service_rates"]))
+        return bulk_executors[key]
+
+
+class AwsCallStats:
+    '''accounting for every AWS call made through the clients of one AwsBackend.
+    Filled in by botocore before-call/after-call hooks'''
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.calls = []
+        self.registrations = []
+        self.lock = threading.Lock()
+
+    def register(self, client):
+        service_name = client.meta.service_model.service_name
+        for event_name, handler in [
+                ('before-call', self._before_call),
+                ('after-call', lambda **kwargs: self._after_call(service_name, **kwargs)),
+                ('after-call-error', lambda **kwargs: self._after_call_error(service_name, **kwargs))]:
+            client.meta.events.register(event_name, handler)
+            self.registrations.append((client.meta.events, event_name, handler))
+
+    # stop counting the calls of clients that outlive their AwsBackend (see sharing_aws_clients)
+    def unregister_all(self):
+        for events, event_name, handler in self.registrations:
+            events.unregister(event_name, handler)
+        self.registrations = []
+
+    def _before_call(self, params, context, **kwargs):
+        # every AWS call of a cancelled job stops it
+        check_cancelled()
+        body = params.get('body', b'')
+        if isinstance(body, dict):
+            body = urllib.parse.urlencode(body)
+        context['aws_call_start_time'] = time.perf_counter()
+        context['aws_call_request_bytes'] = len(body)
+
+    def _record(self, service_name, operation_name, context, retries, response_bytes, error_code):
+        start_time = context.get('aws_call_start_time', time.perf_counter())
+        call = {
+            "Service": service_name,
+            "Operation": operation_name,
+            "Latency": time.perf_counter() - start_time,
+            "Retries": retries,
+            "Request Bytes": context.get('aws_call_request_bytes', 0),
+            "Response Bytes": response_bytes,
+            "Error": error_code,
+        }
+        with self.lock:
+            self.calls.append(call)
+        tracer.record(
+            "aws_call", f"{service_name}.{operation_name}",
+            time.time() - call["Latency"], call["Latency"],
+            "error" if error_code else "ok",
+            retries=retries,
+            request_bytes=call["Request Bytes"],
+            response_bytes=response_bytes,
+            error=error_code)
+        log_debug(f'{service_name}.{operation_name} {call["Latency"]*1000:.0f}ms retries {retries}')
+
+    def _after_call(self, service_name, http_response, parsed, model, context, **kwargs):
+        error_code = parsed.get("Error", {}).get("Code")
+        self._record(
+            service_name, model.name, context,
+            parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0),
+            # content-length rather than .content, which would consume streaming bodies
+            int(http_response.headers.get('content-length', 0)),
+            error_code)
+
+    def _after_call_error(self, service_name, context, exception, event_name, **kwargs):
+        self._record(
+            service_name, event_name.split('.')[-1], context, 0, 0,
+            type(exception).__name__)
+
+    def summary(self, slowest_count=5):
+        with self.lock:
+            calls = list(self.calls)
+        per_service = {}
+        for call in calls:
+            service = per_service.setdefault(
+                call["Service"], {"Calls": 0, "Time": 0.0, "Retries": 0, "Errors": 0})
+            service["Calls"] += 1
+            service["Time"] += call["Latency"]
+            service["Retries"] += call["Retries"]
+            service["Errors"] += 1 if call["Error"] else 0
+        slowest = sorted(calls, key=lambda call: call["Latency"], reverse=True)[:slowest_count]
+        return {
+            "Calls": len(calls),
+            "Wall Time": time.perf_counter() - self.start_time,
+            "Calls Per Service": per_service,
+            "Slowest Calls": slowest,
+        }
+
+    def summary_line(self):
+        summary = self.summary(slowest_count=1)
+        line = f'{summary["Calls"]} aws calls in {summary["Wall Time"]:.1f}s'
+        if summary["Slowest Calls"]:
+            slowest = summary["Slowest Calls"][0]
+            line += f', slowest {slowest["Service"]}.{slowest["Operation"]} {slowest["Latency"]:.2f}s'
+        return line
+
+
+# the launch states a fleet goes through, in order, and rough lengths (seconds)
+# to estimate with until a launch has been recorded locally
+FLEET_LAUNCH_PHASES = ["NEW", "DOWNLOADING", "VALIDATING", "BUILDING", "ACTIVATING", "ACTIVE"]
+DEFAULT_FLEET_PHASE_SECONDS = {"NEW": 30, "DOWNLOADING": 120, "VALIDATING": 60, "BUILDING": 300, "ACTIVATING": 600}
+FLEET_LAUNCH_HISTORY_SIZE = 10
+
+# how long apply waits for a fleet it is recreating to finish deleting
+FLEET_DELETE_TIMEOUT = 30 * 60
+FLEET_DELETE_POLL_INTERVAL = 15
+
+# a rest api's lambda (non-proxy) integration only passes on the request body,
+# so the start session GET maps the ?latencies= query string into the event,
+# where the lambda looks for it
+START_SESSION_REQUEST_TEMPLATES = {
+    "application/json":
+        '{"queryStringParameters": {"latencies": "$util.escapeJavaScript($input.params(\'latencies\'))"}}'
+}
+
+def fleet_event_phase(event_code):
+    '''the launch state a fleet event starts, or None'''
+    if event_code == "FLEET_CREATED":
+        return "NEW"
+    if event_code.startswith("FLEET_STATE_"):
+        return event_code[len("FLEET_STATE_"):]
+    return None
+
+def fleet_phase_durations(phase_times):
+    '''{phase: seconds} from {phase: start time} of a finished launch'''
+    durations = {}
+    for phase, next_phase in zip(FLEET_LAUNCH_PHASES, FLEET_LAUNCH_PHASES[1:]):
+        if phase in phase_times and next_phase in phase_times:
+            durations[phase] = max(phase_times[next_phase] - phase_times[phase], 0.0)
+    return durations
+
+def estimate_fleet_remaining(phase, phase_elapsed, history):
+    '''seconds left: the median recorded length of this and every later phase,
+    less the time already spent in this one'''
+    import statistics
+    if phase not in FLEET_LAUNCH_PHASES:
+        return 0.0
+    remaining = 0.0
+    for later_phase in FLEET_LAUNCH_PHASES[FLEET_LAUNCH_PHASES.index(phase):-1]:
+        durations = [launch[later_phase] for launch in history if later_phase in launch]
+        expected = statistics.median(durations) if durations else DEFAULT_FLEET_PHASE_SECONDS[later_phase]
+        remaining += max(expected - phase_elapsed, 0.0) if later_phase == phase else expected
+    return remaining
+
+
+def parse_fleet_locations(locations_string):
+    '''"us-east-1:2:4,eu-west-1" -> {"us-east-1": (2, 4), "eu-west-1": (1, 1)}, i.e.
+    location -> (desired, max) instances.  Max defaults to desired, desired to 1'''
+    locations = {}
+    for entry in locations_string.split(","):
+        if entry.strip():
+            parts = [part.strip() for part in entry.split(":")]
+            desired = int(parts[1]) if len(parts) > 1 and parts[1] else 1
+            maximum = int(parts[2]) if len(parts) > 2 and parts[2] else desired
+            if desired < 0 or maximum < desired:
+                raise ValueError(f"fleet location {entry}: need 0 <= desired <= max")
+            locations[parts[0]] = (desired, maximum)
+    return locations
+
+
+# one lock per state file path, shared by every DeploymentStateFile of it
+# (e.g. the regions of a multi-region run).  Kept across importlib.reload
+if "state_file_locks" not in globals():
+    state_file_locks = {}
+    state_file_locks_lock = threading.Lock()
+
+def get_state_file_lock(path):
+    with state_file_locks_lock:
+        return state_file_locks.setdefault(path, threading.Lock())
+
+
+class DeploymentStateFile:
+    '''remembers the ids of the resources AwsBackend created or found, per region,
+    so later runs can verify them with one targeted describe call instead of
+    listing the whole account.  Entries are keyed by the resource name they
+    were recorded for, so renaming a resource in the settings ignores them.
+    Other instances (other regions, other requests) may write the same file:
+    each change re-reads the file and writes back only the entry it changes'''
+    def __init__(self, path, region_name):
+        self.path = path
+        self.region_name = region_name
+        self.lock = get_state_file_lock(path)
+        with self.lock:
+            self.entries = self._load()
+
+    def _load(self):
+        if self.path and os.path.isfile(self.path):
+            try:
+                with open(self.path) as state_file:
+                    return json.load(state_file)
+            except (OSError, ValueError):
+                log_warn(f"ignoring unreadable state file {self.path}")
+        return {}
+
+    def get(self, key, name):
+        with self.lock:
+            entry = self.entries.get(self.region_name, {}).get(key)
+        if entry and entry["name"] == name:
+            return entry["id"]
+        return None
+
+    def set(self, key, name, resource_id):
+        with self.lock:
+            # a removal always goes to the file, which another writer may have added the entry to
+            if resource_id is not None and self.entries.get(self.region_name, {}).get(key) == {"name": name, "id": resource_id}:
+                return
+            self._save(key, None if resource_id is None else {"name": name, "id": resource_id})
+
+    # records hold more than an id, e.g. the fleet event cursor
+    def get_record(self, key, name):
+        with self.lock:
+            entry = self.entries.get(self.region_name, {}).get(key)
+        if entry and entry["name"] == name:
+            return entry.get("fields")
+        return None
+
+    def set_record(self, key, name, fields):
+        with self.lock:
+            self._save(key, {"name": name, "fields": fields})
+
+    # set (or with entry None, remove) one entry of this region, on top of
+    # what the file holds now.  Callers hold self.lock
+    def _save(self, key, entry):
+        if self.path:
+            self.entries = self._load()
+        region_entries = self.entries.setdefault(self.region_name, {})
+        if entry is None:
+            region_entries.pop(key, None)
+        else:
+            region_entries[key] = entry
+        if not self.path:
+            return
+        # unique, so a writer in another process can't interleave with this one
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "w") as state_file:
+                json.dump(self.entries, state_file, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            log_warn(f"could not write state file {self.path}: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+
+
+# relative file names are under project_root.  "" if that doesn't exist
+def make_project_file_path(backend_config, file_name):
+    if not file_name:
+        return ""
+    path = Path(file_name)
+    if not path.is_absolute():
+        if not Path(backend_config["project_root"]).is_dir():
+            return ""
+        path = Path(backend_config["project_root"]) / path
+    return str(path)
+
+
+# trace this request (and the jobs and workers it starts) to its project's trace file
+def configure_tracer(backend_config):
+    tracer.configure(make_project_file_path(backend_config, backend_config["trace_file"]),
+        int(backend_config["trace_file_max_mb"] * 1024 * 1024))
+
+
+def make_invoke_url(backend_config, api_id):
+    return f'https://{api_id}.execute-api.{backend_config["region_name"]}.amazonaws.com/{backend_config["rest_api_stage_name"]}'
+
+
+def make_state_file_path(backend_config):
+    return make_project_file_path(backend_config, backend_config["state_file"])
+
+
+# yield the items of a paginated list call one page at a time.  Pages are only
+# requested as the caller consumes them, so a lookup that stops at its first
+# match never lists the rest of the account.
+def iter_paginated(client, operation_name, result_key, page_size=None, **kwargs):
+    paginator = client.get_paginator(operation_name)
+    if page_size:
+        kwargs["PaginationConfig"] = {"PageSize": page_size}
+    for page in paginator.paginate(**kwargs):
+        for item in page.get(result_key, []):
+            yield item
+
+
+def first_match(items, predicate):
+    for item in items:
+        if predicate(item):
+            return item
+    return None
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+#
+# server package zips.  A multi-region upload zips the package once and every
+# region uploads that one file (see run_in_regions)
+#
+
+def make_server_package_zip(package_root):
+    '''zip the package (install.bat at the root, as GameLift expects) into a
+    temporary file.  Returns (path, size)'''
+    start_time = time.perf_counter()
+    package_root = Path(package_root)
+    if not package_root.is_dir():
+        raise FileNotFoundError(f"server package root {package_root} not found")
+    import tempfile
+    import zipfile
+    file_count = 0
+    zip_file = tempfile.NamedTemporaryFile(prefix="server_package_", suffix=".zip", delete=False)
+    with zip_file, zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as package_zip:
+        for path in sorted(package_root.rglob("*")):
+            if path.is_file():
+                check_cancelled()
+                package_zip.write(path, path.relative_to(package_root).as_posix())
+                file_count += 1
+    size = os.path.getsize(zip_file.name)
+    log_info(f"zipped {file_count} files ({size / (1024 * 1024):.1f} MB) in {time.perf_counter() - start_time:.1f}s")
+    return zip_file.name, size
+
+
+# boto3 sessions and clients shared by every AwsBackend of a batch run (see
+# run_batch).  A new session loads and parses the service models again, which
+# is most of the cost of making an AwsBackend
+shared_aws_clients = contextvars.ContextVar("aws_backend_shared_clients", default=None)
+
+@contextlib.contextmanager
+def sharing_aws_clients():
+    shared = {"lock": threading.Lock(), "sessions": {}, "clients": {}}
+    token = shared_aws_clients.set(shared)
+    try:
+        yield
+    finally:
+        shared_aws_clients.reset(token)
+        for client in shared["clients"].values():
+            client.close()
+
+
+# {package root: (path, size)} shared by the uploads of one run_in_regions
+shared_package_zips = contextvars.ContextVar("aws_backend_package_zips", default=None)
+
+@contextlib.contextmanager
+def sharing_server_package_zips():
+    if shared_package_zips.get() is not None:
+        # already inside a batch that shares them
+        yield
+        return
+    shared = {"lock": threading.Lock(), "zips": {}}
+    token = shared_package_zips.set(shared)
+    try:
+        yield
+    finally:
+        shared_package_zips.reset(token)
+        for zip_path, _ in shared["zips"].values():
+            os.remove(zip_path)
+
+@contextlib.contextmanager
+def server_package_zip(package_root):
+    '''(path, size) of the package zip, made by the first upload that needs it'''
+    shared = shared_package_zips.get()
+    if shared is None:
+        zip_path, size = make_server_package_zip(package_root)
+        try:
+            yield zip_path, size
+        finally:
+            os.remove(zip_path)
+        return
+    # the other regions wait here while the first one zips
+    with shared["lock"]:
+        if package_root not in shared["zips"]:
+            shared["zips"][package_root] = make_server_package_zip(package_root)
+    yield shared["zips"][package_root]
+
+
+class UploadProgress:
+    '''s3 upload_file callback.  Turns the byte counts s3transfer reports (one
+    per chunk read) into progress events, at most max_rate a second, which the
+    job's status shows.  Only every milestone_percent goes into the log.  It
+    also stops the upload of a cancelled job.  s3transfer calls it from its own
+    threads, so the caller's context (job, log sink, region) is carried in
+    explicitly'''
+    def __init__(self, total_bytes, max_rate=2.0, milestone_percent=25, region_name=None):
+        self.total_bytes = max(total_bytes, 1)
+        self.region_name = region_name or current_region.get()
+        self.sent_bytes = 0
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.milestone_percent = max(milestone_percent, 1)
+        self.next_milestone = self.milestone_percent
+        self.last_event_time = None
+        self.start_time = time.perf_counter()
+        self.job = current_job.get()
+        self.context = contextvars.copy_context()
+        self.lock = threading.Lock()
+
+    def make_event(self, now):
+        elapsed = now - self.start_time
+        rate = self.sent_bytes / max(elapsed, 1e-6)
+        return {
+            "Bytes Done": self.sent_bytes,
+            "Total Bytes": self.total_bytes,
+            "Percent": min(self.sent_bytes * 100 // self.total_bytes, 100),
+            "Rate": rate,
+            "ETA": max(self.total_bytes - self.sent_bytes, 0) / rate if rate > 0 else None,
+            "Elapsed": elapsed,
+            "Region": self.region_name,
+        }
+
+    def __call__(self, byte_count):
+        if self.job is not None and self.job.cancel_event.is_set():
+            raise DeploymentCancelled(f"job {self.job.job_id} cancelled")
+        with self.lock:
+            self.sent_bytes += byte_count
+            now = time.perf_counter()
+            percent = self.sent_bytes * 100 // self.total_bytes
+            milestone = percent >= self.next_milestone or self.sent_bytes >= self.total_bytes
+            if not milestone and self.last_event_time is not None and now - self.last_event_time < self.min_interval:
+                return
+            self.last_event_time = now
+            if milestone:
+                self.next_milestone = (percent // self.milestone_percent + 1) * self.milestone_percent
+            event = self.make_event(now)
+            message = f'uploaded {event["Percent"]}% ({event["Rate"] / (1024 * 1024):.1f} MB/s'
+            message += f', {event["ETA"]:.0f}s left)' if event["ETA"] else ")"
+            # in order, so the job never shows an older event after a newer one
+            self.context.run(report_progress, message, event, self.region_name)
+            if milestone:
+                self.context.run(log_info, message)
+
+
+# time a create_/check_/delete_ step in the trace file.  Steps are also where
+# a background job reports progress and notices it has been cancelled
+def trace_step(method):
+    @functools.wraps(method)
+    def traced_step(self, backend_config):
+        check_cancelled()
+        job = current_job.get()
+        if job is not None:
+            job.step = method.__name__
+        with tracer.span("step", method.__name__):
+            ret = method(self, backend_config)
+        if job is not None:
+            job.steps_done.append(method.__name__)
+        return ret
+    return traced_step
+
+
+#
+# multiple regions.  region_name may be a comma separated list; every region
+# gets its own copy of the config (and so its own session, state file section
+# and bulk rate limits) and the regions run concurrently.
+#
+
+def get_region_names(backend_config):
+    return [region_name.strip() for region_name in backend_config["region_name"].split(",") if region_name.strip()]
+
+def make_region_config(backend_config, region_name):
+    region_config = dict(backend_config)
+    region_config["region_name"] = region_name
+    return region_config
+
+
+class RegionResult:
+    def __init__(self, region_name):
+        self.region_name = region_name
+        self.result = None
+        self.error = None
+        self.elapsed = 0.0
+        self.call_summary = None
+
+    @property
+    def succeeded(self):
+        return self.error is None and self.result is not False
+
+    def to_dict(self):
+        return {
+            "Result": str(self.result),
+            "Error": self.error,
+            "Elapsed": self.elapsed,
+            "Call Summary": self.call_summary,
+        }
+
+
+def run_in_regions(backend_config, fn):
+    '''call fn(region_config, region_result) for every region, concurrently, and
+    return the RegionResults in region order.  An exception fails only its own
+    region.  Uploads made by fn share one zip of the server package'''
+    region_results = [RegionResult(region_name) for region_name in get_region_names(backend_config)]
+
+    def run_one(region_result):
+        current_region.set(region_result.region_name)
+        start_time = time.perf_counter()
+        try:
+            with tracer.span("step", f"region {region_result.region_name}"):
+                fn(make_region_config(backend_config, region_result.region_name), region_result)
+        except Exception as e:
+            if not isinstance(e, DeploymentCancelled):
+                log_exception(region_result.region_name)
+            region_result.error = str(e) or type(e).__name__
+        finally:
+            region_result.elapsed = time.perf_counter() - start_time
+
+    with sharing_server_package_zips(), ThreadPoolExecutor(max_workers=len(region_results)) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, run_one, region_result)
+            for region_result in region_results]
+        for future in futures:
+            future.result()
+    return region_results
+
+
+def run_backend_method(region_config, method_name, region_result):
+    a = AwsBackend(region_config)
+    try:
+        region_result.result = getattr(a, method_name)(region_config)
+    finally:
+        region_result.call_summary = a.call_stats.summary()
+
+
+def log_region_results(region_results):
+    log_info(f'{"region":<16} {"result":<8} {"time":>9} {"calls":>6}')
+    for region_result in region_results:
+        status = "ok" if region_result.succeeded else ("error" if region_result.error else "failed")
+        calls = region_result.call_summary["Calls"] if region_result.call_summary else 0
+        log_info(f'{region_result.region_name:<16} {status:<8} {region_result.elapsed:8.1f}s {calls:>6}'
+            + (f"  {region_result.error}" if region_result.error else ""))
+
+
+def make_regions_response(region_results):
+    return {
+        "Overall Result": str(all(region_result.succeeded for region_result in region_results)),
+        "Regions": {region_result.region_name: region_result.to_dict() for region_result in region_results},
+    }
+
+
+#
+# background deployment jobs.  A /deployment request whose op is listed in
+# background_ops starts a job and returns its id straight away; the editor
+# then polls /deployment/<component>/status or /deployment/jobs/<id>.
+#
+# Cancellation is cooperative: a cancelled job stops at its next step, AWS
+# call or wait.  Whatever was already created stays, as it would if the
+# request had failed there.
+#
+
+class DeploymentCancelled(Exception):
+    pass
+
+
+# the job the current thread is working for, if any
+if "current_job" not in globals():
+    current_job = contextvars.ContextVar("aws_backend_job", default=None)
+
+def is_cancel_requested():
+    job = current_job.get()
+    return job is not None and job.cancel_event.is_set()
+
+def check_cancelled():
+    if is_cancel_requested():
+        raise DeploymentCancelled(f"job {current_job.get().job_id} cancelled")
+
+# time.sleep that a cancel cuts short
+def sleep_or_cancel(seconds):
+    job = current_job.get()
+    if job is None:
+        time.sleep(seconds)
+    elif job.cancel_event.wait(seconds):
+        raise DeploymentCancelled(f"job {job.job_id} cancelled")
+
+# event: the structured form of the message, e.g. an upload's bytes and rate.
+# A job keeps the latest event of each region, so the regions of a multi-region
+# run don't overwrite each other's
+def report_progress(message, event=None, region_name=None):
+    job = current_job.get()
+    if job is not None:
+        job.message = message
+        if event is not None:
+            job.progress[region_name or current_region.get()] = event
+
+
+class DeploymentJob:
+    def __init__(self, prefix, subresource, op):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.prefix = prefix
+        self.subresource = subresource
+        self.op = op
+        self.status = "running"     # running, cancelling, succeeded, failed, cancelled
+        self.step = None
+        self.steps_done = []
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.call_summary = None
+        self.progress = {}      # {region name: latest progress event}
+        self.region_results = None
+        self.start_time = time.time()
+        self.end_time = None
+        self.cancel_event = threading.Event()
+        self.log_lines = collections.deque(maxlen=100)
+
+    @property
+    def finished(self):
+        return self.end_time is not None
+
+    def to_dict(self):
+        end_time = self.end_time or time.time()
+        return {
+            "Job Id": self.job_id,
+            "Request": f"/deployment/{self.subresource}/{self.op}",
+            "Prefix": self.prefix,
+            "Status": self.status,
+            "Step": self.step,
+            "Steps Done": list(self.steps_done),
+            "Message": self.message,
+            "Progress": dict(self.progress) or None,
+            "Elapsed": end_time - self.start_time,
+            "Result": None if self.result is None else str(self.result),
+            "Error": self.error,
+            "Call Summary": self.call_summary,
+            "Regions": self.region_results,
+            "Log": list(self.log_lines),
+        }
+
+
+class JobLogSink(logging.Handler):
+    '''keeps a job's recent log lines for /deployment/jobs/<id> and passes each
+    record on to the sink of the request that started the job, or once that
+    request has responded, to the default handler'''
+    def __init__(self, job, parent):
+        super().__init__()
+        self.job = job
+        self.parent = parent
+        self.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s %(message)s'))
+
+    def emit(self, record):
+        self.job.log_lines.append(self.format(record))
+        parent = self.parent
+        if parent is None or getattr(parent, "request_finished", False):
+            parent = log_router.default_handler
+        route_log_record(parent, record)
+
+
+class DeploymentJobs:
+    '''background /deployment requests.  At most one job runs per prefix, since
+    jobs on the same prefix (e.g. apply all and create fleet) would create the
+    same resources and write the same state file.  Finished jobs are kept (up
+    to max_finished) for polling'''
+    def __init__(self, max_finished=50):
+        self.max_finished = max_finished
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def start(self, backend_config, subresource, op):
+        '''return (job, started).  started is False if the prefix already has a
+        job running, in which case that job is returned'''
+        with self.lock:
+            running = self._running(backend_config["prefix"])
+            if running is not None:
+                return running, False
+            job = DeploymentJob(backend_config["prefix"], subresource, op)
+            self.jobs[job.job_id] = job
+            self._forget_old_jobs()
+        thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(self._run, job, backend_config),
+            name=f"deployment-job-{job.job_id}", daemon=True)
+        thread.start()
+        return job, True
+
+    def _run(self, job, backend_config):
+        current_job.set(job)
+        current_log_sink.set(JobLogSink(job, current_log_sink.get()))
+        method_name = '_'.join([job.op, job.subresource])
+        log_info(f"job {job.job_id} started: {method_name}")
+        a = None
+        try:
+            with tracer.span("run", f"/deployment/{job.subresource}/{job.op}", prefix=job.prefix, job_id=job.job_id):
+                if len(get_region_names(backend_config)) > 1:
+                    region_results = run_in_regions(backend_config,
+                        lambda region_config, region_result: run_backend_method(region_config, method_name, region_result))
+                    log_region_results(region_results)
+                    job.region_results = {region_result.region_name: region_result.to_dict() for region_result in region_results}
+                    job.result = all(region_result.succeeded for region_result in region_results)
+                else:
+                    a = AwsBackend(backend_config)
+                    job.result = getattr(a, method_name)(backend_config)
+            if job.cancel_event.is_set():
+                job.status = "cancelled"
+            else:
+                # a step that returns False failed, as it does for a synchronous request
+                job.status = "failed" if job.result is False else "succeeded"
+        except DeploymentCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            log_exception(f"job {job.job_id}: {method_name}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            if a is not None:
+                job.call_summary = a.call_stats.summary()
+            job.step = None
+            job.end_time = time.time()
+            log_info(f"job {job.job_id} {job.status}")
+
+    def _latest(self, prefix, subresource):
+        matching = [job for job in self.jobs.values() if job.prefix == prefix and job.subresource == subresource]
+        return max(matching, key=lambda job: job.start_time, default=None)
+
+    def _running(self, prefix):
+        return next((job for job in self.jobs.values() if job.prefix == prefix and not job.finished), None)
+
+    def _forget_old_jobs(self):
+        finished = sorted((job for job in self.jobs.values() if job.finished), key=lambda job: job.start_time)
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job.job_id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def latest(self, prefix, subresource):
+        with self.lock:
+            return self._latest(prefix, subresource)
+
+    def cancel(self, job):
+        with self.lock:
+            if not job.finished:
+                job.status = "cancelling"
+                job.cancel_event.set()
+
+
+# kept across importlib.reload (the fleet bridge reloads backends) so jobs
+# started before a reload can still be polled and cancelled
+if "deployment_jobs" not in globals():
+    deployment_jobs = DeploymentJobs()
+
+
+# Overall Result is "True" or "False", like a synchronous request's, once the
+# job has finished, and "Running" until then.  Job.Status has the detail
+def make_job_response(job, overall_result=None):
+    if job is None:
+        return {"Overall Result": "No Job"}
+    if overall_result is None:
+        overall_result = str(job.status == "succeeded") if job.finished else "Running"
+    return {"Overall Result": overall_result, "Job": job.to_dict()}
+
+
+# /deployment/jobs/<id> and /deployment/jobs/<id>/cancel
+def handle_job_request(job_id, part_queue):
+    job = deployment_jobs.get(job_id)
+    if job is None:
+        return 404, {"Overall Result": f"No Job {job_id}"}
+    if len(part_queue) > 0:
+        job_op = part_queue.popleft()
+        if job_op != "cancel":
+            return 400, {"Overall Result": f"Unknown Job Request {job_op}"}
+        deployment_jobs.cancel(job)
+    return 200, make_job_response(job)
+
+
+#
+# watch: one long-lived poller per prefix reads the six components, each on
+# its own interval (faster while a build or fleet is changing state), and
+# pushes only transitions to the watchers subscribed to it.  The editor
+# long-polls /deployment/watch/<watcher id>; the command line uses
+# 'aws_backend.py watch'.
+#
+
+WATCH_COMPONENTS = ["packaged_build", "uploaded_build", "fleet", "user_pool", "lambdas", "rest_api"]
+
+# build and fleet statuses that are on their way to another one
+WATCH_CHANGING_STATUSES = {"INITIALIZED", "NEW", "DOWNLOADING", "VALIDATING", "BUILDING", "ACTIVATING", "DELETING"}
+
+def watch_status(component, state):
+    '''one word for a component's state'''
+    if state is None:
+        return "unknown"
+    if "error" in state:
+        return "error: " + state["error"]
+    if not state.get("exists"):
+        return "missing"
+    if component == "uploaded_build":
+        return state["statuses"][0]
+    if component == "fleet":
+        return state["status"]
+    return "ok"
+
+
+class WatchSubscriber:
+    def __init__(self, watcher_id):
+        self.watcher_id = watcher_id
+        self.events = collections.deque(maxlen=1000)
+        self.last_poll_time = time.monotonic()
+
+
+class DeploymentWatch:
+    '''polls one prefix's components for every watcher of it.  The thread
+    stops once no watcher has polled for a while'''
+    def __init__(self, backend_config, session=None):
+        self.backend_config = backend_config
+        self.session = session
+        self.intervals = parse_bulk_service_rates(backend_config["watch_intervals"])
+        self.subscriber_timeout = max(3 * backend_config["watch_timeout"], 60)
+        self.states = {}
+        self.subscribers = {}
+        self.condition = threading.Condition()
+        self.running = False
+
+    def interval(self, component):
+        if watch_status(component, self.states.get(component)) in WATCH_CHANGING_STATUSES:
+            return self.intervals.get("changing", 10)
+        return self.intervals.get(component, self.intervals.get("default", 120))
+
+    # callers hold deployment_watches_lock
+    def subscribe(self, watcher_id):
+        with self.condition:
+            subscriber = self.subscribers.get(watcher_id)
+            if subscriber is None:
+                subscriber = WatchSubscriber(watcher_id)
+                # a new watcher starts from what is already known
+                for component, state in self.states.items():
+                    subscriber.events.append(self._make_event(component, None, state))
+                self.subscribers[watcher_id] = subscriber
+            subscriber.last_poll_time = time.monotonic()
+        if not self.running:
+            self.running = True
+            threading.Thread(target=self._run, name=f'watch-{self.backend_config["prefix"]}', daemon=True).start()
+        return subscriber
+
+    def unsubscribe(self, watcher_id):
+        with self.condition:
+            self.subscribers.pop(watcher_id, None)
+            self.condition.notify_all()
+
+    def wait_for_events(self, subscriber, timeout):
+        '''the subscriber's transitions since its last call, waiting up to timeout for one'''
+        with self.condition:
+            # the first answer waits for the first pass over every component
+            self.condition.wait_for(lambda: not self.running or
+                (len(subscriber.events) > 0 and len(self.states) == len(WATCH_COMPONENTS)), timeout)
+            events = list(subscriber.events)
+            subscriber.events.clear()
+            subscriber.last_poll_time = time.monotonic()
+        return events
+
+    def statuses(self):
+        with self.condition:
+            return {component: watch_status(component, self.states.get(component)) for component in WATCH_COMPONENTS}
+
+    def _make_event(self, component, old_state, new_state):
+        return {
+            "Component": component,
+            "From": watch_status(component, old_state) if old_state is not None else None,
+            "To": watch_status(component, new_state),
+            "State": new_state,
+            "Time": time.time(),
+        }
+
+    def _poll(self, backend, component):
+        try:
+            state = getattr(backend, f"_read_{component}_state")(self.backend_config)
+        except Exception as e:
+            log_debug(f"watch {component}: {e}")
+            # kept as the component's state, so a reader that keeps failing
+            # (e.g. a missing permission) shows up and doesn't hold up the
+            # first answer of every wait_for_events
+            state = {"error": str(e) or type(e).__name__}
+        with self.condition:
+            old_state = self.states.get(component)
+            if state == old_state:
+                return
+            self.states[component] = state
+            event = self._make_event(component, old_state, state)
+            for subscriber in self.subscribers.values():
+                subscriber.events.append(event)
+            self.condition.notify_all()
+        log_info(f'watch: {component} {event["From"] or "-"} -> {event["To"]}')
+
+    def _has_subscribers(self):
+        now = time.monotonic()
+        with self.condition:
+            for watcher_id, subscriber in list(self.subscribers.items()):
+                if now - subscriber.last_poll_time > self.subscriber_timeout:
+                    del self.subscribers[watcher_id]
+            return len(self.subscribers) > 0
+
+    def _run(self):
+        try:
+            self._poll_until_unwatched()
+        except Exception:
+            log_exception("watch")
+            with deployment_watches_lock:
+                self.running = False
+            with self.condition:
+                self.condition.notify_all()
+
+    def _poll_until_unwatched(self):
+        backend = AwsBackend(self.backend_config, session=self.session)
+        next_poll_times = {component: 0.0 for component in WATCH_COMPONENTS}
+        while True:
+            for component in WATCH_COMPONENTS:
+                if next_poll_times[component] <= time.monotonic():
+                    self._poll(backend, component)
+                    next_poll_times[component] = time.monotonic() + self.interval(component)
+            with deployment_watches_lock:
+                if not self._has_subscribers():
+                    self.running = False
+                    with self.condition:
+                        self.condition.notify_all()
+                    return
+            with self.condition:
+                self.condition.wait(max(min(next_poll_times.values()) - time.monotonic(), 0.05))
+
+
+# one watch per account, region, prefix and settings.  Kept across importlib.reload
+if "deployment_watches" not in globals():
+    deployment_watches = {}
+    deployment_watches_lock = threading.Lock()
+
+# settings that don't change what a watch reads, so watchers differing only
+# in them share one
+WATCH_UNSHARED_SETTINGS = {"commands", "background_ops", "trace_file", "trace_file_max_mb", "batch_keep_going"}
+
+def make_watch_key(backend_config):
+    # every other setting (fleet_name, server_package_root, watch_intervals, ...)
+    # can change which resources are read or how often
+    return tuple(sorted((key, value) for key, value in backend_config.items() if key not in WATCH_UNSHARED_SETTINGS))
+
+def subscribe_to_watch(backend_config, watcher_id, session=None):
+    '''return (watch, subscriber), starting the watch's poller if needed'''
+    # a multi-region config watches its first region
+    backend_config = make_region_config(backend_config, get_region_names(backend_config)[0])
+    key = make_watch_key(backend_config)
+    with deployment_watches_lock:
+        watch = deployment_watches.get(key)
+        if watch is None:
+            watch = deployment_watches[key] = DeploymentWatch(backend_config, session)
+        return watch, watch.subscribe(watcher_id)
+
+
+# /deployment/watch/<watcher id>: the transitions since this watcher's last
+# request, waiting up to watch_timeout for one.  The first request returns
+# every component's current state.
+def handle_watch_request(watcher_id, backend_config):
+    watch, subscriber = subscribe_to_watch(backend_config, watcher_id)
+    events = watch.wait_for_events(subscriber, backend_config["watch_timeout"])
+    return 200, {"Overall Result": "True", "Transitions": events, "Statuses": watch.statuses()}
+
+
+# log_handler: where this request's log goes (and that of any job it starts).
+# By default, the handler given to logging_install_handler
+def handle_request(part_queue, query_dict, verb, log_handler=None):
+    if log_handler is None:
+        return handle_request_logged_to(log_router.default_handler, part_queue, query_dict, verb)
+    sink = QueuedLogSink(log_handler)
+    try:
+        with log_sink(sink):
+            return handle_request_logged_to(sink, part_queue, query_dict, verb)
+    finally:
+        # the bridge closes the request's socket once it has responded, so
+        # jobs it started log to the default handler from here on
+        sink.request_finished = True
+        sink.close()
+
+
+# the request's log goes out before its response.  Only the request's own
+# records are waited for and counted, even on the shared default sink
+def handle_request_logged_to(sink, part_queue, query_dict, verb):
+    request_log = RequestLogCount(sink)
+    token = current_request_log.set(request_log)
+    try:
+        status, response = _handle_request(part_queue, query_dict, verb)
+    finally:
+        current_request_log.reset(token)
+    if is_queued_log_sink(sink):
+        sink.wait_until_delivered(LOG_DRAIN_SECONDS, request_log)
+        if isinstance(response, dict) and "Overall Result" in response:
+            response = dict(response, **{"Log Pipeline": sink.stats(request_log)})
+    return status, response
+
+
+def _handle_request(part_queue, query_dict, verb):
     resource = PopOneOrBadRequest(part_queue)
+    if resource == "metadata":
+        # the same for every setting
+        return 200, fleet_metadata_json
     try: 
         default_config=make_backend_config_from_dict(query_dict)
     except:
         log_exception("handle_request")
         return 200, {"Overall Result": "Invalid Settings"}
-    if resource == "metadata":
-        return 200, fleet_metadata_json
-    elif resource == "config":
+    if resource == "config":
         return 200, default_config
     elif resource == "deployment":
         subresource,op = PopTwoOrBadRequest(part_queue)
-        a = AwsBackend(default_config)
+        if subresource == "jobs":
+            return handle_job_request(op, part_queue)
+        if subresource == "watch":
+            return handle_watch_request(op, default_config)
+        if op == "status":
+            return 200, make_job_response(deployment_jobs.latest(default_config["prefix"], subresource))
+        if op == "cancel":
+            job = deployment_jobs.latest(default_config["prefix"], subresource)
+            if job is not None:
+                deployment_jobs.cancel(job)
+            return 200, make_job_response(job)
+        configure_tracer(default_config)
+        if op in default_config["background_ops"].split(","):
+            job, started = deployment_jobs.start(default_config, subresource, op)
+            return 200, make_job_response(job, "Started" if started else "Already Running")
         method_name = '_'.join([op, subresource])  # make something like 'check_uploaded_build'
-        try: 
-            result = getattr(a, method_name)(default_config)
-        except:
-            print(f"exception calling method {method_name}")
-            raise 
+        if len(get_region_names(default_config)) > 1:
+            with tracer.span("run", f"/deployment/{subresource}/{op}", prefix=default_config["prefix"]):
+                region_results = run_in_regions(default_config,
+                    lambda region_config, region_result: run_backend_method(region_config, method_name, region_result))
+            log_region_results(region_results)
+            time.sleep(0.5) # give websocket messages time to have been processed before closing socket
+            return 200, make_regions_response(region_results)
+        with tracer.span("run", f"/deployment/{subresource}/{op}", prefix=default_config["prefix"]):
+            a = AwsBackend(default_config)
+            try: 
+                result = getattr(a, method_name)(default_config)
+            except:
+                print(f"exception calling method {method_name}")
+                raise 
         time.sleep(0.5) # give websocket messages time to have been processed before closing socket
-        return 200, {"Overall Result": str(result)}
+        return 200, {"Overall Result": str(result), "Call Summary": a.call_stats.summary()}
     else:
         raise BadResource
 
 
 class AwsBackend:
-    def __init__(self, backend_config):
-        try:
-            self.session = boto3.Session(
+    # session: an already configured boto3.Session-like object to make the clients
+    # from, e.g. a local fake account.  By default one is made from the profile.
+    def __init__(self, backend_config, session=None):
+        load_aws_sdk()
+        self.bulk_executor = get_bulk_executor(backend_config)
+        self.call_stats = AwsCallStats()
+        self.state = DeploymentStateFile(make_state_file_path(backend_config), backend_config["region_name"])
+        self.prefix = backend_config["prefix"]
+        self.backend_config = backend_config
+        self.tag_discovery_done = False
+        self.session = session
+        self.shared = shared_aws_clients.get() if session is None else None
+        if self.session is None:
+            try:
+                self.session = self._make_session(backend_config)
+            except ProfileNotFound:
+                log_error(f'AWSProfile {backend_config["profile_name"]} could not be found.  Check your Game Lift Starter Plugin settings')
+                return
+            except: 
+                log_exception("boto3.Session")
+
+        with tracer.span("step", "create_clients"):
+            try:
+                self.iam_client = self._make_client('iam')
+                self.gamelift_client = self._make_client('gamelift')
+                self.cognitoidp_client = self._make_client('cognito-idp')
+                self.lambda_client = self._make_client('lambda')
+                self.apigateway_client = self._make_client('apigateway')
+                self.apigatewayv2_client = self._make_client('apigatewayv2')
+                self.sts_client = self._make_client('sts')
+                self.tagging_client = self._make_client('resourcegroupstaggingapi')
+                self.cloudformation_client = self._make_client('cloudformation')
+            except:
+                log_exception("")
+
+    def _make_session(self, backend_config):
+        if self.shared is None:
+            return boto3.Session(
                 profile_name=backend_config["profile_name"],
                 region_name=backend_config["region_name"])
-        except ProfileNotFound:
-            log_error(f'AWSProfile {backend_config["profile_name"]} could not be found.  Check your Game Lift Starter Plugin settings')
-            return
-        except: 
-            log_exception("boto3.Session")
-
-        try:
-            self.iam_client = self.session.client('iam')
-            self.gamelift_client = self.session.client('gamelift')
-            self.cognitoidp_client = self.session.client('cognito-idp')
-            self.lambda_client = self.session.client('lambda')
-            self.apigateway_client = self.session.client('apigateway')
-            self.sts_client = self.session.client('sts')
-        except:
-            log_exception("")
+        key = (backend_config["profile_name"], backend_config["region_name"])
+        with self.shared["lock"]:
+            if key not in self.shared["sessions"]:
+                self.shared["sessions"][key] = boto3.Session(
+                    profile_name=backend_config["profile_name"],
+                    region_name=backend_config["region_name"])
+            return self.shared["sessions"][key]
+
+    def _make_client(self, service_name):
+        if self.shared is None:
+            client = self.session.client(service_name)
+        else:
+            key = (self.backend_config["profile_name"], self.backend_config["region_name"], service_name)
+            with self.shared["lock"]:
+                if key not in self.shared["clients"]:
+                    self.shared["clients"][key] = self.session.client(service_name)
+                client = self.shared["clients"][key]
+        self.call_stats.register(client)
+        return client
 
     def __del__(self):
+        if getattr(self, "shared", None) is not None:
+            # the clients belong to the batch; only stop counting their calls
+            self.call_stats.unregister_all()
+            return
         #close services to avoid unclosed SSL warning logs
         # ref: https://github.com/boto/boto3/issues/454#issuecomment-1150557124
         try:
@@ -316,13 +1943,90 @@ class AwsBackend:
             self.cognitoidp_client.close()
             self.lambda_client.close()
             self.apigateway_client.close()
+            self.apigatewayv2_client.close()
             self.sts_client.close()
+            self.tagging_client.close()
+            self.cloudformation_client.close()
         except:
             pass
 
     def log_missing_dependency(self, msg):
         log_info(" Missing: " + msg)
 
+    def _stack_tags(self):
+        return {STACK_TAG_KEY: self.prefix}
+
+    def _stack_tag_list(self):
+        return [{"Key": key, "Value": value} for key, value in self._stack_tags().items()]
+
+    def discover_tagged_stack(self):
+        '''{state key: [ids]} for every resource tagged with this prefix, from one
+        paginated resource groups tagging api query.  IAM roles, app clients and
+        domains can't be found this way'''
+        found = {}
+        paginator = self.tagging_client.get_paginator('get_resources')
+        for page in paginator.paginate(TagFilters=[{"Key": STACK_TAG_KEY, "Values": [self.prefix]}]):
+            for mapping in page["ResourceTagMappingList"]:
+                for pattern, key in stack_arn_patterns:
+                    match = pattern.match(mapping["ResourceARN"])
+                    if match:
+                        found.setdefault(key, []).append(match.group(1))
+                        break
+        return found
+
+    # seed the state file from the tagged stack, once per AwsBackend.  Only
+    # unambiguous entries are recorded; the state lookups verify them anyway.
+    def _seed_state_from_tags(self, backend_config):
+        if self.tag_discovery_done:
+            return
+        self.tag_discovery_done = True
+        try:
+            found = self.discover_tagged_stack()
+        except ClientError as e:
+            log_debug(f"tag discovery unavailable, falling back to listing: {e}")
+            return
+        log_debug(f"tagged stack {found}")
+        names = {
+            "build_id": backend_config["server_package_name"],
+            "fleet_id": backend_config["fleet_name"],
+            "user_pool_id": backend_config["user_pool_name"],
+            "rest_api_id": backend_config["rest_api_name"],
+            "http_api_id": backend_config["rest_api_name"],
+        }
+        for key, name in names.items():
+            ids = found.get(key, [])
+            if len(ids) == 1 and self.state.get(key, name) is None:
+                self.state.set(key, name, ids[0])
+
+    @trace_step
+    def discover_all(self, backend_config):
+        '''log the tagged resources of this prefix'''
+        log_info("discover_all()")
+        found = self.discover_tagged_stack()
+        for key in ["build_id", "fleet_id", "user_pool_id", "lambda_function", "rest_api_id", "http_api_id"]:
+            log_info(f"{key:<16} {', '.join(found.get(key, [])) or '-'}")
+        return len(found) > 0
+
+    # return the id recorded in the state file if verify(id) confirms it still
+    # exists.  Otherwise seed the state file from the tagged stack and try
+    # again, then fall back to discover() and record what it finds.
+    def _lookup_with_state(self, key, name, verify, discover):
+        cached_id = self.state.get(key, name)
+        if cached_id is None and not self.tag_discovery_done:
+            self._seed_state_from_tags(self.backend_config)
+            cached_id = self.state.get(key, name)
+        if cached_id:
+            try:
+                if verify(cached_id):
+                    return cached_id
+            except ClientError as e:
+                log_debug(f"{key} {cached_id}: {e}")
+            log_debug(f"stale {key} {cached_id} in state file, rediscovering")
+        found_id = discover()
+        self.state.set(key, name, found_id)
+        return found_id
+
+    @trace_step
     def check_packaged_build(self, backend_config):
         log_info("check_packaged_build()")
 
@@ -388,15 +2092,34 @@ class AwsBackend:
         return ret
 
 
-    def _lookup_build_id(self, uploaded_server_package_name):
-        list_uploaded_builds_response = self.gamelift_client.list_builds()
-        uploaded_builds = list_uploaded_builds_response["Builds"]
-        for uploaded_build in uploaded_builds:
-            if uploaded_build["Name"] == uploaded_server_package_name:
+    def _iter_builds(self, **kwargs):
+        return iter_paginated(self.gamelift_client, 'list_builds', "Builds", page_size=100, **kwargs)
+
+    def _lookup_build_ids(self, uploaded_server_package_name):
+        return [uploaded_build["BuildId"] for uploaded_build in self._iter_builds()
+            if uploaded_build["Name"] == uploaded_server_package_name]
+
+    # the build to use, in order of preference: a READY one, then an
+    # INITIALIZED one (created, its upload not finished yet), then one of any
+    # status (e.g. FAILED, which check and plan report as needing a manual
+    # fix).  Each status is asked for in turn so gamelift filters the listing
+    # server side, stopping at the first page with a match
+    def _discover_build_id(self, uploaded_server_package_name):
+        for status in ["READY", "INITIALIZED", None]:
+            uploaded_build = first_match(self._iter_builds(**({"Status": status} if status else {})),
+                lambda build: build["Name"] == uploaded_server_package_name)
+            if uploaded_build:
                 return uploaded_build["BuildId"]
         return None
 
+    def _lookup_build_id(self, uploaded_server_package_name):
+        return self._lookup_with_state(
+            "build_id", uploaded_server_package_name,
+            lambda build_id: self.gamelift_client.describe_build(BuildId=build_id)["Build"]["Name"] == uploaded_server_package_name,
+            lambda: self._discover_build_id(uploaded_server_package_name))
+
     # return true if there is a uploaded_build with the expected name
+    @trace_step
     def check_uploaded_build(self, backend_config):
         log_info("check_uploaded_build()")
         uploaded_build_id = self._lookup_build_id(backend_config["server_package_name"])
@@ -404,85 +2127,258 @@ class AwsBackend:
             self.log_missing_dependency('uploaded_build_id')
             log_info(f'...no builds named {backend_config["server_package_name"]}')
             return False
-        else:
-            log_info(f'found remote build id {uploaded_build_id} with name {backend_config["server_package_name"]}')
-            log_info(OK_STRING)
-            return True
+        status = self.gamelift_client.describe_build(BuildId=uploaded_build_id)["Build"]["Status"]
+        if status == "FAILED":
+            log_error(f'build {uploaded_build_id} named {backend_config["server_package_name"]} FAILED.'
+                ' Delete it (delete uploaded_build) and upload again')
+            return False
+        log_info(f'found remote build id {uploaded_build_id} with name {backend_config["server_package_name"]}')
+        log_info(OK_STRING)
+        return True
 
+    @trace_step
     def create_uploaded_build(self, backend_config):
         log_info("create_uploaded_build()")
         log_info(f'uploading build from path: {backend_config["server_package_root"]}')
 
-        # TODO: the following subprocess should be replaced with a boto3 friendly mechanism
-        command_list = ["aws",
-                    "gamelift", "upload-build",
-                    "--operating-system", backend_config["server_package_os"],
-                    "--build-root", backend_config["server_package_root"],
-                    "--name", backend_config["server_package_name"],
-                    "--build-version", backend_config["server_package_version"],
-                    "--region", backend_config["region_name"],
-                    "--profile", backend_config["profile_name"],
-                    "--no-cli-pager"]
-        log_info(' '.join(command_list))
-
-        #completed_process = subprocess.run(command_list, capture_output=True)
-        last_line = None
-        si = subprocess.STARTUPINFO()
-        si.dwFlags = subprocess.SW_HIDE 
-        p = subprocess.Popen(command_list, 
-                startupinfo=si,
-                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0, text=True
-            )
-        with p.stdout:
-            for line in iter(p.stdout.readline, b''):
-                if len(line) == 0:
-                    break
-                last_line = line.rstrip()
-                log_info(last_line)
-        log_info("done")
-        
-        match = re.search(
-            "Build ID: (.*)$",
-            last_line) # line.decode('utf-8'))
-
-        if match:
-            uploaded_build_id = match.group(1)
-            uploaded_build_id = uploaded_build_id.rstrip()
-            log_info(f"successfully uploaded build ID: {uploaded_build_id}")
-        else:
-            log_error("failed")
-            log_error(completed_process.stderr.decode('utf-8'))
+        # the same zip and upload the aws cli's 'gamelift upload-build' does:
+        # create_build hands out short lived credentials for an s3 location
+        # that GameLift reads the zip from
+        with server_package_zip(backend_config["server_package_root"]) as (zip_path, zip_size):
+            create_build_resp = self.gamelift_client.create_build(
+                Name=backend_config["server_package_name"],
+                Version=backend_config["server_package_version"],
+                OperatingSystem=backend_config["server_package_os"],
+                Tags=self._stack_tag_list())
+            uploaded_build_id = create_build_resp["Build"]["BuildId"]
+            credentials = create_build_resp["UploadCredentials"]
+            location = create_build_resp["StorageLocation"]
+            log_info(f'created build {uploaded_build_id}, uploading {zip_size / (1024 * 1024):.1f} MB')
+            s3_client = self.session.client('s3',
+                region_name=backend_config["region_name"],
+                aws_access_key_id=credentials["AccessKeyId"],
+                aws_secret_access_key=credentials["SecretAccessKey"],
+                aws_session_token=credentials["SessionToken"])
+            self.call_stats.register(s3_client)
+            try:
+                s3_client.upload_file(zip_path, location["Bucket"], location["Key"],
+                    Callback=UploadProgress(zip_size,
+                        backend_config["upload_progress_max_rate"], backend_config["upload_progress_milestone_percent"],
+                        backend_config["region_name"]))
+            except BaseException:
+                log_error(f"upload failed, deleting build {uploaded_build_id}")
+                self.gamelift_client.delete_build(BuildId=uploaded_build_id)
+                raise
+            finally:
+                s3_client.close()
+
+        log_info(f"successfully uploaded build ID: {uploaded_build_id}")
+        self.state.set("build_id", backend_config["server_package_name"], uploaded_build_id)
+        return True
 
+    @trace_step
     def delete_uploaded_build(self, backend_config):
         log_info("delete_uploaded_build()")
-        uploaded_build_id = self._lookup_build_id(backend_config["server_package_name"])
-        while uploaded_build_id:
-            log_info(f"deleting uploaded_build {uploaded_build_id}")
-            self.gamelift_client.delete_build(BuildId=uploaded_build_id)
-            uploaded_build_id = self._lookup_build_id(backend_config["server_package_name"])
-        return True
+        uploaded_build_ids = self._lookup_build_ids(backend_config["server_package_name"])
+        log_info(f"deleting uploaded_builds {uploaded_build_ids}")
+        result = self.bulk_executor.map(
+            "gamelift", "delete uploaded builds",
+            lambda uploaded_build_id: self.gamelift_client.delete_build(BuildId=uploaded_build_id),
+            uploaded_build_ids)
+        self.state.set("build_id", backend_config["server_package_name"], None)
+        return result.succeeded
         
     def browse_uploaded_build(self, backend_config):
         url = f'https://{backend_config["region_name"]}.console.aws.amazon.com/gamelift/builds'
         log_info(f"url {url}")
-        webbrowser.open(url)
+        open_in_browser(url)
         return True
 
+    # the fleets of one build, filtered server side by list_fleets(BuildId) and
+    # then described in small batches
+    def _iter_build_fleet_attributes(self, build_id):
+        fleet_ids = list(iter_paginated(self.gamelift_client, 'list_fleets', "FleetIds", BuildId=build_id))
+        for fleet_id_batch in chunks(fleet_ids, 10):
+            response = self.gamelift_client.describe_fleet_attributes(FleetIds=fleet_id_batch)
+            for fleet in response["FleetAttributes"]:
+                yield fleet
+
+    # look among the fleets of the recorded build first.  If there is none, or the
+    # fleet was created from an older build, page through every fleet until the
+    # name turns up.
+    def _discover_fleet_id(self, fleet_name):
+        is_named = lambda fleet: fleet["Name"] == fleet_name
+        build_id = self.state.get("build_id", self.backend_config["server_package_name"])
+        fleet = None
+        if build_id:
+            fleet = first_match(self._iter_build_fleet_attributes(build_id), is_named)
+        if fleet is None:
+            fleet = first_match(iter_paginated(self.gamelift_client,
+                'describe_fleet_attributes', "FleetAttributes", page_size=50), is_named)
+        return fleet["FleetId"] if fleet else None
+
+    def _verify_fleet_id(self, fleet_id, fleet_name):
+        response = self.gamelift_client.describe_fleet_attributes(FleetIds=[fleet_id])
+        return any(fleet["Name"] == fleet_name for fleet in response["FleetAttributes"])
+
     def _lookup_fleet_id(self, fleet_name):
-        response = self.gamelift_client.describe_fleet_attributes() # No FleetID -> return all fleets
-        fleet_attributes = response["FleetAttributes"]
-        for fleet in fleet_attributes:
-            if fleet["Name"] == fleet_name:
-                fleet_id = fleet["FleetId"]
-                return fleet_id
-        return None
+        return self._lookup_with_state(
+            "fleet_id", fleet_name,
+            lambda fleet_id: self._verify_fleet_id(fleet_id, fleet_name),
+            lambda: self._discover_fleet_id(fleet_name))
 
     def _lookup_fleet_status(self, fleet_id):
         response = self.gamelift_client.describe_fleet_attributes(FleetIds=[fleet_id]) # No FleetID -> return all fleets
         fleet_attributes = response["FleetAttributes"][0]
-        log_info(fleet_attributes)
+        log_debug(fleet_attributes)
         return fleet_attributes["Status"]
 
+    # {location: {"status", "desired", "max", "active"}} for the home region and
+    # every remote location of the fleet
+    def _describe_fleet_locations(self, fleet_id):
+        location_attributes = []
+        request = {"FleetId": fleet_id}
+        while True:
+            # boto3 has no paginator for this one
+            response = self.gamelift_client.describe_fleet_location_attributes(**request)
+            location_attributes += response["LocationAttributes"]
+            if not response.get("NextToken"):
+                break
+            request["NextToken"] = response["NextToken"]
+
+        locations = {}
+        for attributes in location_attributes:
+            location = attributes["LocationState"]["Location"]
+            capacity = self.gamelift_client.describe_fleet_location_capacity(
+                FleetId=fleet_id, Location=location)["FleetCapacity"]["InstanceCounts"]
+            locations[location] = {
+                "status": attributes["LocationState"]["Status"],
+                "desired": capacity.get("DESIRED", 0),
+                "max": capacity.get("MAXIMUM", 0),
+                "active": capacity.get("ACTIVE", 0),
+            }
+        return locations
+
+    # add the configured locations the fleet lacks and set the capacity of
+    # every configured location.  Capacity can only be set once a location is
+    # ACTIVE; returns the locations still waiting for that
+    def _update_fleet_locations(self, backend_config, fleet_id, locations=None):
+        configured = parse_fleet_locations(backend_config["fleet_locations"])
+        if locations is None:
+            locations = self._describe_fleet_locations(fleet_id)
+        missing = [location for location in configured if location not in locations]
+        if missing:
+            log_info(f'adding fleet locations {", ".join(missing)}')
+            self.gamelift_client.create_fleet_locations(
+                FleetId=fleet_id, Locations=[{"Location": location} for location in missing])
+        pending = list(missing)
+        for location, (desired, maximum) in configured.items():
+            current = locations.get(location)
+            if current is None:
+                continue
+            if current["status"] != "ACTIVE":
+                pending.append(location)
+            elif (current["desired"], current["max"]) != (desired, maximum):
+                log_info(f"setting {location} capacity to {desired} desired, {maximum} max")
+                self.gamelift_client.update_fleet_capacity(
+                    FleetId=fleet_id, DesiredInstances=desired, MinSize=0, MaxSize=maximum, Location=location)
+        return pending
+
+    # return the fleet's events since the last call, oldest first.  The cursor
+    # (NextToken while there are more pages, else the time of the newest event
+    # seen) and the launch phases seen so far are kept in the state file, so
+    # each poll is one describe_fleet_events call for only the new events.
+    def _tail_fleet_events(self, fleet_id):
+        cursor = self.state.get_record("fleet_event_cursor", fleet_id) or \
+            {"next_token": None, "start_time": None, "seen_ids": [], "phase_times": {}, "recorded": False}
+        request = {"FleetId": fleet_id, "Limit": 50}
+        if cursor["next_token"]:
+            request["NextToken"] = cursor["next_token"]
+        elif cursor["start_time"] is not None:
+            request["StartTime"] = datetime.datetime.fromtimestamp(cursor["start_time"], datetime.timezone.utc)
+        try:
+            response = self.gamelift_client.describe_fleet_events(**request)
+        except ClientError as e:
+            if not cursor["next_token"]:
+                raise
+            # an expired token; start again from the newest event seen
+            log_debug(f"dropping fleet event cursor: {e}")
+            request.pop("NextToken")
+            if cursor["start_time"] is not None:
+                request["StartTime"] = datetime.datetime.fromtimestamp(cursor["start_time"], datetime.timezone.utc)
+            response = self.gamelift_client.describe_fleet_events(**request)
+
+        # StartTime is inclusive, so the newest events seen last time come back
+        seen_ids = set(cursor["seen_ids"])
+        events = sorted((event for event in response.get("Events", []) if event["EventId"] not in seen_ids),
+            key=lambda event: event["EventTime"])
+        for event in events:
+            phase = fleet_event_phase(event["EventCode"])
+            if phase is not None:
+                cursor["phase_times"].setdefault(phase, event["EventTime"].timestamp())
+        if events:
+            newest_time = events[-1]["EventTime"].timestamp()
+            if newest_time != cursor["start_time"]:
+                seen_ids = set()
+            cursor["start_time"] = newest_time
+            seen_ids.update(event["EventId"] for event in events if event["EventTime"].timestamp() == newest_time)
+            cursor["seen_ids"] = sorted(seen_ids)
+        cursor["next_token"] = response.get("NextToken")
+        self.state.set_record("fleet_event_cursor", fleet_id, cursor)
+        return events, cursor
+
+    # phase lengths of finished launches, newest last
+    def _fleet_launch_history(self):
+        return self.state.get_record("fleet_launch_history", "launches") or []
+
+    def _record_fleet_launch(self, fleet_id, cursor):
+        durations = fleet_phase_durations(cursor["phase_times"])
+        if cursor["recorded"] or not durations:
+            return
+        history = (self._fleet_launch_history() + [durations])[-FLEET_LAUNCH_HISTORY_SIZE:]
+        self.state.set_record("fleet_launch_history", "launches", history)
+        cursor["recorded"] = True
+        self.state.set_record("fleet_event_cursor", fleet_id, cursor)
+        log_info(f"recorded launch phase times: {durations}")
+
+    # log only the fleet's new events and estimate how much of the launch is
+    # left.  Cheap enough to poll every few seconds while the fleet launches.
+    @trace_step
+    def progress_fleet(self, backend_config):
+        log_info("progress_fleet()")
+        fleet_id = self.state.get("fleet_id", backend_config["fleet_name"]) or \
+            self._lookup_fleet_id(backend_config["fleet_name"])
+        if fleet_id is None:
+            log_info(f"fleet {backend_config['fleet_name']} not found")
+            return False
+
+        events, cursor = self._tail_fleet_events(fleet_id)
+        for event in events:
+            log_info(f'{event["EventTime"]:%H:%M:%S} {event["EventCode"]}: {event.get("Message", "")}')
+        phase_times = cursor["phase_times"]
+        if not phase_times:
+            log_info("no launch events yet")
+            return False
+        phase = max(phase_times, key=phase_times.get)
+        if phase == "ACTIVE":
+            self._record_fleet_launch(fleet_id, cursor)
+            pending = self._update_fleet_locations(backend_config, fleet_id)
+            if pending:
+                report_progress(f'waiting for locations {", ".join(pending)}')
+                log_info(f'fleet is ACTIVE, waiting for locations {", ".join(pending)}')
+                return False
+            log_info(OK_STRING)
+            return True
+        if phase == "ERROR":
+            log_error("fleet launch failed, see the events above")
+            return False
+        remaining = estimate_fleet_remaining(phase, time.time() - phase_times[phase], self._fleet_launch_history())
+        remaining_text = f"{remaining/60:.0f} min" if remaining >= 120 else f"{remaining:.0f}s"
+        report_progress(f"{phase}, about {remaining_text} left")
+        log_info(f"fleet is {phase}, about {remaining_text} left")
+        return False
+
+    @trace_step
     def check_fleet(self, backend_config):
         log_info("check_fleet()")
         fleet_id = self._lookup_fleet_id(backend_config["fleet_name"])
@@ -503,8 +2399,28 @@ class AwsBackend:
             else:
                 log_info(f"fleet not ready: fleet status is {status}")
                 ret = False
+
+        if ret == True:
+            log_info("checking fleet locations")
+            configured = parse_fleet_locations(backend_config["fleet_locations"])
+            locations = self._describe_fleet_locations(fleet_id)
+            for location, current in locations.items():
+                log_info(f'{location}: {current["status"]}, {current["active"]} of {current["desired"]} instances active'
+                    f' (max {current["max"]})')
+                if current["status"] != "ACTIVE":
+                    ret = False
+                elif location in configured and configured[location] != (current["desired"], current["max"]):
+                    log_info(f"  configured capacity is {configured[location][0]} desired, {configured[location][1]} max"
+                        " (apply or progress fleet updates it)")
+            for location in configured:
+                if location not in locations:
+                    log_info(f"fleet not ready: fleet has no location {location}")
+                    ret = False
+            if ret:
+                log_info(OK_STRING)
         return ret
 
+    @trace_step
     def create_fleet(self, backend_config):
         log_info("create_fleet()")
         uploaded_build_id = self._lookup_build_id(backend_config["server_package_name"])
@@ -515,25 +2431,38 @@ class AwsBackend:
         if uploaded_build_id:
             describe_build_resp = self.gamelift_client.describe_build(BuildId=uploaded_build_id)
             while describe_build_resp["Build"]["Status"] != "READY":
+                if describe_build_resp["Build"]["Status"] == "FAILED":
+                    log_error(f"uploaded build {uploaded_build_id} FAILED.  Delete it (delete uploaded_build) and upload again")
+                    return False
                 log_info("waiting for uploaded build to be ready\n")
-                time.sleep(1)
+                sleep_or_cancel(1)
                 describe_build_resp = self.gamelift_client.describe_build(
                     BuildId=uploaded_build_id)
 
             try:
+                remote_locations = [{"Location": location}
+                    for location in parse_fleet_locations(backend_config["fleet_locations"])
+                    if location != backend_config["region_name"]]
+                if remote_locations:
+                    log_info(f'with remote locations {", ".join(location["Location"] for location in remote_locations)}')
                 create_fleet_resp = self.gamelift_client.create_fleet(
+                    **({"Locations": remote_locations} if remote_locations else {}),
                     Name=backend_config["fleet_name"],
                     BuildId=uploaded_build_id,
                     ServerLaunchPath=backend_config["fleet_launch_path"],
                     ServerLaunchParameters="-WithGameLift",
                     EC2InstanceType=backend_config["fleet_ec2_instance_type"],
                     FleetType="ON_DEMAND",
+                    Tags=self._stack_tag_list(),
                     EC2InboundPermissions=[
                     {
                         'FromPort': 7777,
                         'ToPort': 7777,
                         'Protocol': 'UDP',
                         'IpRange': '0.0.0.0/0'}])
+                self.state.set("fleet_id", backend_config["fleet_name"], create_fleet_resp["FleetAttributes"]["FleetId"])
+                if backend_config["fleet_locations"]:
+                    log_info("location capacity is set once the fleet is ACTIVE (progress fleet or apply)")
             except self.gamelift_client.exceptions.LimitExceededException as e:
                 ret = False
                 log_error(e)
@@ -545,6 +2474,7 @@ class AwsBackend:
 
         return ret
 
+    @trace_step
     def delete_fleet(self, backend_config):
         log_info("delete_fleet()")
         fleet_id = self._lookup_fleet_id(backend_config["fleet_name"])
@@ -553,6 +2483,7 @@ class AwsBackend:
             try:
                 log_info(f"deleting fleet {fleet_id}")
                 self.gamelift_client.delete_fleet(FleetId=fleet_id)
+                self.state.set("fleet_id", backend_config["fleet_name"], None)
             except ClientError as e:
                 ret = False
                 log_exception(e)
@@ -565,16 +2496,20 @@ class AwsBackend:
         log_info("browse_fleet()")
         url = f'https://{backend_config["region_name"]}.console.aws.amazon.com/gamelift/fleets'
         log_info(f"url {url}")
-        webbrowser.open(url)
+        open_in_browser(url)
         return True
 
+    def _discover_user_pool_id(self, pool_name):
+        pool = first_match(
+            iter_paginated(self.cognitoidp_client, 'list_user_pools', "UserPools", page_size=60),
+            lambda pool: pool["Name"] == pool_name)
+        return pool["Id"] if pool else None
+
     def _lookup_user_pool_id(self, pool_name):
-        response = self.cognitoidp_client.list_user_pools(MaxResults=60)
-        for pool in response["UserPools"]:
-            if pool["Name"] == pool_name:
-                pool_id = pool["Id"]
-                return pool_id
-        return None
+        return self._lookup_with_state(
+            "user_pool_id", pool_name,
+            lambda pool_id: self.cognitoidp_client.describe_user_pool(UserPoolId=pool_id)["UserPool"]["Name"] == pool_name,
+            lambda: self._discover_user_pool_id(pool_name))
 
     def _lookup_user_pool_arn(self,pool_name):
         pool_id = self._lookup_user_pool_id(pool_name)
@@ -582,18 +2517,24 @@ class AwsBackend:
         arn = response["UserPool"]["Arn"]
         return arn
 
+    def _discover_user_pool_client_id(self, pool_id, client_name):
+        client = first_match(
+            iter_paginated(self.cognitoidp_client, 'list_user_pool_clients', "UserPoolClients",
+                page_size=60, UserPoolId=pool_id),
+            lambda client: client["ClientName"] == client_name)
+        return client["ClientId"] if client else None
+
     def _lookup_user_pool_client_id(self, pool_name, client_name):
         pool_id = self._lookup_user_pool_id(pool_name)
         if pool_id:
-            response = self.cognitoidp_client.list_user_pool_clients(
-                UserPoolId=pool_id,
-                MaxResults=60)
-            for client in response["UserPoolClients"]:
-                if client["ClientName"] == client_name:
-                    client_id = client["ClientId"]
-                    return client_id
+            return self._lookup_with_state(
+                "user_pool_client_id", client_name,
+                lambda client_id: self.cognitoidp_client.describe_user_pool_client(
+                    UserPoolId=pool_id, ClientId=client_id)["UserPoolClient"]["ClientName"] == client_name,
+                lambda: self._discover_user_pool_client_id(pool_id, client_name))
         return None
 
+    @trace_step
     def check_user_pool(self, backend_config):
         log_info("check_user_pool()")
         ret = True
@@ -606,6 +2547,7 @@ class AwsBackend:
             log_info(OK_STRING)
         return ret
 
+    @trace_step
     def create_user_pool(self, backend_config):
         log_info("create_user_pool()")
 
@@ -615,114 +2557,247 @@ class AwsBackend:
 
         create_user_pool_resp = self.cognitoidp_client.create_user_pool(
             PoolName=backend_config["user_pool_name"],
-            Policies={
-                "PasswordPolicy": {
-                    "MinimumLength": 6,
-                    "RequireUppercase": False,
-                    "RequireLowercase": False,
-                    "RequireNumbers": False,
-                    "RequireSymbols": False
-                }
-            },
-            Schema=[{"Name": "email",
-                 "AttributeDataType": "String",
-                 "DeveloperOnlyAttribute": False,
-                 "Mutable": True,
-                 "Required": True,
-                 "StringAttributeConstraints": {
-                     "MinLength": "0",
-                     "MaxLength": "2048"
-                 }}]
+            UserPoolTags=self._stack_tags(),
+            Policies=user_pool_policies,
+            Schema=user_pool_schema
         )
         user_pool_id = create_user_pool_resp["UserPool"]["Id"]
+        self.state.set("user_pool_id", backend_config["user_pool_name"], user_pool_id)
+
+        client_id = self._create_user_pool_client(backend_config, user_pool_id)
+
+        update_user_pool_resp = self.cognitoidp_client.update_user_pool(
+            UserPoolId=user_pool_id,
+            AutoVerifiedAttributes=["email"])
+        log_debug(f"update_user_pool_resp {update_user_pool_resp}")
+
+        self._create_user_pool_domain(backend_config, user_pool_id)
+
+        self._print_hosted_ui_url(backend_config, client_id)
 
+        return self._create_test_users(backend_config, user_pool_id)
+
+    def _create_user_pool_client(self, backend_config, user_pool_id):
         log_info("creating cognito app client")
-        # ref: https://youtu.be/EfIuC5-wdeo?t=137
-        # uncheck generate client secret
-        # just using ALLOW_USER_PASSWORD_AUTH.  API also wants: "ALLOW_REFRESH_TOKEN_AUTH"
-        #
-        # ref https://youtu.be/EfIuC5-wdeo?t=172
-        # Enabled Identity Providers: Cognito User Pools
-        # Callback and Signout URLs: Use AWS home page
-        # implicit grant,
-        # email and openid OAuth scopes
-        redirect_uri = "https://aws.amazon.com"
         create_user_pool_client_resp = self.cognitoidp_client.create_user_pool_client(
             UserPoolId=user_pool_id,
+            **self._make_user_pool_client_settings(backend_config))
+        log_debug(f"create_user_pool_client_resp {create_user_pool_client_resp}")
+        client_id = create_user_pool_client_resp["UserPoolClient"]["ClientId"]
+        self.state.set("user_pool_client_id", backend_config["user_pool_login_client_name"], client_id)
+        return client_id
+
+    def _create_user_pool_domain(self, backend_config, user_pool_id):
+        log_info("creating cognito user pool domain")
+        # go to App client settings, setup the callback URLs and hosted UI
+        subdomain = backend_config["user_pool_subdomain_prefix"]
+        create_user_pool_domain_resp = self.cognitoidp_client.create_user_pool_domain(
+            Domain=subdomain,
+            UserPoolId=user_pool_id)
+        log_debug(f"create_user_pool_domain_resp {create_user_pool_domain_resp}")
+
+    # add the app client and/or domain an existing pool is missing.  Unlike a
+    # recreate, this keeps the pool's users
+    def _update_user_pool(self, backend_config):
+        user_pool_state = self._read_user_pool_state(backend_config)
+        if not user_pool_state["exists"]:
+            log_error(f'no user pool named {backend_config["user_pool_name"]}')
+            return False
+        client_id = user_pool_state["app_client_id"]
+        if client_id is None:
+            client_id = self._create_user_pool_client(backend_config, user_pool_state["pool_id"])
+        if user_pool_state["domain"] is None:
+            self._create_user_pool_domain(backend_config, user_pool_state["pool_id"])
+        self._print_hosted_ui_url(backend_config, client_id)
+        return True
+
+    # ref: https://youtu.be/EfIuC5-wdeo?t=137
+    # uncheck generate client secret
+    # just using ALLOW_USER_PASSWORD_AUTH.  API also wants: "ALLOW_REFRESH_TOKEN_AUTH"
+    #
+    # ref https://youtu.be/EfIuC5-wdeo?t=172
+    # Enabled Identity Providers: Cognito User Pools
+    # Callback and Signout URLs: Use AWS home page
+    # implicit grant,
+    # email and openid OAuth scopes
+    def _make_user_pool_client_settings(self, backend_config):
+        return dict(
             ClientName=backend_config["user_pool_login_client_name"],
             GenerateSecret=False,
             ExplicitAuthFlows=[
                 "ALLOW_USER_PASSWORD_AUTH",
                 "ALLOW_REFRESH_TOKEN_AUTH"],
             SupportedIdentityProviders=["COGNITO"],
-            CallbackURLs=[redirect_uri],
-            LogoutURLs=[redirect_uri],
+            CallbackURLs=[user_pool_redirect_uri],
+            LogoutURLs=[user_pool_redirect_uri],
             AllowedOAuthFlows=["implicit"],
             AllowedOAuthFlowsUserPoolClient=True,
             AllowedOAuthScopes=[
                 "email",
                 "openid"],
         )
-        log_debug(f"create_user_pool_client_resp {create_user_pool_client_resp}")
-
-        update_user_pool_resp = self.cognitoidp_client.update_user_pool(
-            UserPoolId=user_pool_id,
-            AutoVerifiedAttributes=["email"])
-        log_debug(f"update_user_pool_resp {update_user_pool_resp}")
-
-        log_info("creating cognito user pool domain")
-        # go to App client settings, setup the callback URLs and hosted UI
-        subdomain = backend_config["user_pool_subdomain_prefix"]
-        create_user_pool_resp = self.cognitoidp_client.create_user_pool_domain(
-            Domain=subdomain,
-            UserPoolId=user_pool_id)
 
+    def _print_hosted_ui_url(self, backend_config, client_id):
         log_info("users can create new accounts using the ui at:")
+        subdomain = backend_config["user_pool_subdomain_prefix"]
         login_url = f'https://{subdomain}.auth.{backend_config["region_name"]}.amazoncognito.com/'
         login_url = login_url + \
-            f'login?client_id={create_user_pool_client_resp["UserPoolClient"]["ClientId"]}'
+            f'login?client_id={client_id}'
         login_url = login_url + \
-            f'&response_type=Token&scope=email+openid&redirect_uri={redirect_uri}'
+            f'&response_type=Token&scope=email+openid&redirect_uri={user_pool_redirect_uri}'
         log_info(login_url)
 
-        log_info("creating test users")
-        for index in range(32):
-            user_name = 'user' + str(index)
-            self.cognitoidp_client.admin_create_user(
-                UserPoolId=user_pool_id,
-                Username=user_name,
-                UserAttributes=[
-                    {"Name": "email", "Value": "test@test.com"}
-                ],
-                TemporaryPassword="test12",
-                MessageAction='SUPPRESS'
-            )
+    def _make_test_user_names(self, backend_config):
+        pattern = backend_config["user_pool_test_user_name_pattern"]
+        return [pattern.format(index=index) for index in range(backend_config["user_pool_test_user_count"])]
+
+    # small counts are created directly (rate limited and concurrent).  large
+    # counts go through a cognito user import job, which only leaves the
+    # passwords to be set.
+    def _create_test_users(self, backend_config, user_pool_id):
+        user_names = self._make_test_user_names(backend_config)
+        if len(user_names) == 0:
+            return True
+        log_info(f"creating {len(user_names)} test users")
+        if len(user_names) >= backend_config["user_pool_test_user_import_threshold"]:
+            if not self._import_test_users(backend_config, user_pool_id, user_names):
+                return False
+            create_user = False
+        else:
+            create_user = True
+
+        def create_test_user(user_name):
+            if create_user:
+                self.cognitoidp_client.admin_create_user(
+                    UserPoolId=user_pool_id,
+                    Username=user_name,
+                    UserAttributes=[
+                        {"Name": "email", "Value": "test@test.com"}
+                    ],
+                    TemporaryPassword=backend_config["user_pool_test_user_password"],
+                    MessageAction='SUPPRESS'
+                )
             self.cognitoidp_client.admin_set_user_password(
                 UserPoolId=user_pool_id,
                 Username=user_name,
-                Password="test12",
+                Password=backend_config["user_pool_test_user_password"],
                 Permanent=True
             )
+        result = self.bulk_executor.map(
+            "cognito-idp", "test users", create_test_user, user_names,
+            progress_interval=backend_config["user_pool_test_user_progress_interval"])
+        return result.succeeded
+
+    # ref: https://docs.aws.amazon.com/cognito/latest/developerguide/cognito-user-pools-using-import-tool.html
+    def _import_test_users(self, backend_config, user_pool_id, user_names):
+        log_info("importing test users with a user import job")
+        role_arn = self._create_lambda_role(
+            backend_config["user_pool_import_role_name"],
+            can_cognito_import_policy_json,
+            backend_config["user_pool_import_other_policy_name"],
+            can_write_cognito_import_logs_json)
+
+        try:
+            header = self.cognitoidp_client.get_csv_header(UserPoolId=user_pool_id)["CSVHeader"]
+        except ClientError as e:
+            log_error(f"could not get the user import csv header: {e}")
+            return False
+        fixed_values = {
+            "email": "test@test.com",
+            "email_verified": "true",
+            "phone_number_verified": "false",
+            "cognito:mfa_enabled": "false",
+        }
+        csv_buffer = io.StringIO()
+        writer = csv.writer(csv_buffer, lineterminator='\n')
+        writer.writerow(header)
+        for user_name in user_names:
+            values = dict(fixed_values)
+            values["cognito:username"] = user_name
+            writer.writerow([values.get(column, "") for column in header])
+
+        # a brand new role can take a few seconds before cognito accepts it
+        job = None
+        for create_attempt in range(10):
+            try:
+                job = self.cognitoidp_client.create_user_import_job(
+                    JobName=f"{backend_config['user_pool_name']}-{uuid.uuid4().hex[:8]}",
+                    UserPoolId=user_pool_id,
+                    CloudWatchLogsRoleArn=role_arn)["UserImportJob"]
+                break
+            except ClientError as e:
+                log_warn(e)
+                log_warn(f"create import job attempt {create_attempt} failed - the role may be too new - sleeping and trying again")
+                sleep_or_cancel(3)
+        if job is None:
+            log_error("could not create user import job")
+            return False
+
+        log_info(f'uploading {len(user_names)} users for import job {job["JobId"]}')
+        import urllib.request
+        upload_request = urllib.request.Request(
+            job["PreSignedUrl"],
+            data=csv_buffer.getvalue().encode('utf-8'),
+            method='PUT',
+            headers={'x-amz-server-side-encryption': 'aws:kms'})
+        try:
+            with urllib.request.urlopen(upload_request) as upload_response:
+                log_debug(f"import csv upload status {upload_response.status}")
+        except OSError as e:
+            # urllib's HTTPError and URLError included
+            log_error(f'could not upload the users for import job {job["JobId"]}: {e}')
+            return False
+
+        try:
+            self.cognitoidp_client.start_user_import_job(UserPoolId=user_pool_id, JobId=job["JobId"])
+        except ClientError as e:
+            log_error(f'could not start import job {job["JobId"]}: {e}')
+            return False
+        last_imported = -1
+        while job["Status"] not in ("Succeeded", "Failed", "Stopped", "Expired"):
+            sleep_or_cancel(2)
+            try:
+                job = self.cognitoidp_client.describe_user_import_job(
+                    UserPoolId=user_pool_id, JobId=job["JobId"])["UserImportJob"]
+            except ClientError as e:
+                log_error(f'could not check import job {job["JobId"]}: {e}')
+                return False
+            imported = job.get("ImportedUsers", 0)
+            if imported != last_imported:
+                log_info(f'import job {job["Status"]}: {imported}/{len(user_names)} imported, {job.get("FailedUsers", 0)} failed')
+                last_imported = imported
+
+        if job["Status"] != "Succeeded":
+            log_error(f'import job {job["JobId"]} {job["Status"]}: {job.get("CompletionMessage", "")}')
+            return False
+        return True
+
+    @trace_step
+    def delete_user_pool(self, backend_config):
+        log_info('delete_user_pool()')
+        pool_id = self._lookup_user_pool_id(backend_config["user_pool_name"])
+        if pool_id:
+            response = self.cognitoidp_client.describe_user_pool(UserPoolId=pool_id)
+            if "Domain" in response["UserPool"]:
+                pool_domain = response["UserPool"]["Domain"]
+                log_info(f"deleting user_pool domain {pool_domain}")
+                response = self.cognitoidp_client.delete_user_pool_domain(
+                    Domain=pool_domain, UserPoolId=pool_id)
+            response = self.cognitoidp_client.delete_user_pool(UserPoolId=pool_id)
+            self.state.set("user_pool_id", backend_config["user_pool_name"], None)
+            self.state.set("user_pool_client_id", backend_config["user_pool_login_client_name"], None)
+        if self._lookup_role_arn(backend_config["user_pool_import_role_name"]):
+            self._delete_role(
+                backend_config["user_pool_import_role_name"],
+                backend_config["user_pool_import_other_policy_name"])
+
+    def browse_user_pool(self, backend_config):
+        log_info("browse_user_pool()")
+        url = f'https://{backend_config["region_name"]}.console.aws.amazon.com/cognito/home'
+        log_info(f"url {url}")
+        open_in_browser(url)
+        return True
 
-    def delete_user_pool(self, backend_config):
-        log_info('delete_user_pool()')
-        pool_id = self._lookup_user_pool_id(backend_config["user_pool_name"])
-        if pool_id:
-            response = self.cognitoidp_client.describe_user_pool(UserPoolId=pool_id)
-            if "Domain" in response["UserPool"]:
-                pool_domain = response["UserPool"]["Domain"]
-                log_info(f"deleting user_pool domain {pool_domain}")
-                response = self.cognitoidp_client.delete_user_pool_domain(
-                    Domain=pool_domain, UserPoolId=pool_id)
-            response = self.cognitoidp_client.delete_user_pool(UserPoolId=pool_id)
-
-    def browse_user_pool(self, backend_config):
-        log_info("browse_user_pool()")
-        url = f'https://{backend_config["region_name"]}.console.aws.amazon.com/cognito/home'
-        log_info(f"url {url}")
-        webbrowser.open(url)
-        return True
-
     def _lookup_lambda_function_arn(self, lambda_name):
         try:
             get_function_resp = self.lambda_client.get_function(
@@ -757,7 +2832,8 @@ class AwsBackend:
             log_debug('role does not exist: creating')
             response = self.iam_client.create_role(
                 RoleName=role_name,
-                AssumeRolePolicyDocument=json.dumps(assume_role_policy))
+                AssumeRolePolicyDocument=json.dumps(assume_role_policy),
+                Tags=self._stack_tag_list())
             role_arn = response["Role"]["Arn"]
             log_debug(response)
 
@@ -768,26 +2844,39 @@ class AwsBackend:
 
         return role_arn
 
-    def _create_lambda_function_from_file(
-        self,
-        function_name,
-        role_arn,
-        filename,
-        replace_old=None,
-        replace_new=None):
-
+    def _read_lambda_source(self, filename, replace_old=None, replace_new=None):
         with open(filename, 'r') as inputfile:
             filedata = inputfile.read()
 
         # apply string substitutions 
         if replace_old:
             filedata = filedata.replace(replace_old, replace_new)
+        return filedata
+
+    # the zip is built with a fixed timestamp so the same source always gives
+    # the same bytes.  That lets plan compare it against the deployed CodeSha256.
+    def _make_lambda_zip(self, filename, replace_old=None, replace_new=None):
+        import zipfile
+        filedata = self._read_lambda_source(filename, replace_old, replace_new)
 
         # to upload, need it to be in zip format
         zip_buffer = io.BytesIO()
         with zipfile.ZipFile(zip_buffer, 'a', zipfile.ZIP_DEFLATED, False) as tempzip:
-            tempzip.writestr('handler.py', filedata)
-        zipped_code = zip_buffer.getvalue()
+            zip_info = zipfile.ZipInfo('handler.py', date_time=(1980, 1, 1, 0, 0, 0))
+            zip_info.compress_type = zipfile.ZIP_DEFLATED
+            zip_info.external_attr = 0o644 << 16
+            tempzip.writestr(zip_info, filedata)
+        return zip_buffer.getvalue()
+
+    def _create_lambda_function_from_file(
+        self,
+        function_name,
+        role_arn,
+        filename,
+        replace_old=None,
+        replace_new=None):
+
+        zipped_code = self._make_lambda_zip(filename, replace_old, replace_new)
 
         log_info(f"creating {function_name} lambda")
         success = False
@@ -800,7 +2889,8 @@ class AwsBackend:
                     PackageType="Zip",
                     Role=role_arn,
                     Code=dict(ZipFile=zipped_code),
-                    Handler="handler.lambda_handler"
+                    Handler="handler.lambda_handler",
+                    Tags=self._stack_tags()
                 )
                 success = True
                 log_debug(f"create_function_response {create_function_response}")
@@ -808,7 +2898,7 @@ class AwsBackend:
             except ClientError as e:
                 log_warn(e)
                 log_warn(f"create attempt {create_attempt} failed - sometimes InvalidParameterException is returned if the role is too new - sleeping and trying again")
-                time.sleep(3)
+                sleep_or_cancel(3)
         if success:
             log_info(f"success after {create_attempt+1} attempts")
 
@@ -849,6 +2939,7 @@ class AwsBackend:
         return lambda_path
 
 
+    @trace_step
     def check_lambdas(self, backend_config):
         log_info("check_lambdas()")
         script_path = self._get_script_path()
@@ -873,6 +2964,7 @@ class AwsBackend:
 
 
     # create the login and startsession lambdas
+    @trace_step
     def create_lambdas(self, backend_config):
         log_info("create_lambdas()")
         # need the client id to string-replace in the login function 
@@ -891,30 +2983,76 @@ class AwsBackend:
         else:
             log_debug("got fleet_id" + fleet_id)
 
-        self._create_lambda_roles_and_function(
-            backend_config["lambda_login_role_name"],
-            backend_config["lambda_login_other_policy_name"],
-            can_cognito_json,
-            backend_config["lambda_login_function_name"],
-            self._make_lambda_local_path("GameLiftUnreal-CognitoLogin.py"),
-            "USER_POOL_APP_CLIENT_ID = ''",
-            "USER_POOL_APP_CLIENT_ID = \"" + cognito_app_client_id + "\"")
-        
-        self._create_lambda_roles_and_function(
-            backend_config["lambda_start_session_role_name"],
-            backend_config["lambda_start_session_other_policy_name"],
-            can_gamelift_session_control_policy_json,
-            backend_config["lambda_start_session_function_name"],
-            self._make_lambda_local_path("GameLiftUnreal-StartGameLiftSession.py"),
-            'GAMELIFT_FLEET_ID = ""',
-            "GAMELIFT_FLEET_ID = \"" + fleet_id + "\"")
+        for lambda_spec in self._make_lambda_specs(backend_config, cognito_app_client_id, fleet_id):
+            self._create_lambda_roles_and_function(*lambda_spec)
+
+        return True
+
+    # (role_name, other_policy_name, other_policy_json, function_name, filename,
+    #  replace_old, replace_new) for the login and start session lambdas
+    def _make_lambda_specs(self, backend_config, cognito_app_client_id, fleet_id):
+        return [
+            (backend_config["lambda_login_role_name"],
+                backend_config["lambda_login_other_policy_name"],
+                can_cognito_json,
+                backend_config["lambda_login_function_name"],
+                self._make_lambda_local_path("GameLiftUnreal-CognitoLogin.py"),
+                "USER_POOL_APP_CLIENT_ID = ''",
+                "USER_POOL_APP_CLIENT_ID = \"" + cognito_app_client_id + "\""),
+            (backend_config["lambda_start_session_role_name"],
+                backend_config["lambda_start_session_other_policy_name"],
+                can_gamelift_session_control_policy_json,
+                backend_config["lambda_start_session_function_name"],
+                self._make_lambda_local_path("GameLiftUnreal-StartGameLiftSession.py"),
+                'GAMELIFT_FLEET_ID = ""',
+                "GAMELIFT_FLEET_ID = \"" + fleet_id + "\""),
+        ]
 
+    # [(role_name, policy_name, policy_json)] of the lambdas' inline role policies
+    def _make_lambda_role_policies(self, backend_config):
+        return [(role_name, other_policy_name, other_policy_json)
+            for role_name, other_policy_name, other_policy_json, *rest in self._make_lambda_specs(backend_config, "", "")]
+
+    # the CodeSha256 lambda reports for each function if it was deployed from
+    # the current sources with the current ids substituted in
+    def _make_expected_lambda_code_sha256(self, backend_config, cognito_app_client_id, fleet_id):
+        expected = {}
+        for role_name, other_policy_name, other_policy_json, function_name, filename, replace_old, replace_new in \
+                self._make_lambda_specs(backend_config, cognito_app_client_id, fleet_id):
+            zipped_code = self._make_lambda_zip(filename, replace_old, replace_new)
+            expected[function_name] = base64.b64encode(hashlib.sha256(zipped_code).digest()).decode('ascii')
+        return expected
+
+    # re-upload the code of both lambdas, e.g. after the fleet was recreated.
+    # Their role policies are put again too, since new code may need new permissions
+    def _update_lambdas_code(self, backend_config):
+        cognito_app_client_id = self._lookup_user_pool_client_id(
+            backend_config["user_pool_name"],
+            backend_config["user_pool_login_client_name"])
+        fleet_id = self._lookup_fleet_id(backend_config["fleet_name"])
+        if cognito_app_client_id is None or fleet_id is None:
+            log_info("app client or fleet is not setup - check your cognito and fleet status")
+            return False
+        for role_name, other_policy_name, other_policy_json, function_name, filename, replace_old, replace_new in \
+                self._make_lambda_specs(backend_config, cognito_app_client_id, fleet_id):
+            log_info(f"updating {function_name} role policy and lambda code")
+            self.iam_client.put_role_policy(
+                RoleName=role_name,
+                PolicyName=other_policy_name,
+                PolicyDocument=json.dumps(other_policy_json))
+            self.lambda_client.update_function_code(
+                FunctionName=function_name,
+                ZipFile=self._make_lambda_zip(filename, replace_old, replace_new),
+                Publish=True)
         return True
 
     def _delete_lambda(self, function_name, policy_name, role_name):
         function_arn = self._lookup_lambda_function_arn(function_name)
         if function_arn: 
             self.lambda_client.delete_function(FunctionName=function_name)
+        self._delete_role(role_name, policy_name)
+
+    def _delete_role(self, role_name, policy_name):
         try:
             response = self.iam_client.delete_role_policy(RoleName=role_name, PolicyName=policy_name)
         except ClientError as e:
@@ -926,6 +3064,7 @@ class AwsBackend:
             self.iam_client.delete_role(RoleName=role_name)
 
 
+    @trace_step
     def delete_lambdas(self, backend_config):
         log_info("delete_lambdas()")
         self._delete_lambda(
@@ -942,7 +3081,7 @@ class AwsBackend:
         log_info("browse_lambdas()")
         url = f'https://{backend_config["region_name"]}.console.aws.amazon.com/lambda/home'
         log_info(f"url {url}")
-        webbrowser.open(url)
+        open_in_browser(url)
         return True
 
     # create the resource for the API gateway and bind it to the corresponding lambda
@@ -951,7 +3090,7 @@ class AwsBackend:
         rest_api_id,
         apigateway_client, path_part, http_method,
         account_id, lambda_function_arn,
-        authorizer_id):
+        authorizer_id, request_templates=None):
 
         # get Root ID
         try:
@@ -993,9 +3132,7 @@ class AwsBackend:
             raise
 
         # bind the method to the lambda
-        lambda_uri = \
-            f'arn:aws:apigateway:{self.apigateway_client.meta.region_name}:' \
-            f'lambda:path/2015-03-31/functions/{lambda_function_arn}/invocations'
+        lambda_uri = self._make_lambda_integration_uri(lambda_function_arn)
         log_debug(lambda_uri)  
         try:
             # NOTE: You must specify 'POST' for integrationHttpMethod or this will
@@ -1006,7 +3143,8 @@ class AwsBackend:
                 httpMethod=http_method,
                 type='AWS',
                 integrationHttpMethod='POST',
-                uri=lambda_uri)
+                uri=lambda_uri,
+                **({"requestTemplates": request_templates} if request_templates else {}))
         except ClientError:
             log_exception(
                 "Couldn't set function %s as integration destination.",
@@ -1070,23 +3208,33 @@ class AwsBackend:
             'GET',
             account_id,
             lambda_arn,
-            authorizer_id)
+            authorizer_id,
+            START_SESSION_REQUEST_TEMPLATES)
 
-    def _lookup_rest_api_id(self, rest_api_name):
-        response = self.apigateway_client.get_rest_apis()
-        rest_apis = response["items"]
-        for rest_api in rest_apis:
+    def _iter_rest_api_ids(self, rest_api_name):
+        for rest_api in iter_paginated(self.apigateway_client, 'get_rest_apis', "items", page_size=500):
             if rest_api_name == rest_api["name"]:
-                rest_api_id = rest_api["id"]
-                return rest_api_id
-        return None
+                yield rest_api["id"]
+
+    def _lookup_rest_api_ids(self, rest_api_name):
+        return list(self._iter_rest_api_ids(rest_api_name))
+
+    def _lookup_rest_api_id(self, rest_api_name):
+        def discover():
+            return next(self._iter_rest_api_ids(rest_api_name), None)
+        return self._lookup_with_state(
+            "rest_api_id", rest_api_name,
+            lambda rest_api_id: self.apigateway_client.get_rest_api(restApiId=rest_api_id)["name"] == rest_api_name,
+            discover)
 
     def _print_helpful_rest_info(self, backend_config, rest_api_id):
-        invoke_url = f'https://{rest_api_id}.execute-api.{backend_config["region_name"]}.amazonaws.com/{backend_config["rest_api_stage_name"]}'
+        invoke_url = make_invoke_url(backend_config, rest_api_id)
         log_info('invoke_url:')
         log_info(invoke_url)
         log_info('(for command line testing) to login try:')
-        login_curl = 'curl -X POST -d "{\\"username\\":\\"user0\\", \\"password\\":\\"test12\\"}" ' + \
+        user_name = backend_config["user_pool_test_user_name_pattern"].format(index=0)
+        password = backend_config["user_pool_test_user_password"]
+        login_curl = f'curl -X POST -d "{{\\"username\\":\\"{user_name}\\", \\"password\\":\\"{password}\\"}}" ' + \
             invoke_url + '/login'
         log_info(login_curl)
         log_info("")
@@ -1094,10 +3242,355 @@ class AwsBackend:
         start_curl = 'curl -X GET -H "Authorization: Bearer [IdToken]\" ' + \
             invoke_url + '/startsession'
         log_info(start_curl)
+        log_info("")
+        log_info('(for load testing) replay logins and session starts as the test users:')
+        log_info(f'python aws_backend_load.py --invoke_url {invoke_url} --curve ramp:10:500 --duration 60')
+
+
+    def _make_lambda_integration_uri(self, lambda_function_arn):
+        return \
+            f'arn:aws:apigateway:{self.apigateway_client.meta.region_name}:' \
+            f'lambda:path/2015-03-31/functions/{lambda_function_arn}/invocations'
+
+    # describe the same api that create_rest_api builds resource by resource as
+    # an OpenAPI 3 document, using the API Gateway extensions for the cognito
+    # authorizer and the lambda integrations.
+    #
+    # ref: https://docs.aws.amazon.com/apigateway/latest/developerguide/api-gateway-swagger-extensions.html
+    def _make_rest_api_openapi_definition(self, backend_config, cognito_arn, login_lambda_arn, start_session_lambda_arn):
+        authorizer_name = backend_config["rest_api_cognito_authorizer_name"]
+
+        def make_operation(lambda_arn, secured, request_templates=None):
+            operation = {
+                "responses": {
+                    "200": {"description": "200 response"}
+                },
+                "x-amazon-apigateway-integration": {
+                    # NOTE: lambda integrations are always invoked with POST
+                    "type": "aws",
+                    "httpMethod": "POST",
+                    "uri": self._make_lambda_integration_uri(lambda_arn),
+                    "passthroughBehavior": "when_no_match",
+                    "responses": {
+                        ".*": {"statusCode": "200"}
+                    }
+                }
+            }
+            if request_templates:
+                operation["x-amazon-apigateway-integration"]["requestTemplates"] = request_templates
+            if secured:
+                operation["security"] = [{authorizer_name: []}]
+            return operation
+
+        return {
+            "openapi": "3.0.1",
+            "info": {
+                "title": backend_config["rest_api_name"],
+                "version": backend_config["server_package_version"]
+            },
+            "paths": {
+                "/" + backend_config["rest_api_login_path_part"]: {
+                    "post": make_operation(login_lambda_arn, False)
+                },
+                "/" + backend_config["rest_api_start_session_path_part"]: {
+                    "get": make_operation(start_session_lambda_arn, True, START_SESSION_REQUEST_TEMPLATES)
+                }
+            },
+            "components": {
+                "securitySchemes": {
+                    authorizer_name: {
+                        "type": "apiKey",
+                        "name": "Authorization",
+                        "in": "header",
+                        "x-amazon-apigateway-authtype": "cognito_user_pools",
+                        "x-amazon-apigateway-authorizer": {
+                            "type": "cognito_user_pools",
+                            "providerARNs": [cognito_arn],
+                            "authorizerResultTtlInSeconds": backend_config["rest_api_authorizer_ttl"]
+                        }
+                    }
+                }
+            }
+        }
+
+    # let the api invoke the lambda.  Uses a stable statement id so that
+    # re-deploying the same api doesn't pile up duplicate permissions.
+    def _add_rest_api_invoke_permission(self, rest_api_id, account_id, path_part, lambda_function_arn):
+        source_arn = \
+            f'arn:aws:execute-api:{self.apigateway_client.meta.region_name}:' \
+            f'{account_id}:{rest_api_id}/*/*/{path_part}'
+        try:
+            self.lambda_client.add_permission(
+                FunctionName=lambda_function_arn,
+                StatementId=f'{rest_api_id}-{path_part}',
+                Action='lambda:InvokeFunction', Principal='apigateway.amazonaws.com',
+                SourceArn=source_arn)
+        except self.lambda_client.exceptions.ResourceConflictException:
+            log_debug(f"invoke permission for {path_part} already exists")
+
+    # create (or update in place) the rest api with a single import_rest_api or
+    # put_rest_api call instead of building it one resource/method at a time.
+    def _create_rest_api_from_openapi(self, backend_config):
+        cognito_arn = self._lookup_user_pool_arn(backend_config["user_pool_name"])
+        login_lambda_arn = self._lookup_lambda_function_arn(backend_config["lambda_login_function_name"])
+        start_session_lambda_arn = self._lookup_lambda_function_arn(backend_config["lambda_start_session_function_name"])
+        if login_lambda_arn is None or start_session_lambda_arn is None:
+            log_error("lambdas were not found - check your lambdas status")
+            return False
+
+        definition = self._make_rest_api_openapi_definition(
+            backend_config, cognito_arn, login_lambda_arn, start_session_lambda_arn)
+        log_debug(f"openapi definition {definition}")
+        body = json.dumps(definition).encode('utf-8')
+
+        rest_api_id = self._lookup_rest_api_id(backend_config["rest_api_name"])
+        try:
+            if rest_api_id:
+                log_info(f"updating rest api {rest_api_id} from openapi definition")
+                self.apigateway_client.put_rest_api(
+                    restApiId=rest_api_id,
+                    mode='overwrite',
+                    failOnWarnings=True,
+                    body=body)
+            else:
+                log_info("importing rest api from openapi definition")
+                response = self.apigateway_client.import_rest_api(
+                    failOnWarnings=True,
+                    body=body)
+                rest_api_id = response['id']
+                self.state.set("rest_api_id", backend_config["rest_api_name"], rest_api_id)
+                # import_rest_api can't tag, so tag afterwards
+                self.apigateway_client.tag_resource(
+                    resourceArn=f'arn:aws:apigateway:{self.apigateway_client.meta.region_name}::/restapis/{rest_api_id}',
+                    tags=self._stack_tags())
+        except ClientError:
+            log_exception(
+                f'Could not import REST API {backend_config["rest_api_name"]}.')
+            raise
+
+        account_id = self.sts_client.get_caller_identity()["Account"]
+        self._add_rest_api_invoke_permission(
+            rest_api_id, account_id, backend_config["rest_api_login_path_part"], login_lambda_arn)
+        self._add_rest_api_invoke_permission(
+            rest_api_id, account_id, backend_config["rest_api_start_session_path_part"], start_session_lambda_arn)
+
+        log_info(f'deploying to stage {backend_config["rest_api_stage_name"]}')
+        try:
+            create_deployment_resp = self.apigateway_client.create_deployment(
+                restApiId=rest_api_id,
+                stageName=backend_config["rest_api_stage_name"],
+                **self._make_rest_api_cache_cluster_args(backend_config))
+            log_debug(f"create_deployment_resp {create_deployment_resp}")
+        except ClientError:
+            log_exception("Couldn't deploy REST API %s.", rest_api_id)
+            raise
+        self._apply_rest_api_stage_settings(backend_config, rest_api_id)
+
+        self._print_helpful_rest_info(backend_config, rest_api_id)
+        return True
 
+    def _make_rest_api_cache_cluster_args(self, backend_config):
+        cache_cluster_size = backend_config["rest_api_cache_cluster_size"]
+        if cache_cluster_size:
+            return dict(cacheClusterEnabled=True, cacheClusterSize=cache_cluster_size)
+        return dict(cacheClusterEnabled=False)
 
+    # throttling (and optionally caching) for every method on the stage.
+    # '/*/*' applies the limits to each method separately.  GET /startsession
+    # is never cached: a cached response would hand every caller the same
+    # session.  In a method path, '/' in the resource path is written '~1'.
+    #
+    # ref: https://docs.aws.amazon.com/apigateway/latest/api/API_MethodSetting.html
+    def _apply_rest_api_stage_settings(self, backend_config, rest_api_id):
+        patch_operations = [
+            {"op": "replace", "path": "/*/*/throttling/rateLimit",
+                "value": str(backend_config["rest_api_throttle_rate_limit"])},
+            {"op": "replace", "path": "/*/*/throttling/burstLimit",
+                "value": str(backend_config["rest_api_throttle_burst_limit"])},
+        ]
+        caching_enabled = bool(backend_config["rest_api_cache_cluster_size"])
+        patch_operations.append(
+            {"op": "replace", "path": "/*/*/caching/enabled", "value": str(caching_enabled).lower()})
+        if caching_enabled:
+            patch_operations.append(
+                {"op": "replace", "path": "/*/*/caching/ttlInSeconds",
+                    "value": str(backend_config["rest_api_cache_ttl"])})
+            start_session_path = "~1" + backend_config["rest_api_start_session_path_part"]
+            patch_operations.append(
+                {"op": "replace", "path": f"/{start_session_path}/GET/caching/enabled", "value": "false"})
+
+        log_info(f'applying stage settings to {backend_config["rest_api_stage_name"]}')
+        try:
+            update_stage_resp = self.apigateway_client.update_stage(
+                restApiId=rest_api_id,
+                stageName=backend_config["rest_api_stage_name"],
+                patchOperations=patch_operations)
+            log_debug(f"update_stage_resp {update_stage_resp}")
+        except ClientError:
+            log_exception("Couldn't update stage settings for REST API %s.", rest_api_id)
+            raise
+
+    # log what is actually deployed, which may differ from backend_config if
+    # the api was created with older settings
+    def _print_rest_api_settings(self, backend_config, rest_api_id):
+        response = self.apigateway_client.get_authorizers(restApiId=rest_api_id)
+        for authorizer in response["items"]:
+            ttl = authorizer.get("authorizerResultTtlInSeconds", 300)
+            log_info(f'authorizer {authorizer["name"]}: result ttl {ttl}s')
+
+        try:
+            stage = self.apigateway_client.get_stage(
+                restApiId=rest_api_id,
+                stageName=backend_config["rest_api_stage_name"])
+        except ClientError:
+            log_info(f'stage {backend_config["rest_api_stage_name"]} not found')
+            return
+        method_settings = stage.get("methodSettings", {}).get("*/*", {})
+        log_info(f'stage {backend_config["rest_api_stage_name"]}: '
+            f'throttling rate {method_settings.get("throttlingRateLimit", "account default")}/s '
+            f'burst {method_settings.get("throttlingBurstLimit", "account default")}')
+        if stage.get("cacheClusterEnabled"):
+            log_info(f'stage cache: size {stage.get("cacheClusterSize")}GB, '
+                f'enabled {method_settings.get("cachingEnabled", False)}, '
+                f'ttl {method_settings.get("cacheTtlInSeconds", 300)}s')
+        else:
+            log_info("stage cache: disabled")
+
+    def _iter_http_api_ids(self, http_api_name):
+        for http_api in iter_paginated(self.apigatewayv2_client, 'get_apis', "Items", page_size=500):
+            if http_api_name == http_api["Name"]:
+                yield http_api["ApiId"]
+
+    def _lookup_http_api_ids(self, http_api_name):
+        return list(self._iter_http_api_ids(http_api_name))
+
+    def _lookup_http_api_id(self, http_api_name):
+        def discover():
+            return next(self._iter_http_api_ids(http_api_name), None)
+        return self._lookup_with_state(
+            "http_api_id", http_api_name,
+            lambda http_api_id: self.apigatewayv2_client.get_api(ApiId=http_api_id)["Name"] == http_api_name,
+            discover)
+
+    # bind a route such as 'POST /login' to a lambda using a proxy integration
+    def _create_http_api_route(self, http_api_id, account_id, http_method, path_part, lambda_function_arn, authorizer_id):
+        create_integration_resp = self.apigatewayv2_client.create_integration(
+            ApiId=http_api_id,
+            IntegrationType='AWS_PROXY',
+            IntegrationUri=lambda_function_arn,
+            PayloadFormatVersion='2.0')
+        log_debug(f"create_integration_resp {create_integration_resp}")
+
+        route_args = dict(
+            ApiId=http_api_id,
+            RouteKey=f'{http_method} /{path_part}',
+            Target=f'integrations/{create_integration_resp["IntegrationId"]}')
+        if authorizer_id:
+            route_args.update(AuthorizationType='JWT', AuthorizerId=authorizer_id)
+        create_route_resp = self.apigatewayv2_client.create_route(**route_args)
+        log_debug(f"create_route_resp {create_route_resp}")
+
+        self._add_rest_api_invoke_permission(http_api_id, account_id, path_part, lambda_function_arn)
+
+    # the HTTP API (API Gateway v2) equivalent of the REST api: same routes and
+    # stage name, but cognito tokens are validated by the native JWT authorizer.
+    #
+    # ref: https://docs.aws.amazon.com/apigateway/latest/developerguide/http-api-jwt-authorizer.html
+    def _create_http_api(self, backend_config):
+        if self._lookup_http_api_id(backend_config["rest_api_name"]):
+            log_info("not creating http api because it already exists")
+            return
+
+        pool_id = self._lookup_user_pool_id(backend_config["user_pool_name"])
+        app_client_id = self._lookup_user_pool_client_id(
+            backend_config["user_pool_name"],
+            backend_config["user_pool_login_client_name"])
+        if pool_id is None or app_client_id is None:
+            log_error("user pool or app client was not found - check your cognito status")
+            return False
+        login_lambda_arn = self._lookup_lambda_function_arn(backend_config["lambda_login_function_name"])
+        start_session_lambda_arn = self._lookup_lambda_function_arn(backend_config["lambda_start_session_function_name"])
+        if login_lambda_arn is None or start_session_lambda_arn is None:
+            log_error("lambdas were not found - check your lambdas status")
+            return False
+
+        try:
+            create_api_resp = self.apigatewayv2_client.create_api(
+                Name=backend_config["rest_api_name"],
+                ProtocolType='HTTP',
+                Tags=self._stack_tags())
+            http_api_id = create_api_resp["ApiId"]
+            self.state.set("http_api_id", backend_config["rest_api_name"], http_api_id)
+        except ClientError:
+            log_exception(
+                f'Could not create HTTP API {backend_config["rest_api_name"]}.')
+            raise
+
+        log_info("creating cognito jwt authorizer")
+        create_authorizer_resp = self.apigatewayv2_client.create_authorizer(
+            ApiId=http_api_id,
+            Name=backend_config["rest_api_cognito_authorizer_name"],
+            AuthorizerType='JWT',
+            IdentitySource=['$request.header.Authorization'],
+            JwtConfiguration={
+                'Audience': [app_client_id],
+                'Issuer': f'https://cognito-idp.{backend_config["region_name"]}.amazonaws.com/{pool_id}'
+            })
+        authorizer_id = create_authorizer_resp["AuthorizerId"]
+
+        account_id = self.sts_client.get_caller_identity()["Account"]
+        log_info("creating login route")
+        self._create_http_api_route(
+            http_api_id, account_id, 'POST', backend_config["rest_api_login_path_part"],
+            login_lambda_arn, None)
+        log_info("creating start session route")
+        self._create_http_api_route(
+            http_api_id, account_id, 'GET', backend_config["rest_api_start_session_path_part"],
+            start_session_lambda_arn, authorizer_id)
+
+        log_info(f'deploying to stage {backend_config["rest_api_stage_name"]}')
+        create_stage_resp = self.apigatewayv2_client.create_stage(
+            ApiId=http_api_id,
+            StageName=backend_config["rest_api_stage_name"],
+            AutoDeploy=True,
+            DefaultRouteSettings={
+                'ThrottlingRateLimit': backend_config["rest_api_throttle_rate_limit"],
+                'ThrottlingBurstLimit': backend_config["rest_api_throttle_burst_limit"]
+            })
+        log_debug(f"create_stage_resp {create_stage_resp}")
+
+        self._print_helpful_rest_info(backend_config, http_api_id)
+        return True
+
+    def _check_http_api(self, backend_config):
+        log_info(f'checking for http api: {backend_config["rest_api_name"]}')
+        http_api_id = self._lookup_http_api_id(backend_config["rest_api_name"])
+        if http_api_id is None:
+            log_info(f'not ready: {backend_config["rest_api_name"]} not found')
+            return False
+        log_info(f"found api_id {http_api_id}")
+        response = self.apigatewayv2_client.get_routes(ApiId=http_api_id)
+        for route in response["Items"]:
+            log_info(f'route {route["RouteKey"]}: authorization {route.get("AuthorizationType", "NONE")}')
+        self._print_helpful_rest_info(backend_config, http_api_id)
+        log_info(OK_STRING)
+        return True
+
+    def _delete_http_api(self, backend_config):
+        http_api_ids = self._lookup_http_api_ids(backend_config["rest_api_name"])
+        log_info(f"deleting http apis {http_api_ids}")
+        result = self.bulk_executor.map(
+            "apigatewayv2", "delete http apis",
+            lambda http_api_id: self.apigatewayv2_client.delete_api(ApiId=http_api_id),
+            http_api_ids)
+        self.state.set("http_api_id", backend_config["rest_api_name"], None)
+        return result.succeeded
+
+    @trace_step
     def check_rest_api(self, backend_config):
         log_info(f'check_rest_api()')
+        if backend_config["rest_api_type"] == "http":
+            return self._check_http_api(backend_config)
         log_info(f'checking for rest_api: {backend_config["rest_api_name"]}')
         ret= True
         api_id = self._lookup_rest_api_id(backend_config["rest_api_name"]);
@@ -1106,6 +3599,7 @@ class AwsBackend:
             ret = False
         else:
             log_info(f"found api_id {api_id}");
+            self._print_rest_api_settings(backend_config, api_id)
             self._print_helpful_rest_info(backend_config, api_id)
             log_info(OK_STRING);
         return ret
@@ -1117,8 +3611,17 @@ class AwsBackend:
     #      Amazon GameLift-UE4 Episode 6: Amazon Cognito and API Gateway
     #        * has some details on configuring lambda invocation using boto3
     #
+    # with --rest_api_deploy_mode=openapi the whole api is described up front and
+    # deployed in one call; an existing api is updated in place.
+    #
+    @trace_step
     def create_rest_api(self, backend_config):
         log_info("create_rest_api()")
+        if backend_config["rest_api_type"] == "http":
+            return self._create_http_api(backend_config)
+        if backend_config["rest_api_deploy_mode"] == "openapi":
+            return self._create_rest_api_from_openapi(backend_config)
+
         if self._lookup_rest_api_id(backend_config["rest_api_name"]):
             log_info("not creating rest api because it already exists")
             return
@@ -1126,8 +3629,10 @@ class AwsBackend:
         # create the rest API
         try:
             response = self.apigateway_client.create_rest_api(
-                name=backend_config["rest_api_name"])
+                name=backend_config["rest_api_name"],
+                tags=self._stack_tags())
             rest_api_id = response['id']
+            self.state.set("rest_api_id", backend_config["rest_api_name"], rest_api_id)
         except ClientError:
             log_exception(
                 f'Could not create REST API {backend_config["rest_api_name"]}.')
@@ -1143,7 +3648,8 @@ class AwsBackend:
             name=backend_config["rest_api_cognito_authorizer_name"],
             type='COGNITO_USER_POOLS',
             providerARNs=[cognito_arn],
-            identitySource="method.request.header.Authorization"
+            identitySource="method.request.header.Authorization",
+            authorizerResultTtlInSeconds=backend_config["rest_api_authorizer_ttl"]
         )
         authorizer_id = create_authorizer_response["id"]
 
@@ -1160,111 +3666,878 @@ class AwsBackend:
         try:
             create_deployment_resp = self.apigateway_client.create_deployment(
                 restApiId=rest_api_id,
-                stageName=backend_config["rest_api_stage_name"])
+                stageName=backend_config["rest_api_stage_name"],
+                **self._make_rest_api_cache_cluster_args(backend_config))
             log_debug(f"create_deployment_resp {create_deployment_resp}")
         except ClientError:
             log_exception("Couldn't deploy REST API %s.", rest_api_id)
             raise
+        self._apply_rest_api_stage_settings(backend_config, rest_api_id)
 
-        self._print_helpful_rest_info(self, backend_config, rest_api_id)
+        self._print_helpful_rest_info(backend_config, rest_api_id)
         
         return True
 
+    @trace_step
     def delete_rest_api(self, backend_config):
         log_info("delete_rest_api()")
-        rest_api_id = self._lookup_rest_api_id(backend_config["rest_api_name"])
-        while rest_api_id:
-            self.apigateway_client.delete_rest_api(restApiId=rest_api_id)
-            rest_api_id = self._lookup_rest_api_id(backend_config["rest_api_name"])
-        return True
+        if backend_config["rest_api_type"] == "http":
+            return self._delete_http_api(backend_config)
+        rest_api_ids = self._lookup_rest_api_ids(backend_config["rest_api_name"])
+        log_info(f"deleting rest apis {rest_api_ids}")
+        result = self.bulk_executor.map(
+            "apigateway", "delete rest apis",
+            lambda rest_api_id: self.apigateway_client.delete_rest_api(restApiId=rest_api_id),
+            rest_api_ids)
+        self.state.set("rest_api_id", backend_config["rest_api_name"], None)
+        return result.succeeded
 
 
     def browse_rest_api(self, backend_config):
         log_info("browse_rest_api()")
         url = f'https://{backend_config["region_name"]}.console.aws.amazon.com/apigateway'
         log_info(f"url {url}")
-        webbrowser.open(url)
+        open_in_browser(url)
+        return True
+
+    #
+    # cloudformation stack
+    #
+    # export_stack renders the user pool, app client, domain, lambda roles,
+    # both lambdas and the REST API into one CloudFormation template.
+    # create_stack submits it as a single stack, so CloudFormation works out the
+    # order and creates independent resources in parallel, and delete_stack
+    # tears everything down with one call.  The uploaded build and the fleet
+    # stay client driven; the fleet id is passed in as a stack parameter.
+    #
+    # The stack uses the same resource names as create user_pool/lambdas/rest_api,
+    # so deploy one way or the other, not both.
+    #
+
+    # wrap every string that holds a ${...} reference in Fn::Sub
+    def _sub_references(self, value):
+        if isinstance(value, dict):
+            return {key: self._sub_references(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._sub_references(item) for item in value]
+        if isinstance(value, str) and "${" in value:
+            return {"Fn::Sub": value}
+        return value
+
+    def _make_stack_template(self, backend_config):
+        if backend_config["rest_api_type"] == "http":
+            log_warn("the stack template always contains a REST api, ignoring --rest_api_type=http")
+        tags = self._stack_tag_list()
+        resources = {}
+
+        resources["UserPool"] = {
+            "Type": "AWS::Cognito::UserPool",
+            "Properties": {
+                "UserPoolName": backend_config["user_pool_name"],
+                "UserPoolTags": self._stack_tags(),
+                "Policies": user_pool_policies,
+                "Schema": user_pool_schema,
+                "AutoVerifiedAttributes": ["email"],
+            }
+        }
+        resources["UserPoolClient"] = {
+            "Type": "AWS::Cognito::UserPoolClient",
+            "Properties": dict(
+                UserPoolId={"Ref": "UserPool"},
+                **self._make_user_pool_client_settings(backend_config))
+        }
+        resources["UserPoolDomain"] = {
+            "Type": "AWS::Cognito::UserPoolDomain",
+            "Properties": {
+                "Domain": backend_config["user_pool_subdomain_prefix"],
+                "UserPoolId": {"Ref": "UserPool"},
+            }
+        }
+
+        # the lambda sources are inlined, with the ids substituted by Fn::Sub
+        lambda_specs = self._make_lambda_specs(backend_config, "${UserPoolClient}", "${FleetId}")
+        for logical_name, (role_name, other_policy_name, other_policy_json, function_name, filename, replace_old, replace_new) in \
+                zip(["Login", "StartSession"], lambda_specs):
+            source = self._read_lambda_source(filename, replace_old, replace_new)
+            if len(source) > 4096:
+                raise Exception(f"{filename} is too large to inline in a template (4096 characters max)")
+            resources[logical_name + "Role"] = {
+                "Type": "AWS::IAM::Role",
+                "Properties": {
+                    "RoleName": role_name,
+                    "AssumeRolePolicyDocument": can_execute_lambda_policy_json,
+                    "Policies": [{"PolicyName": other_policy_name, "PolicyDocument": other_policy_json}],
+                    "Tags": tags,
+                }
+            }
+            resources[logical_name + "Function"] = {
+                "Type": "AWS::Lambda::Function",
+                "Properties": {
+                    "FunctionName": function_name,
+                    "Runtime": "python3.9",
+                    # inline code is always saved as index.py
+                    "Handler": "index.lambda_handler",
+                    "Role": {"Fn::GetAtt": [logical_name + "Role", "Arn"]},
+                    "Code": {"ZipFile": {"Fn::Sub": source}},
+                    "Tags": tags,
+                }
+            }
+
+        definition = self._sub_references(self._make_rest_api_openapi_definition(
+            backend_config, "${UserPool.Arn}", "${LoginFunction.Arn}", "${StartSessionFunction.Arn}"))
+        resources["RestApi"] = {
+            "Type": "AWS::ApiGateway::RestApi",
+            "Properties": {
+                "Name": backend_config["rest_api_name"],
+                "Body": definition,
+                "FailOnWarnings": True,
+                "Tags": tags,
+            }
+        }
+        for logical_name, path_part in [
+                ("Login", backend_config["rest_api_login_path_part"]),
+                ("StartSession", backend_config["rest_api_start_session_path_part"])]:
+            resources[logical_name + "InvokePermission"] = {
+                "Type": "AWS::Lambda::Permission",
+                "Properties": {
+                    "FunctionName": {"Fn::GetAtt": [logical_name + "Function", "Arn"]},
+                    "Action": "lambda:InvokeFunction",
+                    "Principal": "apigateway.amazonaws.com",
+                    "SourceArn": {"Fn::Sub": "arn:aws:execute-api:${AWS::Region}:${AWS::AccountId}:${RestApi}/*/*/" + path_part},
+                }
+            }
+
+        # a deployment is only made when its logical id is new, so name it
+        # after the api definition to redeploy whenever the definition changes
+        definition_hash = hashlib.sha256(json.dumps(definition, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+        deployment_name = "RestApiDeployment" + definition_hash
+        resources[deployment_name] = {
+            "Type": "AWS::ApiGateway::Deployment",
+            "Properties": {"RestApiId": {"Ref": "RestApi"}}
+        }
+        caching_enabled = bool(backend_config["rest_api_cache_cluster_size"])
+        method_settings = {
+            "ResourcePath": "/*",
+            "HttpMethod": "*",
+            "ThrottlingRateLimit": backend_config["rest_api_throttle_rate_limit"],
+            "ThrottlingBurstLimit": backend_config["rest_api_throttle_burst_limit"],
+            "CachingEnabled": caching_enabled,
+        }
+        stage_properties = {
+            "RestApiId": {"Ref": "RestApi"},
+            "DeploymentId": {"Ref": deployment_name},
+            "StageName": backend_config["rest_api_stage_name"],
+            "CacheClusterEnabled": caching_enabled,
+            "MethodSettings": [method_settings],
+            "Tags": tags,
+        }
+        if caching_enabled:
+            stage_properties["CacheClusterSize"] = backend_config["rest_api_cache_cluster_size"]
+            method_settings["CacheTtlInSeconds"] = backend_config["rest_api_cache_ttl"]
+            # see _apply_rest_api_stage_settings: startsession is never cached
+            stage_properties["MethodSettings"].append({
+                "ResourcePath": "/~1" + backend_config["rest_api_start_session_path_part"],
+                "HttpMethod": "GET",
+                "CachingEnabled": False,
+            })
+        resources["RestApiStage"] = {"Type": "AWS::ApiGateway::Stage", "Properties": stage_properties}
+
+        return {
+            "AWSTemplateFormatVersion": "2010-09-09",
+            "Description": f'GameLift Starter login and session backend for prefix {backend_config["prefix"]}',
+            "Parameters": {
+                "FleetId": {
+                    "Type": "String",
+                    "Description": "GameLift fleet the start session lambda places players on",
+                }
+            },
+            "Resources": resources,
+            "Outputs": {
+                "UserPoolId": {"Value": {"Ref": "UserPool"}},
+                "UserPoolClientId": {"Value": {"Ref": "UserPoolClient"}},
+                "RestApiId": {"Value": {"Ref": "RestApi"}},
+                "InvokeUrl": {"Value": {"Fn::Sub":
+                    "https://${RestApi}.execute-api.${AWS::Region}.amazonaws.com/" + backend_config["rest_api_stage_name"]}},
+            }
+        }
+
+    @trace_step
+    def export_stack(self, backend_config):
+        log_info("export_stack()")
+        template = self._make_stack_template(backend_config)
+        path = make_project_file_path(backend_config, backend_config["stack_template_file"]) or \
+            backend_config["stack_template_file"]
+        with open(path, "w") as template_file:
+            json.dump(template, template_file, indent=2)
+        log_info(f'wrote {len(template["Resources"])} resources to {path}')
+        return True
+
+    def _describe_stack(self, stack_name):
+        try:
+            return self.cloudformation_client.describe_stacks(StackName=stack_name)["Stacks"][0]
+        except ClientError as e:
+            if "does not exist" in str(e):
+                return None
+            raise
+
+    def _stack_event_ids(self, stack_name):
+        try:
+            response = self.cloudformation_client.describe_stack_events(StackName=stack_name)
+        except ClientError:
+            return set()
+        return {event["EventId"] for event in response["StackEvents"]}
+
+    # poll until the stack is no longer *_IN_PROGRESS, logging each new stack
+    # event as it happens.  Returns the final stack, or None once it is deleted.
+    def _wait_for_stack(self, stack_name, seen_event_ids):
+        while True:
+            stack = self._describe_stack(stack_name)
+            if stack is None:
+                return None
+            response = self.cloudformation_client.describe_stack_events(StackName=stack["StackId"])
+            for event in reversed(response["StackEvents"]):
+                if event["EventId"] in seen_event_ids:
+                    continue
+                seen_event_ids.add(event["EventId"])
+                log_info(f'{event["LogicalResourceId"]:<32} {event["ResourceStatus"]} {event.get("ResourceStatusReason", "")}')
+            if not stack["StackStatus"].endswith("_IN_PROGRESS"):
+                return stack
+            sleep_or_cancel(5)
+
+    def _record_stack_outputs(self, backend_config, stack):
+        outputs = {output["OutputKey"]: output["OutputValue"] for output in stack.get("Outputs", [])}
+        self.state.set("user_pool_id", backend_config["user_pool_name"], outputs.get("UserPoolId"))
+        self.state.set("user_pool_client_id", backend_config["user_pool_login_client_name"], outputs.get("UserPoolClientId"))
+        self.state.set("rest_api_id", backend_config["rest_api_name"], outputs.get("RestApiId"))
+        return outputs
+
+    @trace_step
+    def check_stack(self, backend_config):
+        log_info("check_stack()")
+        stack = self._describe_stack(backend_config["stack_name"])
+        if stack is None:
+            log_info(f'not ready: stack {backend_config["stack_name"]} not found')
+            return False
+        log_info(f'stack {backend_config["stack_name"]}: {stack["StackStatus"]}')
+        for output in stack.get("Outputs", []):
+            log_info(f'{output["OutputKey"]}: {output["OutputValue"]}')
+        if stack["StackStatus"] in ["CREATE_COMPLETE", "UPDATE_COMPLETE"]:
+            log_info(OK_STRING)
+            return True
+        return False
+
+    # create the stack, or update it in place if it already exists
+    @trace_step
+    def create_stack(self, backend_config):
+        log_info("create_stack()")
+        stack_name = backend_config["stack_name"]
+        fleet_id = self._lookup_fleet_id(backend_config["fleet_name"])
+        if fleet_id is None:
+            log_info("fleet id was not found - check your fleet status")
+            return False
+
+        template_body = json.dumps(self._make_stack_template(backend_config))
+        log_debug(f"template is {len(template_body)} bytes")
+        stack_args = dict(
+            StackName=stack_name,
+            TemplateBody=template_body,
+            Parameters=[{"ParameterKey": "FleetId", "ParameterValue": fleet_id}],
+            Capabilities=["CAPABILITY_NAMED_IAM"],
+            Tags=self._stack_tag_list())
+
+        existing_stack = self._describe_stack(stack_name)
+        seen_event_ids = self._stack_event_ids(stack_name) if existing_stack else set()
+        if existing_stack is None:
+            log_info(f"creating stack {stack_name}")
+            self.cloudformation_client.create_stack(**stack_args)
+            expected_status = "CREATE_COMPLETE"
+        else:
+            log_info(f"updating stack {stack_name}")
+            try:
+                self.cloudformation_client.update_stack(**stack_args)
+            except ClientError as e:
+                if "No updates are to be performed" not in str(e):
+                    raise
+                log_info("stack is already up to date")
+                self._record_stack_outputs(backend_config, existing_stack)
+                return True
+            expected_status = "UPDATE_COMPLETE"
+
+        stack = self._wait_for_stack(stack_name, seen_event_ids)
+        if stack is None or stack["StackStatus"] != expected_status:
+            log_error(f'stack {stack_name} failed: {stack["StackStatus"] if stack else "deleted"}')
+            return False
+
+        outputs = self._record_stack_outputs(backend_config, stack)
+        test_users_created = True
+        if existing_stack is None:
+            # cloudformation can't set passwords, so test users are added afterwards
+            test_users_created = self._create_test_users(backend_config, outputs["UserPoolId"])
+        self._print_hosted_ui_url(backend_config, outputs["UserPoolClientId"])
+        self._print_helpful_rest_info(backend_config, outputs["RestApiId"])
+        return test_users_created
+
+    @trace_step
+    def delete_stack(self, backend_config):
+        log_info("delete_stack()")
+        stack_name = backend_config["stack_name"]
+        stack = self._describe_stack(stack_name)
+        if stack is None:
+            log_info(f"stack {stack_name} not found")
+            return True
+        seen_event_ids = self._stack_event_ids(stack_name)
+        log_info(f"deleting stack {stack_name}")
+        self.cloudformation_client.delete_stack(StackName=stack_name)
+        stack = self._wait_for_stack(stack_name, seen_event_ids)
+        if stack is not None and stack["StackStatus"] != "DELETE_COMPLETE":
+            log_error(f'stack {stack_name} delete failed: {stack["StackStatus"]}')
+            return False
+        self.state.set("user_pool_id", backend_config["user_pool_name"], None)
+        self.state.set("user_pool_client_id", backend_config["user_pool_login_client_name"], None)
+        self.state.set("rest_api_id", backend_config["rest_api_name"], None)
+        return True
+
+    def browse_stack(self, backend_config):
+        log_info("browse_stack()")
+        url = f'https://{backend_config["region_name"]}.console.aws.amazon.com/cloudformation/home?region={backend_config["region_name"]}#/stacks'
+        log_info(f"url {url}")
+        open_in_browser(url)
+        return True
+
+    #
+    # plan / apply
+    #
+    # read_deployment_state reads what is deployed for all six components in
+    # one concurrent pass.  _make_plan diffs that against backend_config and
+    # apply_all executes only the actions that are needed.
+    #
+
+    def _read_packaged_build_state(self, backend_config):
+        package_root = Path(backend_config["server_package_root"])
+        match = re.match("[cC]:/game/(.*)", backend_config["fleet_launch_path"])
+        exists = (package_root / 'install.bat').is_file() and \
+            match is not None and (package_root / match.group(1)).is_file()
+        return {"exists": exists}
+
+    def _read_uploaded_build_state(self, backend_config):
+        builds = [build for build in self._iter_builds() if build["Name"] == backend_config["server_package_name"]]
+        return {
+            "exists": len(builds) > 0,
+            "build_ids": [build["BuildId"] for build in builds],
+            "statuses": [build["Status"] for build in builds],
+        }
+
+    def _read_fleet_state(self, backend_config):
+        fleet_id = self._lookup_fleet_id(backend_config["fleet_name"])
+        if fleet_id is None:
+            return {"exists": False}
+        response = self.gamelift_client.describe_fleet_attributes(FleetIds=[fleet_id])
+        for fleet in response["FleetAttributes"]:
+            if fleet["Name"] == backend_config["fleet_name"]:
+                return {
+                    "exists": True,
+                    "fleet_id": fleet["FleetId"],
+                    "status": fleet["Status"],
+                    "build_id": fleet.get("BuildId"),
+                    "instance_type": fleet.get("InstanceType"),
+                    "locations": self._describe_fleet_locations(fleet["FleetId"]) if fleet["Status"] == "ACTIVE" else {},
+                }
+        return {"exists": False}
+
+    def _read_user_pool_state(self, backend_config):
+        pool_id = self._lookup_user_pool_id(backend_config["user_pool_name"])
+        if pool_id is None:
+            return {"exists": False}
+        user_pool = self.cognitoidp_client.describe_user_pool(UserPoolId=pool_id)["UserPool"]
+        app_client_id = self._discover_user_pool_client_id(pool_id, backend_config["user_pool_login_client_name"])
+        return {
+            "exists": True,
+            "pool_id": pool_id,
+            "arn": user_pool["Arn"],
+            "domain": user_pool.get("Domain"),
+            "app_client_id": app_client_id,
+        }
+
+    def _read_lambdas_state(self, backend_config):
+        functions = {}
+        for function_name in [backend_config["lambda_login_function_name"], backend_config["lambda_start_session_function_name"]]:
+            try:
+                configuration = self.lambda_client.get_function(FunctionName=function_name)["Configuration"]
+                functions[function_name] = configuration["CodeSha256"]
+            except ClientError:
+                pass
+        # roles whose inline policy isn't the one the current sources need
+        stale_policy_roles = []
+        if functions:
+            for role_name, policy_name, policy_json in self._make_lambda_role_policies(backend_config):
+                try:
+                    document = self.iam_client.get_role_policy(RoleName=role_name, PolicyName=policy_name)["PolicyDocument"]
+                except ClientError:
+                    document = None
+                if document != policy_json:
+                    stale_policy_roles.append(role_name)
+        return {"exists": len(functions) == 2, "code_sha256": functions, "stale_policy_roles": stale_policy_roles}
+
+    def _read_rest_api_state(self, backend_config):
+        if backend_config["rest_api_type"] == "http":
+            api_id = self._lookup_http_api_id(backend_config["rest_api_name"])
+            if api_id is None:
+                return {"exists": False}
+            state = {"exists": True, "api_id": api_id}
+            try:
+                stage = self.apigatewayv2_client.get_stage(ApiId=api_id, StageName=backend_config["rest_api_stage_name"])
+                route_settings = stage.get("DefaultRouteSettings", {})
+                state["throttling"] = (route_settings.get("ThrottlingRateLimit"), route_settings.get("ThrottlingBurstLimit"))
+            except ClientError:
+                state["throttling"] = None
+            return state
+
+        api_id = self._lookup_rest_api_id(backend_config["rest_api_name"])
+        if api_id is None:
+            return {"exists": False}
+        state = {"exists": True, "api_id": api_id}
+        authorizers = self.apigateway_client.get_authorizers(restApiId=api_id)["items"]
+        state["authorizer_ttls"] = [authorizer.get("authorizerResultTtlInSeconds", 300) for authorizer in authorizers]
+        try:
+            stage = self.apigateway_client.get_stage(restApiId=api_id, stageName=backend_config["rest_api_stage_name"])
+            method_settings = stage.get("methodSettings", {}).get("*/*", {})
+            state["throttling"] = (method_settings.get("throttlingRateLimit"), method_settings.get("throttlingBurstLimit"))
+        except ClientError:
+            state["throttling"] = None
+        return state
+
+    def read_deployment_state(self, backend_config):
+        '''{component: state} for the six components, read concurrently'''
+        readers = {
+            "packaged_build": self._read_packaged_build_state,
+            "uploaded_build": self._read_uploaded_build_state,
+            "fleet": self._read_fleet_state,
+            "user_pool": self._read_user_pool_state,
+            "lambdas": self._read_lambdas_state,
+            "rest_api": self._read_rest_api_state,
+        }
+        with ThreadPoolExecutor(max_workers=len(readers)) as executor:
+            futures = {
+                component: executor.submit(contextvars.copy_context().run, reader, backend_config)
+                for component, reader in readers.items()}
+            return {component: future.result() for component, future in futures.items()}
+
+    def _make_plan(self, backend_config, state):
+        '''return [(component, action, reason)] in deployment order.  action is one of
+        create, recreate, update, wait, manual or none'''
+        plan = []
+        def add(component, action, reason):
+            plan.append((component, action, reason))
+
+        if state["packaged_build"]["exists"]:
+            add("packaged_build", "none", "install.bat and server exe found")
+        else:
+            add("packaged_build", "manual", "package the dedicated server (see check packaged_build)")
+
+        uploaded_build = state["uploaded_build"]
+        if not uploaded_build["exists"]:
+            add("uploaded_build", "create", "no build named " + backend_config["server_package_name"])
+        elif "FAILED" in uploaded_build["statuses"] and \
+                not any(status in ("READY", "INITIALIZED") for status in uploaded_build["statuses"]):
+            add("uploaded_build", "manual", f'build {uploaded_build["build_ids"][0]} FAILED: delete it (delete uploaded_build) and upload again')
+        else:
+            add("uploaded_build", "none", f'build {uploaded_build["build_ids"][0]} {uploaded_build["statuses"][0]}')
+
+        fleet = state["fleet"]
+        fleet_changes = True
+        if not fleet["exists"]:
+            add("fleet", "create", "no fleet named " + backend_config["fleet_name"])
+        elif fleet["status"] in ("ERROR", "TERMINATED"):
+            add("fleet", "recreate", f'fleet is {fleet["status"]}')
+        elif uploaded_build["exists"] and fleet["build_id"] not in uploaded_build["build_ids"]:
+            add("fleet", "recreate", f'fleet runs build {fleet["build_id"]}, not {uploaded_build["build_ids"][0]}')
+        elif fleet["instance_type"] and fleet["instance_type"] != backend_config["fleet_ec2_instance_type"]:
+            add("fleet", "recreate", f'fleet instance type is {fleet["instance_type"]}')
+        elif fleet["status"] != "ACTIVE":
+            add("fleet", "wait", f'fleet is {fleet["status"]}')
+            fleet_changes = False
+        else:
+            configured = parse_fleet_locations(backend_config["fleet_locations"])
+            changed = [location for location, (desired, maximum) in configured.items()
+                if location not in fleet["locations"] or
+                    (fleet["locations"][location]["desired"], fleet["locations"][location]["max"]) != (desired, maximum)]
+            if changed:
+                add("fleet", "update", f'locations or capacity differ: {", ".join(changed)}')
+            else:
+                add("fleet", "none", f'fleet {fleet["fleet_id"]} ACTIVE')
+            fleet_changes = False
+
+        user_pool = state["user_pool"]
+        user_pool_changes = True
+        # a new app client changes only the lambdas, not the authorizer
+        app_client_changes = True
+        if not user_pool["exists"]:
+            add("user_pool", "create", "no user pool named " + backend_config["user_pool_name"])
+        elif user_pool["app_client_id"] is None or user_pool["domain"] is None:
+            missing = [name for name, key in [("app client", "app_client_id"), ("domain", "domain")] if user_pool[key] is None]
+            add("user_pool", "update", f'user pool is missing its {" and ".join(missing)}')
+            user_pool_changes = False
+            app_client_changes = user_pool["app_client_id"] is None
+        else:
+            add("user_pool", "none", f'user pool {user_pool["pool_id"]}')
+            user_pool_changes = False
+            app_client_changes = False
+
+        lambdas = state["lambdas"]
+        if len(lambdas["code_sha256"]) == 0:
+            add("lambdas", "create", "lambdas not found")
+        elif not lambdas["exists"]:
+            add("lambdas", "recreate", "only one of the two lambdas was found")
+        elif fleet_changes or user_pool_changes or app_client_changes:
+            add("lambdas", "update", "lambdas need the new fleet / app client ids")
+        elif lambdas["stale_policy_roles"]:
+            add("lambdas", "update", f'role policy differs: {", ".join(lambdas["stale_policy_roles"])}')
+        else:
+            expected = self._make_expected_lambda_code_sha256(
+                backend_config, user_pool["app_client_id"], fleet["fleet_id"])
+            if expected != lambdas["code_sha256"]:
+                add("lambdas", "update", "deployed lambda code differs from the local sources")
+            else:
+                add("lambdas", "none", "lambda code is up to date")
+        lambdas_action = plan[-1][1]
+
+        rest_api = state["rest_api"]
+        # an openapi deployment re-creates permissions and the authorizer in place
+        rebuild_action = "update" if backend_config["rest_api_type"] == "rest" and \
+            backend_config["rest_api_deploy_mode"] == "openapi" else "recreate"
+        expected_throttling = (float(backend_config["rest_api_throttle_rate_limit"]), backend_config["rest_api_throttle_burst_limit"])
+        if not rest_api["exists"]:
+            add("rest_api", "create", "no api named " + backend_config["rest_api_name"])
+        elif lambdas_action in ("create", "recreate"):
+            add("rest_api", rebuild_action, "new lambdas need new invoke permissions")
+        elif user_pool_changes:
+            add("rest_api", rebuild_action, "the authorizer needs the new user pool")
+        elif any(ttl != backend_config["rest_api_authorizer_ttl"] for ttl in rest_api.get("authorizer_ttls", [])):
+            add("rest_api", "update", "authorizer ttl differs")
+        elif rest_api["throttling"] is None or rest_api["throttling"][1] is None or \
+                (float(rest_api["throttling"][0] or 0), rest_api["throttling"][1]) != expected_throttling:
+            add("rest_api", "update", f'stage throttling is {rest_api["throttling"]}')
+        else:
+            add("rest_api", "none", f'api {rest_api["api_id"]}')
+        return plan
+
+    def _log_plan(self, plan):
+        for component, action, reason in plan:
+            log_info(f"{component:<16} {action:<9} {reason}")
+
+    @trace_step
+    def plan_all(self, backend_config):
+        '''log what apply would do.  Returns True when nothing needs to change'''
+        log_info("plan_all()")
+        plan = self._make_plan(backend_config, self.read_deployment_state(backend_config))
+        self._log_plan(plan)
+        return all(action in ("none", "wait") for component, action, reason in plan)
+
+    def _update_rest_api(self, backend_config):
+        if backend_config["rest_api_type"] == "http":
+            http_api_id = self._lookup_http_api_id(backend_config["rest_api_name"])
+            self.apigatewayv2_client.update_stage(
+                ApiId=http_api_id,
+                StageName=backend_config["rest_api_stage_name"],
+                DefaultRouteSettings={
+                    'ThrottlingRateLimit': backend_config["rest_api_throttle_rate_limit"],
+                    'ThrottlingBurstLimit': backend_config["rest_api_throttle_burst_limit"]
+                })
+            return True
+        if backend_config["rest_api_deploy_mode"] == "openapi":
+            return self._create_rest_api_from_openapi(backend_config)
+
+        rest_api_id = self._lookup_rest_api_id(backend_config["rest_api_name"])
+        for authorizer in self.apigateway_client.get_authorizers(restApiId=rest_api_id)["items"]:
+            self.apigateway_client.update_authorizer(
+                restApiId=rest_api_id,
+                authorizerId=authorizer["id"],
+                patchOperations=[{
+                    "op": "replace",
+                    "path": "/authorizerResultTtlInSeconds",
+                    "value": str(backend_config["rest_api_authorizer_ttl"])}])
+        self.apigateway_client.create_deployment(
+            restApiId=rest_api_id,
+            stageName=backend_config["rest_api_stage_name"],
+            **self._make_rest_api_cache_cluster_args(backend_config))
+        self._apply_rest_api_stage_settings(backend_config, rest_api_id)
+        return True
+
+    # delete a component apply is about to create again.  A fleet has to be
+    # gone, not just DELETING, before its replacement is created
+    def _delete_for_recreate(self, backend_config, component):
+        fleet_id = self._lookup_fleet_id(backend_config["fleet_name"]) if component == "fleet" else None
+        if getattr(self, "delete_" + component)(backend_config) is False:
+            return False
+        if fleet_id:
+            return self._wait_for_fleet_deleted(fleet_id)
         return True
 
+    def _wait_for_fleet_deleted(self, fleet_id, timeout=FLEET_DELETE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fleets = self.gamelift_client.describe_fleet_attributes(FleetIds=[fleet_id])["FleetAttributes"]
+            except self.gamelift_client.exceptions.NotFoundException:
+                fleets = []
+            status = fleets[0]["Status"] if fleets else "TERMINATED"
+            if status == "TERMINATED":
+                log_info(f"fleet {fleet_id} deleted")
+                return True
+            if time.monotonic() > deadline:
+                log_error(f"fleet {fleet_id} is still {status} after {timeout}s")
+                return False
+            log_info(f"waiting for fleet {fleet_id} to be deleted ({status})")
+            sleep_or_cancel(FLEET_DELETE_POLL_INTERVAL)
+
+    @trace_step
+    def apply_all(self, backend_config):
+        '''execute only the create/recreate/update actions from a fresh plan'''
+        log_info("apply_all()")
+        plan = self._make_plan(backend_config, self.read_deployment_state(backend_config))
+        self._log_plan(plan)
+        ret = True
+        for component, action, reason in plan:
+            if action in ("none", "wait"):
+                continue
+            log_info(f"apply: {action} {component}")
+            if action == "manual":
+                log_warn(f"{component}: {reason}")
+                ret = False
+                continue
+            if action == "recreate" and not self._delete_for_recreate(backend_config, component):
+                # creating anyway would leave two resources with the same name
+                log_error(f"apply: could not delete {component}, not recreating it")
+                ret = False
+                continue
+            if action == "update" and component == "lambdas":
+                result = self._update_lambdas_code(backend_config)
+            elif action == "update" and component == "rest_api":
+                result = self._update_rest_api(backend_config)
+            elif action == "update" and component == "user_pool":
+                result = self._update_user_pool(backend_config)
+            elif action == "update" and component == "fleet":
+                fleet_id = self._lookup_fleet_id(backend_config["fleet_name"])
+                pending = self._update_fleet_locations(backend_config, fleet_id)
+                if pending:
+                    log_info(f'capacity of {", ".join(pending)} is set once they are ACTIVE (apply again)')
+                result = True
+            else:
+                result = getattr(self, "create_" + component)(backend_config)
+            if result is False:
+                log_error(f"apply: {action} {component} failed")
+                ret = False
+        return ret
+
 
 def process_check_commands(backend, backend_config, commands):
+    ret = True
     while len(commands) > 0:
         command = commands.pop(0)
         if command == "packaged_build":
-            backend.check_packaged_build(backend_config)
+            result = backend.check_packaged_build(backend_config)
         elif command == "uploaded_build":
-            backend.check_uploaded_build(backend_config)
+            result = backend.check_uploaded_build(backend_config)
         elif command == "fleet":
-            backend.check_fleet(backend_config)
+            result = backend.check_fleet(backend_config)
         elif command == "user_pool":
-            backend.check_user_pool(backend_config)
+            result = backend.check_user_pool(backend_config)
         elif command == "lambdas":
-            backend.check_lambdas(backend_config)
+            result = backend.check_lambdas(backend_config)
         elif command == "rest_api":
-            backend.check_rest_api(backend_config)
+            result = backend.check_rest_api(backend_config)
+        elif command == "stack":
+            result = backend.check_stack(backend_config)
         else:
             log_warn("urecognized command" + command)
+            result = False
+        if result is False:
+            ret = False
+    return ret
 
 
 def process_create_commands(backend, backend_config, commands):
+    ret = True
     while len(commands) > 0:
         command = commands.pop(0)
         if command == "uploaded_build":
-            backend.create_uploaded_build(backend_config)
+            result = backend.create_uploaded_build(backend_config)
         elif command == "fleet":
-            backend.create_fleet(backend_config)
+            result = backend.create_fleet(backend_config)
         elif command == "user_pool":
-            backend.create_user_pool(backend_config)
+            result = backend.create_user_pool(backend_config)
         elif command == "lambdas":
-            backend.create_lambdas(backend_config)
+            result = backend.create_lambdas(backend_config)
         elif command == "rest_api":
-            backend.create_rest_api(backend_config)
+            result = backend.create_rest_api(backend_config)
+        elif command == "stack":
+            result = backend.create_stack(backend_config)
         else:
             log_warn("urecognized command" + command)
+            result = False
+        if result is False:
+            ret = False
+    return ret
 
 
 def process_delete_commands(backend, backend_config, commands):
+    ret = True
     while len(commands) > 0:
         command = commands.pop(0)
         if command == "uploaded_build":
-            backend.delete_uploaded_build(backend_config)
+            result = backend.delete_uploaded_build(backend_config)
         elif command == "fleet":
-            backend.delete_fleet(backend_config)
+            result = backend.delete_fleet(backend_config)
         elif command == "user_pool":
-            backend.delete_user_pool(backend_config)
+            result = backend.delete_user_pool(backend_config)
         elif command == "lambdas":
-            backend.delete_lambdas(backend_config)
+            result = backend.delete_lambdas(backend_config)
         elif command == "rest_api":
-            backend.delete_rest_api(backend_config)
+            result = backend.delete_rest_api(backend_config)
+        elif command == "stack":
+            result = backend.delete_stack(backend_config)
         else:
             log_warn("unrecognized command" + command)
+            result = False
+        if result is False:
+            ret = False
+    return ret
+
+
+def run_main_command(a, backend_config, main_command, sub_commands):
+    if main_command == "check":
+        return process_check_commands(a, backend_config, sub_commands)
+    elif main_command == "create":
+        return process_create_commands(a, backend_config, sub_commands)
+    elif main_command == "delete":
+        return process_delete_commands(a, backend_config, sub_commands)
+    elif main_command == "plan":
+        return a.plan_all(backend_config)
+    elif main_command == "apply":
+        return a.apply_all(backend_config)
+    elif main_command == "export":
+        return a.export_stack(backend_config)
+    elif main_command == "progress":
+        return a.progress_fleet(backend_config)
+    else:
+        log_warn(f"unrecognized_command: {main_command}")
+        return False
 
 
+# returns a result shaped like the response of the matching deployment request
 def process_backend_config(backend_config):
     if len(backend_config["commands"]) > 0:
         log_info(f'using AWS profile: {backend_config["profile_name"]}')
-        a = AwsBackend(backend_config)
-
-        main_command = backend_config["commands"].pop(0)
-        sub_commands = backend_config["commands"]
-
-        if len(sub_commands) > 0 and sub_commands[0] == "all":
-            sub_commands = [
-                "packaged_build",
-                "uploaded_build",
-                "fleet",
-                "user_pool",
-                "lambdas",
-                "rest_api"]
-
-        if main_command == "check":
-            process_check_commands(a, backend_config, sub_commands)
-        elif main_command == "create":
-            process_create_commands(a, backend_config, sub_commands)
-        elif main_command == "delete":
-            process_delete_commands(a, backend_config, sub_commands)
-        else:
-            log_warn(f"unrecognized_command: {main_command}")
+        configure_tracer(backend_config)
+        run_name = ' '.join(backend_config["commands"])
+        with tracer.span("run", run_name, prefix=backend_config["prefix"]):
+            main_command = backend_config["commands"].pop(0)
+            sub_commands = backend_config["commands"]
+
+            if len(sub_commands) > 0 and sub_commands[0] == "all":
+                sub_commands = [
+                    "packaged_build",
+                    "uploaded_build",
+                    "fleet",
+                    "user_pool",
+                    "lambdas",
+                    "rest_api"]
+
+            if main_command == "watch":
+                watch_from_command_line(backend_config)
+                return {"Overall Result": "True"}
+            elif len(get_region_names(backend_config)) > 1:
+                def run_region(region_config, region_result):
+                    a = AwsBackend(region_config)
+                    try:
+                        region_result.result = run_main_command(a, region_config, main_command, list(sub_commands))
+                    finally:
+                        region_result.call_summary = a.call_stats.summary()
+                        log_info(a.call_stats.summary_line())
+                region_results = run_in_regions(backend_config, run_region)
+                log_region_results(region_results)
+                return make_regions_response(region_results)
+            else:
+                a = AwsBackend(backend_config)
+                result = run_main_command(a, backend_config, main_command, sub_commands)
+                log_info(a.call_stats.summary_line())
+                return {"Overall Result": str(result), "Call Summary": a.call_stats.summary()}
+
+
+# batch mode: run a script of aws_backend.py command lines in one process,
+# e.g. for a CI pipeline.  One command per line; blank lines and # comments
+# are skipped.  The options given with batch apply to every line and a line's
+# own options override them, so one script can cover several prefixes:
+#
+#   check all --prefix=staging
+#   create fleet --prefix=potato --region_name=us-east-1
+#
+# Every command prints one JSON line with its result to stdout (the log goes
+# to stderr).  All commands share the boto3 sessions and clients of each
+# profile and region, and an upload zips each server package once.
+BATCH_EXCLUDED_COMMANDS = ["batch", "watch"]
+
+def read_batch_lines(script_path):
+    if script_path in (None, "-"):
+        return sys.stdin.read().splitlines()
+    with open(script_path) as script_file:
+        return script_file.read().splitlines()
+
+
+def run_batch(option_argv, script_path, keep_going):
+    '''returns the number of commands that failed or were skipped'''
+    failed_count = 0
+    with sharing_aws_clients(), sharing_server_package_zips():
+        for line_number, line in enumerate(read_batch_lines(script_path), 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            record = {"Line": line_number, "Command": line}
+            start_time = time.perf_counter()
+            try:
+                if failed_count and not keep_going:
+                    record["Status"] = "skipped"
+                    continue
+                backend_config = make_backend_config_from_args(option_argv + shlex.split(line))
+                record["Prefix"] = backend_config["prefix"]
+                record["Region"] = backend_config["region_name"]
+                if not backend_config["commands"] or backend_config["commands"][0] in BATCH_EXCLUDED_COMMANDS:
+                    raise ValueError(f"not a batch command: {line}")
+                result = process_backend_config(backend_config)
+                record.update(result)
+                record["Status"] = "ok" if result["Overall Result"] != "False" else "failed"
+            except Exception as e:
+                log_exception(f"batch line {line_number}: {line}")
+                record["Status"] = "error"
+                record["Error"] = str(e) or type(e).__name__
+            except SystemExit:
+                # argparse rejected the line's options
+                record["Status"] = "error"
+                record["Error"] = f"invalid options: {line}"
+            finally:
+                record["Elapsed"] = time.perf_counter() - start_time
+                if record["Status"] != "ok":
+                    failed_count += 1
+                # the line's log comes before its result
+                wait_for_log_delivery(logging.getLogger('').handlers)
+                print(json.dumps(record, default=str), flush=True)
+    return failed_count
+
+
+def watch_from_command_line(backend_config):
+    watcher_id = f"cli-{os.getpid()}"
+    watch, subscriber = subscribe_to_watch(backend_config, watcher_id)
+    log_info("watching (ctrl-c to stop)")
+    try:
+        while True:
+            # the watch logs each transition as it sees it
+            watch.wait_for_events(subscriber, backend_config["watch_timeout"])
+            if not watch.running:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watch.unsubscribe(watcher_id)
 
 
 class Formatter(argparse.ArgumentDefaultsHelpFormatter, argparse.RawDescriptionHelpFormatter):
@@ -1273,12 +4546,20 @@ class Formatter(argparse.ArgumentDefaultsHelpFormatter, argparse.RawDescriptionH
 
 # e.g.
 # 
+#
+# every request of the editor sends the same settings again, so the configs
+# made from query dicts are memoized by the dict's items.  Callers get their
+# own copy to change.
+#
+@functools.lru_cache(maxsize=64)
+def _make_backend_config_from_items(items):
+    return make_backend_config_from_args(["--" + key + "=" + value for key, value in items])
+
+def copy_backend_config(backend_config):
+    return dict(backend_config, commands=list(backend_config["commands"]))
+
 def make_backend_config_from_dict(dict):
-    args = []
-    for key in dict:
-        param = "--" + key + "=" + dict[key]
-        args.append(param)
-    return make_backend_config_from_args(args)
+    return copy_backend_config(_make_backend_config_from_items(tuple(sorted(dict.items()))))
 
 
 def verify_backend_config(backend_config):
@@ -1286,11 +4567,15 @@ def verify_backend_config(backend_config):
     regex = r'^[a-z0-9][a-z0-9-]{0,31}$'
     if not re.match(regex, prefix):
         raise Exception(f"Invalid fleet prefix {prefix}.  Check your project settings to ensure you are using lowercase")
+    for key in ["bulk_service_rates", "watch_intervals"]:
+        try:
+            parse_bulk_service_rates(backend_config[key])
+        except ValueError as e:
+            raise Exception(f"Invalid {key} {backend_config[key]}: {e}")
 
-# return a dictionary that still needs to be  
-def make_backend_config_from_args(argv):
-    '''return a backend_config'''
-
+# the parser of every backend config.  Built once; parsing leaves it unchanged
+@functools.lru_cache(maxsize=None)
+def make_backend_config_parser():
     example_text = '''create examples:
        python aws_backend.py create uploaded_build
        python aws_backend.py create fleet
@@ -1302,6 +4587,25 @@ delete examples:
        python aws_backend.py delete uploaded_build
        python aws_backend.py delete all
 
+plan/apply examples (only perform the creates and updates that are needed):
+       python aws_backend.py plan
+       python aws_backend.py apply
+
+fleet launch progress (only the new fleet events, and an estimate of the time left):
+       python aws_backend.py progress
+
+watch example (report each component's changes until ctrl-c):
+       python aws_backend.py watch
+
+batch examples (a script of the commands above in one process, one JSON result line per command):
+       python aws_backend.py batch ci_commands.txt --profile_name=ci
+       echo "check all --prefix=potato" | python aws_backend.py batch -
+
+cloudformation examples (user pool, lambdas and rest api as a single stack):
+       python aws_backend.py export
+       python aws_backend.py create stack
+       python aws_backend.py delete stack
+
 override default example:
        python aws_backend.py --prefix=potato --server_package_root=E:/unreal_projects/ue5_gamelift_plugin_test/MyProject/ServerBuild/WindowsServer --fleet_launch_path=C:/game/MyProject/Binaries/Win64/MyProjectServer.exe --profile=dave --region=us-west-2
        '''
@@ -1348,6 +4652,11 @@ override default example:
         '--fleet_ec2_instance_type',
         default="c5.large",
         help="what kind of EC2s to allocate.  Currently c5.large, c4.large and c3.large qualify for the GameLift free tier")
+    parser.add_argument(
+        '--fleet_locations',
+        default="",
+        help="locations of the fleet with their desired and max instances, e.g. us-east-1:1:2,eu-west-1:0:1."
+            " Locations other than region_name are added as remote locations of the one fleet")
 
     parser.add_argument(
         '--user_pool_name',
@@ -1362,6 +4671,39 @@ override default example:
         default="[prefix]-login",
         help="name the subdomain")
  
+    parser.add_argument(
+        '--user_pool_test_user_count',
+        type=int,
+        default=32,
+        help="number of test users to create with the pool")
+    parser.add_argument(
+        '--user_pool_test_user_name_pattern',
+        default="user{index}",
+        help="test user names. {index} is replaced with 0,1,2...")
+    parser.add_argument(
+        '--user_pool_test_user_password',
+        default="test12",
+        help="password given to every test user")
+    parser.add_argument(
+        '--user_pool_test_user_import_threshold',
+        type=int,
+        default=1000,
+        help="at or above this many test users, create them with a cognito user import job.  An import "
+             "can't set passwords, so each imported user still takes one admin_set_user_password call")
+    parser.add_argument(
+        '--user_pool_test_user_progress_interval',
+        type=int,
+        default=100,
+        help="log progress every this many test users.  0 only logs the totals")
+    parser.add_argument(
+        '--user_pool_import_role_name',
+        default="[prefix]-user-pool-import-role",
+        help="name of the role a user import job uses to write its logs")
+    parser.add_argument(
+        '--user_pool_import_other_policy_name',
+        default="[prefix]-user-pool-import-other-policy-name",
+        help="name of the policy that lets user import jobs write to cloudwatch logs")
+ 
     parser.add_argument(
         '--lambda_login_function_name',
         default="[prefix]-lambda-login-function",
@@ -1404,32 +4746,156 @@ override default example:
         '--rest_api_start_session_path_part',
         default="startsession",
         help="name the suffix")
+    parser.add_argument(
+        '--rest_api_type',
+        default="rest",
+        choices=["rest", "http"],
+        help="rest: REST API (apigateway).  http: HTTP API (apigatewayv2) with a cognito JWT authorizer and lower per-request latency")
+    parser.add_argument(
+        '--rest_api_deploy_mode',
+        default="resources",
+        choices=["resources", "openapi"],
+        help="resources: build the api with one call per resource/method.  openapi: deploy (or update) the whole api from a generated OpenAPI definition in one call")
     parser.add_argument(
         '--rest_api_cognito_authorizer_name',
         default="[prefix]-cognito-authorizer",
         help="name the authorizer")
 
+    parser.add_argument(
+        '--rest_api_authorizer_ttl',
+        type=int,
+        default=300,
+        help="seconds the cognito authorizer caches a validated token.  0 re-validates every request")
+    parser.add_argument(
+        '--rest_api_throttle_rate_limit',
+        type=float,
+        default=50.0,
+        help="steady state requests per second allowed for each method on the stage")
+    parser.add_argument(
+        '--rest_api_throttle_burst_limit',
+        type=int,
+        default=100,
+        help="burst of requests allowed for each method on the stage")
+    parser.add_argument(
+        '--rest_api_cache_cluster_size',
+        default="",
+        help="stage cache size in GB (e.g. 0.5).  Empty disables the stage cache.  GET /startsession is never cached, since a cached response hands the same session to every caller")
+    parser.add_argument(
+        '--rest_api_cache_ttl',
+        type=int,
+        default=300,
+        help="seconds a response stays in the stage cache")
+
+    parser.add_argument(
+        '--bulk_max_concurrency',
+        type=int,
+        default=8,
+        help="maximum concurrent calls made by bulk operations (test users, deleting builds and apis)")
+    parser.add_argument(
+        '--bulk_service_rates',
+        default="cognito-idp=20,gamelift=5,apigateway=0.1,apigatewayv2=1,default=5",
+        help="starting calls per second for bulk operations, per service.  Rates halve when a service throttles")
+
+    parser.add_argument(
+        '--upload_progress_max_rate',
+        type=float,
+        default=2.0,
+        help="most build upload progress events per second (the Progress of a background job).  0 sends every one")
+    parser.add_argument(
+        '--upload_progress_milestone_percent',
+        type=int,
+        default=25,
+        help="log the build upload's progress every this many percent")
+
+    parser.add_argument(
+        '--watch_intervals',
+        default="default=120,packaged_build=10,uploaded_build=60,fleet=60,changing=10",
+        help="watch: seconds between polls of each component.  'changing' applies while a build or fleet is changing state")
+    parser.add_argument(
+        '--watch_timeout',
+        type=float,
+        default=25.0,
+        help="watch: how long a /deployment/watch request waits for a transition")
+
+    parser.add_argument(
+        '--stack_name',
+        default="[prefix]-stack",
+        help="cloudformation stack used by create/delete stack")
+    parser.add_argument(
+        '--stack_template_file',
+        default="[prefix]-stack.template.json",
+        help="where export writes the cloudformation template.  Relative paths are under project_root")
+
+    parser.add_argument(
+        '--state_file',
+        default="[prefix].aws_backend_state.json",
+        help="where the ids of created resources are remembered.  Relative paths are under project_root.  Empty disables the state file")
+
+    parser.add_argument(
+        '--trace_file',
+        default=DEFAULT_TRACE_FILE,
+        help="append structured step and aws call timings here (JSON lines, see aws_backend_trace.py).  Relative paths are under project_root.  Empty disables tracing")
+    parser.add_argument(
+        '--trace_file_max_mb',
+        type=float,
+        default=10.0,
+        help="once the trace file is this big it is moved to <trace_file>.1 and a new one started")
+
+    parser.add_argument(
+        '--background_ops',
+        default="",
+        help="comma separated /deployment ops (e.g. create,delete) to run as background jobs.  The request returns the job "
+            "at once; poll /deployment/<component>/status or /deployment/jobs/<id>, cancel with .../cancel")
+
+    parser.add_argument(
+        '--batch_keep_going',
+        action='store_true',
+        help="batch: run the remaining commands after one fails instead of skipping them")
+
     parser.add_argument(
         '--profile_name',
         default='sean_backend',
         help="AWS credentials to use")
     parser.add_argument('--region_name',
             default='us-west-2',
-            help='AWS region')
+            help='AWS region, or a comma separated list of regions to check and deploy to concurrently')
+    return parser
+
+
+# the config before [prefix] is substituted, e.g. {"fleet_name": "[prefix]-fleet", ...}
+@functools.lru_cache(maxsize=None)
+def _backend_config_defaults():
+    return vars(make_backend_config_parser().parse_args([]))
+
+
+def make_backend_config_from_args(argv):
+    '''return a backend_config'''
+    return resolve_backend_config(vars(make_backend_config_parser().parse_args(argv)))
+
 
-    args = parser.parse_args(argv)
+def make_backend_config(**values):
+    '''the fast path for programmatic callers: the defaults with values applied
+    and [prefix] substituted, without argparse.  Values are used as given, so
+    pass them with the option's type (e.g. user_pool_test_user_count=8)'''
+    defaults = _backend_config_defaults()
+    unknown = [key for key in values if key not in defaults]
+    if unknown:
+        raise ValueError(f'unknown backend config options: {", ".join(unknown)}')
+    return resolve_backend_config(dict(defaults, commands=list(values.pop("commands", [])), **values))
 
-    backend_config = vars(args)
 
+def resolve_backend_config(backend_config):
     # walk through the build config and replace [prefix] with the prefix
     # these final configuration parameters are what is used as the resource
     # names during creation and deletion.
-    log_debug("Backend Configuration:")
     prefix = backend_config["prefix"]
     for key, value in backend_config.items():
         if type(value) == str:
             backend_config[key] = value.replace("[prefix]", prefix)
-        log_debug(f"    {key}:{backend_config[key]}")
+    if aws_logger.isEnabledFor(logging.DEBUG):
+        log_debug("Backend Configuration:")
+        for key, value in backend_config.items():
+            log_debug(f"    {key}:{value}")
 
     verify_backend_config(backend_config)
 
@@ -1439,8 +4905,8 @@ override default example:
 # python docs on how to send INFO and above to console and DEBUG, INFO and above to logfile 
 def setup_logger_to_both_console_and_logfile():
     logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-                    datefmt='%m-%d %H:%M',
+                    format='%(asctime)s.%(msecs)03d %(name)-12s %(levelname)-8s %(message)s',
+                    datefmt='%m-%d %H:%M:%S',
                     filename='aws_backend.log',
                     filemode='w')
     # define a Handler which writes INFO messages or higher to the sys.stderr
@@ -1452,14 +4918,24 @@ def setup_logger_to_both_console_and_logfile():
     # tell the handler to use this format
     console_handler.setFormatter(console_formatter)
     # add the handler to the root logger
-    logging.getLogger('').addHandler(console_handler)
+    root_logger = logging.getLogger('')
+    root_logger.addHandler(console_handler)
+    # the logfile and console are written by listener threads too
+    for handler in list(root_logger.handlers):
+        if not is_queued_log_sink(handler):
+            root_logger.removeHandler(handler)
+            root_logger.addHandler(QueuedLogSink(handler))
 
 
+# the handler for records logged outside any request or job sink
 def logging_install_handler(logging_handler):
-    if aws_logger.hasHandlers():
-        for handler in aws_logger.handlers:
+    for handler in list(aws_logger.handlers):
+        if handler is not log_router:
             aws_logger.removeHandler(handler)
-    aws_logger.addHandler(logging_handler)
+    old_sink = log_router.default_handler
+    log_router.default_handler = None if logging_handler is None else QueuedLogSink(logging_handler)
+    if is_queued_log_sink(old_sink):
+        old_sink.close(drain=True)
 
 def logging_set_level(level):
     aws_logger.setLevel(level)
@@ -1484,8 +4960,17 @@ def test_sending_logs():
 def run_main(argv):
     setup_logger_to_both_console_and_logfile()
     backend_config = make_backend_config_from_args(argv)
+    if backend_config["commands"][:1] == ["batch"]:
+        # the options of the batch itself are the defaults of every line
+        option_argv = list(argv)
+        for command in backend_config["commands"]:
+            option_argv.remove(command)
+        script_path = backend_config["commands"][1] if len(backend_config["commands"]) > 1 else None
+        failed_count = run_batch(option_argv, script_path, backend_config["batch_keep_going"])
+        return 1 if failed_count else 0
     process_backend_config(backend_config)
+    return 0
 
 
 if __name__ == '__main__':
-    run_main(sys.argv[1:])
+    sys.exit(run_main(sys.argv[1:]))
@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+
+# Copyright 2022 Sean Payne
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# Local benchmarks for aws_backend.py.  Nothing here talks to AWS; accounts are
+# faked in memory by aws_backend_fake.py and AWS latency is simulated.
+#
+# usage:
+#   python aws_backend_bench.py lookups [--resource_count 5000]
+#   python aws_backend_bench.py cycle [--latency 0.05 --throttle_probability 0.1]
+#   python aws_backend_bench.py config [--iterations 2000]
+#   python aws_backend_bench.py imports [--max_import_ms 100]
+
+import sys
+import argparse
+import logging
+import subprocess
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+
+import aws_backend
+from aws_backend_fake import FakeAws
+
+
+#
+# lookups: how many list pages (and how much simulated AWS time) it takes to
+# find one named resource in an account holding thousands of them
+#
+
+# where in the listing the wanted resource sits
+LOOKUP_POSITIONS = ["first", "middle", "last", "missing"]
+
+def position_index(position, count):
+    return {"first": 0, "middle": count // 2, "last": count - 1}.get(position)
+
+
+def seed_builds(fake, backend_config, count, position):
+    target_index = position_index(position, count)
+    statuses = ["READY"] * 7 + ["FAILED"] * 2 + ["INITIALIZED"]
+    for i in range(count):
+        if i == target_index:
+            fake.add_build(backend_config["server_package_name"])
+        else:
+            fake.add_build(f"other-server-package-{i}", statuses[i % len(statuses)])
+
+def seed_fleets(fake, backend_config, count, position):
+    target_index = position_index(position, count)
+    build_id = fake.add_build(backend_config["server_package_name"])
+    for i in range(count):
+        if i == target_index:
+            fake.add_fleet(backend_config["fleet_name"], build_id)
+        else:
+            fake.add_fleet(f"other-fleet-{i}", fake.add_build(f"other-server-package-{i}"))
+    return build_id
+
+def seed_user_pools(fake, backend_config, count, position):
+    target_index = position_index(position, count)
+    for i in range(count):
+        fake.add_user_pool(backend_config["user_pool_name"] if i == target_index else f"other-user-pool-{i}")
+
+def seed_rest_apis(fake, backend_config, count, position):
+    target_index = position_index(position, count)
+    for i in range(count):
+        fake.add_rest_api(backend_config["rest_api_name"] if i == target_index else f"other-rest-api-{i}")
+
+def seed_http_apis(fake, backend_config, count, position):
+    target_index = position_index(position, count)
+    for i in range(count):
+        fake.add_http_api(backend_config["rest_api_name"] if i == target_index else f"other-http-api-{i}")
+
+
+# what the lookups did before they paginated: read every page, then filter
+def list_everything(backend, kind):
+    iter_paginated = aws_backend.iter_paginated
+    if kind == "build":
+        return [build["Name"] for build in iter_paginated(backend.gamelift_client, 'list_builds', "Builds")]
+    if kind == "fleet":
+        return [fleet["Name"] for fleet in iter_paginated(backend.gamelift_client, 'describe_fleet_attributes', "FleetAttributes")]
+    if kind == "user_pool":
+        return [pool["Name"] for pool in iter_paginated(backend.cognitoidp_client, 'list_user_pools', "UserPools", page_size=60)]
+    if kind == "rest_api":
+        return [api["name"] for api in iter_paginated(backend.apigateway_client, 'get_rest_apis', "items")]
+    if kind == "http_api":
+        return [api["Name"] for api in iter_paginated(backend.apigatewayv2_client, 'get_apis', "Items")]
+
+def discover(backend, backend_config, kind):
+    if kind == "build":
+        return backend._discover_build_id(backend_config["server_package_name"])
+    if kind == "fleet":
+        return backend._discover_fleet_id(backend_config["fleet_name"])
+    if kind == "user_pool":
+        return backend._discover_user_pool_id(backend_config["user_pool_name"])
+    if kind == "rest_api":
+        return next(backend._iter_rest_api_ids(backend_config["rest_api_name"]), None)
+    if kind == "http_api":
+        return next(backend._iter_http_api_ids(backend_config["rest_api_name"]), None)
+
+LOOKUP_KINDS = {
+    "build": (seed_builds, "server_package_name"),
+    "fleet": (seed_fleets, "fleet_name"),
+    "user_pool": (seed_user_pools, "user_pool_name"),
+    "rest_api": (seed_rest_apis, "rest_api_name"),
+    "http_api": (seed_http_apis, "rest_api_name"),
+}
+
+
+def bench_lookup(backend_config, kind, position, count, latency, item_latency):
+    '''[(method, calls, simulated secs, found)] for one kind of resource at one position'''
+    seed, name_key = LOOKUP_KINDS[kind]
+    fake = FakeAws(backend_config["region_name"], latency, item_latency)
+    build_id = seed(fake, backend_config, count, position)
+    backend = aws_backend.AwsBackend(backend_config, session=fake.session())
+    if build_id:
+        # the fleet lookup narrows the listing with the build id from the state file
+        backend.state.set("build_id", backend_config["server_package_name"], build_id)
+
+    rows = []
+    fake.reset_counters()
+    names = list_everything(backend, kind)
+    rows.append(("full listing", len(fake.calls), fake.simulated_time, backend_config[name_key] in names))
+
+    fake.reset_counters()
+    found_id = discover(backend, backend_config, kind)
+    rows.append(("paginated lookup", len(fake.calls), fake.simulated_time, found_id is not None))
+    return rows
+
+
+def run_lookups(args):
+    backend_config = aws_backend.make_backend_config_from_args(["--state_file", "", "--trace_file", ""])
+    print(f"{args.resource_count} resources per account, {args.latency*1000:.0f}ms per call"
+        f" + {args.item_latency*1000:.2f}ms per item (simulated)")
+    print(f'{"kind":<10} {"position":<8} {"method":<17} {"calls":>6} {"aws time":>10} {"found":>6}')
+    for kind in LOOKUP_KINDS:
+        for position in LOOKUP_POSITIONS:
+            for method, calls, seconds, found in bench_lookup(
+                    backend_config, kind, position, args.resource_count, args.latency, args.item_latency):
+                print(f'{kind:<10} {position:<8} {method:<17} {calls:>6} {seconds:>9.2f}s {"yes" if found else "no":>6}')
+
+
+#
+# cycle: create all, check all, a login + start session through the deployed
+# lambdas, then delete all, against one fake account
+#
+
+CYCLE_COMPONENTS = ["uploaded_build", "fleet", "user_pool", "lambdas", "rest_api"]
+
+# a project and server package that check_packaged_build accepts
+def make_fake_project(root, backend_config):
+    project_root = Path(root) / "project"
+    package_root = Path(root) / "package"
+    (package_root / "install.bat").parent.mkdir(parents=True)
+    (package_root / "install.bat").write_text("")
+    launch_suffix = backend_config["fleet_launch_path"][len("C:/game/"):]
+    for exe_path in [package_root / launch_suffix, project_root / launch_suffix.split("/", 1)[1]]:
+        exe_path.parent.mkdir(parents=True, exist_ok=True)
+        exe_path.write_text("")
+    return str(project_root), str(package_root)
+
+
+def run_login_and_start_session(fake, backend_config):
+    user_name = backend_config["user_pool_test_user_name_pattern"].format(index=0)
+    login = fake.invoke(backend_config["lambda_login_function_name"], {
+        "username": user_name, "password": backend_config["user_pool_test_user_password"]})
+    if login.get("status") != "success":
+        return False
+    player_session = fake.invoke(backend_config["lambda_start_session_function_name"], {})
+    return b"PlayerSessionId" in player_session
+
+
+def run_cycle_phase(fake, name, steps):
+    '''run [(label, fn)] and print one row for the phase'''
+    fake.reset_counters()
+    start = time.perf_counter()
+    results = [(label, step()) for label, step in steps]
+    elapsed = time.perf_counter() - start
+    failed = [label for label, result in results if result is False]
+    print(f'{name:<10} {elapsed*1000:>9.1f}ms {len(fake.calls):>6} '
+        f'{fake.simulated_time:>9.2f}s {fake.throttled_count:>9} {"ok" if not failed else "failed: " + ", ".join(failed)}')
+
+
+def run_cycle(args):
+    with tempfile.TemporaryDirectory() as root:
+        project_root, package_root = make_fake_project(root, aws_backend.make_backend_config_from_args([]))
+        backend_config = aws_backend.make_backend_config_from_args([
+            "--project_root", project_root,
+            "--server_package_root", package_root,
+            "--state_file", "", "--trace_file", "",
+            "--rest_api_deploy_mode", args.rest_api_deploy_mode,
+            "--rest_api_type", args.rest_api_type,
+            "--user_pool_test_user_count", str(args.test_user_count),
+            # the fake throttles on its own; don't also rate limit locally
+            "--bulk_service_rates", "default=100000"])
+        fake = FakeAws(backend_config["region_name"], args.latency, args.item_latency,
+            sleep=args.sleep, throttle_probability=args.throttle_probability, seed=1)
+        backend = aws_backend.AwsBackend(backend_config, session=fake.session())
+
+        def steps(verb, components):
+            return [(component, (lambda component=component:
+                getattr(backend, f"{verb}_{component}")(backend_config))) for component in components]
+
+        print(f'{"phase":<10} {"wall":>11} {"calls":>6} {"aws time":>10} {"throttled":>9} result')
+        run_cycle_phase(fake, "create",
+            steps("create", CYCLE_COMPONENTS))
+        run_cycle_phase(fake, "check", steps("check", ["packaged_build"] + CYCLE_COMPONENTS))
+        run_cycle_phase(fake, "session",
+            [("login and start session", lambda: run_login_and_start_session(fake, backend_config))])
+        run_cycle_phase(fake, "delete", steps("delete", CYCLE_COMPONENTS))
+        print(backend.call_stats.summary_line())
+
+
+#
+# config: the per-request cost of turning the editor's query dict into a
+# backend config, the way every handle_request call does
+#
+
+# what the editor sends with every request
+EDITOR_QUERY = {
+    "profile_name": "sean_gl",
+    "region_name": "us-west-2",
+    "prefix": "testfleet",
+    "server_package_root": "e:/unreal_projects/quickstarts/quickstart5/Packaged/WindowsServer",
+    "fleet_launch_path": "c:/game/quickstart5/Binaries/Win64/quickstart5Server.exe",
+    "project_root": "e:/unreal_projects/quickstarts/quickstart5",
+}
+
+def time_per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def run_config(args):
+    argv = ["--" + key + "=" + value for key, value in EDITOR_QUERY.items()]
+    make_parser = aws_backend.make_backend_config_parser.__wrapped__
+    memoized = aws_backend._make_backend_config_from_items
+
+    def uncached_config_route():
+        memoized.cache_clear()
+        return aws_backend.handle_request(deque(["config"]), EDITOR_QUERY, "GET")
+
+    rows = [
+        # what every request paid before the parser was built once
+        ("new parser per config", lambda: aws_backend.resolve_backend_config(vars(make_parser().parse_args(argv)))),
+        ("shared parser", lambda: aws_backend.make_backend_config_from_args(argv)),
+        ("memoized query dict", lambda: aws_backend.make_backend_config_from_dict(EDITOR_QUERY)),
+        ("config object", lambda: aws_backend.make_backend_config(**EDITOR_QUERY)),
+        ("config route, not memoized", uncached_config_route),
+        ("config route", lambda: aws_backend.handle_request(deque(["config"]), EDITOR_QUERY, "GET")),
+    ]
+    print(f'{"method":<28} {"per call":>10}')
+    for name, fn in rows:
+        fn()
+        print(f"{name:<28} {time_per_call(fn, args.iterations) * 1e6:>8.1f}us")
+
+
+#
+# imports: what "import aws_backend" and the editor's first requests (metadata
+# and config) cost in a fresh interpreter, measured with python -X importtime.
+# Fails when they pull in the AWS SDK or take longer than --max_import_ms.
+# Run it with an up to date .pyc (e.g. after python -m compileall): compiling
+# aws_backend.py takes longer than importing it.
+#
+
+# only the first deployment request may import these
+AWS_ONLY_MODULES = ["boto3", "botocore", "s3transfer", "zipfile", "webbrowser", "urllib.request"]
+
+FIRST_REQUESTS = '''
+import sys, collections, aws_backend
+aws_backend.handle_request(collections.deque(["metadata"]), {}, "GET")
+aws_backend.handle_request(collections.deque(["config"]), {"prefix": "importcheck"}, "GET")
+print(" ".join(sorted(name for name in sys.modules if name.split(".")[0] in AWS_ONLY_MODULES or name in AWS_ONLY_MODULES)))
+'''
+
+def parse_importtime(stderr):
+    '''[(module, self us, cumulative us, depth)] from python -X importtime output.
+    A module is listed after everything it imported'''
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def measure_imports():
+    code = f"AWS_ONLY_MODULES = {AWS_ONLY_MODULES!r}\n" + FIRST_REQUESTS
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+        cwd=str(Path(__file__).parent), capture_output=True, text=True, check=True)
+    return parse_importtime(completed.stderr), completed.stdout.split()
+
+
+def run_imports(args):
+    runs = [measure_imports() for _ in range(args.repeat)]
+    # the fastest run has the least noise from the rest of the machine
+    imports, aws_modules = min(runs, key=lambda run: next(
+        (cumulative for name, _, cumulative, _ in run[0] if name == "aws_backend"), 0))
+    total_us = next(cumulative for name, _, cumulative, _ in imports if name == "aws_backend")
+    # the modules aws_backend imports itself are listed just before it, one level deeper
+    direct = []
+    for row in reversed(imports[:[row[0] for row in imports].index("aws_backend")]):
+        if row[3] == 0:
+            break
+        if row[3] == 1:
+            direct.append(row)
+    print(f'{"module":<28} {"cumulative":>11}')
+    for name, _, cumulative_us, _ in sorted(direct, key=lambda row: row[2], reverse=True)[:args.count]:
+        print(f"{name:<28} {cumulative_us / 1000:>9.1f}ms")
+    print(f'{"aws_backend":<28} {total_us / 1000:>9.1f}ms (best of {args.repeat})')
+
+    failures = []
+    if aws_modules:
+        failures.append("the metadata and config requests imported " + ", ".join(aws_modules))
+    if args.max_import_ms and total_us / 1000 > args.max_import_ms:
+        failures.append(f"import took {total_us / 1000:.1f}ms, over {args.max_import_ms}ms")
+    for failure in failures:
+        print("FAILED: " + failure)
+    if failures:
+        sys.exit(1)
+
+
+def run_main(argv):
+    parser = argparse.ArgumentParser(description="Local benchmarks for aws_backend.py")
+    parser.add_argument("command", choices=["lookups", "cycle", "config", "imports"])
+    parser.add_argument("--resource_count", type=int, default=5000, help="lookups: resources of each kind in the fake account")
+    parser.add_argument("--latency", type=float, default=0.08, help="simulated seconds per aws call")
+    parser.add_argument("--item_latency", type=float, default=0.0002, help="simulated seconds per returned item")
+    parser.add_argument("--sleep", action="store_true", help="really wait out the simulated latency")
+    parser.add_argument("--throttle_probability", type=float, default=0.0, help="cycle: fraction of aws calls throttled")
+    parser.add_argument("--test_user_count", type=int, default=32, help="cycle: test users created with the user pool")
+    parser.add_argument("--rest_api_type", default="rest", choices=["rest", "http"])
+    parser.add_argument("--rest_api_deploy_mode", default="resources", choices=["resources", "openapi"])
+    parser.add_argument("--iterations", type=int, default=2000, help="config: calls timed per method")
+    parser.add_argument("--repeat", type=int, default=5, help="imports: fresh interpreters to measure")
+    parser.add_argument("--count", type=int, default=10, help="imports: slowest imports to show")
+    parser.add_argument("--max_import_ms", type=float, default=0.0, help="imports: fail above this import time (0: no limit)")
+    parser.add_argument("--verbose", action="store_true", help="show the backend's log")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if args.command == "lookups":
+        run_lookups(args)
+    elif args.command == "cycle":
+        run_cycle(args)
+    elif args.command == "config":
+        run_config(args)
+    elif args.command == "imports":
+        run_imports(args)
+
+
+if __name__ == '__main__':
+    run_main(sys.argv[1:])
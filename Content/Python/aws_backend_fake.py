@@ -0,0 +1,1195 @@
+#!/usr/bin/env python
+
+# Copyright 2022 Sean Payne
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# An in-memory AWS account for running AwsBackend and the lambda handlers locally.
+#
+# FakeSession hands out real boto3 clients (so parameter validation, paginators,
+# modeled exceptions and the AwsCallStats hooks all behave as usual) whose
+# requests are answered by a FakeAws account instead of being sent.  Nothing
+# leaves the process.
+#
+# Faked: GameLift builds, fleets (with remote locations and per-location
+# capacity), game sessions and player sessions; Cognito
+# user pools, app clients, domains, users and USER_PASSWORD_AUTH logins; IAM
+# roles; Lambda functions (invoke runs the uploaded handler in-process against
+# the same account); API Gateway REST and HTTP apis; STS; tag discovery; the
+# S3 uploads of build zips.
+# Not faked: cognito user import jobs and cloudformation.
+#
+# Latency and throttling can be injected per service:
+#   fake = FakeAws(latency=0.05, service_latency={"gamelift": 0.2},
+#                  throttle_probability=0.1, rate_limits={"cognito-idp": 10})
+#
+# usage:
+#   fake = FakeAws()
+#   fake.add_build("test1-build")
+#   backend = aws_backend.AwsBackend(backend_config, session=fake.session())
+#   backend.create_fleet(backend_config)
+
+import base64
+import builtins
+import datetime
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import types
+import uuid
+import zipfile
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.response import StreamingBody
+
+FAKE_ACCOUNT_ID = "123456789012"
+
+# the code each service uses to say "slow down"
+THROTTLING_ERRORS = {
+    "cognito-idp": ("TooManyRequestsException", 400),
+    "apigateway": ("TooManyRequestsException", 429),
+    "apigatewayv2": ("TooManyRequestsException", 429),
+    "lambda": ("TooManyRequestsException", 429),
+    "iam": ("Throttling", 400),
+    "sts": ("Throttling", 400),
+}
+
+THROTTLING_CODES = {code for code, status_code in THROTTLING_ERRORS.values()} | {"ThrottlingException"}
+
+# attempts per call, as in botocore's legacy retry mode
+MAX_ATTEMPTS = 5
+
+# a fleet steps through these, one step per describe call
+FLEET_ACTIVATION_STATUSES = ["NEW", "DOWNLOADING", "VALIDATING", "BUILDING", "ACTIVATING", "ACTIVE"]
+
+
+class FakeAwsError(Exception):
+    def __init__(self, code, message="", status_code=400):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status_code = status_code
+
+
+def make_id(prefix="", length=10):
+    return prefix + uuid.uuid4().hex[:length]
+
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+# return (items of the page starting at token, next token or None)
+def page_of(items, token, page_size, max_page_size):
+    start = int(token) if token else 0
+    page_size = min(int(page_size or max_page_size), max_page_size)
+    end = start + page_size
+    return items[start:end], (str(end) if end < len(items) else None)
+
+
+def camel_to_snake(name):
+    return "".join("_" + c.lower() if c.isupper() else c for c in name).lstrip("_")
+
+
+def with_token(response, token_key, token):
+    if token is not None:
+        response[token_key] = token
+    return response
+
+
+def count_items(parsed):
+    return sum(len(value) for value in parsed.values() if isinstance(value, list))
+
+
+def base64url(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii').rstrip("=")
+
+
+def decode_fake_token(token):
+    '''the claims of a token issued by FakeAws, or None'''
+    try:
+        payload = token.split(".")[1]
+        return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (IndexError, ValueError):
+        return None
+
+
+class FakeAws:
+    '''an in-memory account.  Requests are dispatched to <service>_<operation>
+    methods, e.g. gamelift_list_builds.
+
+    latency / service_latency: seconds added per call (service_latency overrides
+      latency for the services it names), plus item_latency per returned item.
+      Always added to simulated_time; with sleep=True the calls really wait.
+    throttle_probability: fraction of calls that fail with the service's
+      throttling error.
+    rate_limits: {service: calls per second}.  Calls beyond that within one
+      second of real time are throttled.
+    fleet_activation_steps: describe calls a new fleet takes to become ACTIVE'''
+    def __init__(self, region_name="us-west-2", latency=0.0, item_latency=0.0, service_latency=None,
+            sleep=False, throttle_probability=0.0, rate_limits=None, fleet_activation_steps=0, seed=None):
+        self.region_name = region_name
+        self.latency = latency
+        self.item_latency = item_latency
+        self.service_latency = service_latency or {}
+        self.sleep = sleep
+        self.throttle_probability = throttle_probability
+        self.rate_limits = rate_limits or {}
+        self.fleet_activation_steps = fleet_activation_steps
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.simulated_time = 0.0
+        self.calls = []
+        self.throttled_count = 0
+        self.recent_calls = {}
+
+        self.builds = {}
+        self.fleets = {}
+        self.fleet_events = {}
+        self.game_sessions = {}
+        self.player_sessions = {}
+        self.user_pools = {}
+        self.domains = {}
+        self.roles = {}
+        self.functions = {}
+        self.rest_apis = {}
+        self.http_apis = {}
+        self.tags = {}
+        self.loaded_handlers = {}
+        self.build_storage = {}
+        self.s3_objects = {}
+        self.multipart_uploads = {}
+
+    def session(self):
+        return FakeSession(self)
+
+    def reset_counters(self):
+        with self.lock:
+            self.simulated_time = 0.0
+            self.calls = []
+            self.throttled_count = 0
+
+    def call_counts(self):
+        '''{"service.Operation": count}'''
+        counts = {}
+        with self.lock:
+            for call in self.calls:
+                counts[call] = counts.get(call, 0) + 1
+        return counts
+
+    #
+    # seeding
+    #
+
+    def add_build(self, name, status="READY", version="", operating_system="WINDOWS_2016"):
+        build_id = make_id("build-")
+        arn = f"arn:aws:gamelift:{self.region_name}:{FAKE_ACCOUNT_ID}:build/{build_id}"
+        self.builds[build_id] = {
+            "BuildId": build_id,
+            "BuildArn": arn,
+            "Name": name,
+            "Version": version,
+            "Status": status,
+            "OperatingSystem": operating_system,
+            "CreationTime": now(),
+        }
+        return build_id
+
+    def add_fleet(self, name, build_id, status="ACTIVE"):
+        fleet_id = make_id("fleet-")
+        self.fleets[fleet_id] = {
+            "FleetId": fleet_id,
+            "FleetArn": f"arn:aws:gamelift:{self.region_name}:{FAKE_ACCOUNT_ID}:fleet/{fleet_id}",
+            "Name": name,
+            "BuildId": build_id,
+            "Status": status,
+            "InstanceType": "c5.large",
+            "CreationTime": now(),
+            "ActivationStep": len(FLEET_ACTIVATION_STATUSES) - 1,
+            # location -> capacity.  Remote locations activate along with the fleet
+            "Locations": {},
+        }
+        self._add_fleet_location(self.fleets[fleet_id], self.region_name, 1)
+        self.fleet_events[fleet_id] = []
+        self._add_fleet_event(fleet_id, "FLEET_CREATED", f"Fleet {fleet_id} created")
+        return fleet_id
+
+    def _add_fleet_location(self, fleet, location, desired=0):
+        fleet["Locations"][location] = {"DESIRED": desired, "MINIMUM": 0, "MAXIMUM": max(desired, 1)}
+
+    def _add_fleet_event(self, fleet_id, code, message):
+        self.fleet_events[fleet_id].append({
+            "EventId": make_id("event-", 16),
+            "ResourceId": fleet_id,
+            "EventCode": code,
+            "Message": message,
+            "EventTime": now(),
+        })
+
+    def add_user_pool(self, name):
+        pool_id = f"{self.region_name}_{make_id(length=9)}"
+        self.user_pools[pool_id] = {
+            "Id": pool_id,
+            "Name": name,
+            "Arn": f"arn:aws:cognito-idp:{self.region_name}:{FAKE_ACCOUNT_ID}:userpool/{pool_id}",
+            "CreationDate": now(),
+            "Clients": {},
+            "Users": {},
+        }
+        return pool_id
+
+    def add_user_pool_client(self, pool_id, name):
+        client_id = make_id(length=26)
+        self.user_pools[pool_id]["Clients"][client_id] = {
+            "ClientId": client_id, "ClientName": name, "UserPoolId": pool_id}
+        return client_id
+
+    def add_rest_api(self, name):
+        api_id = make_id(length=10)
+        self.rest_apis[api_id] = {
+            "id": api_id, "name": name, "createdDate": now(),
+            "Resources": {}, "Authorizers": {}, "Stages": {}}
+        self._add_rest_resource(self.rest_apis[api_id], None, "")
+        return api_id
+
+    def add_http_api(self, name):
+        api_id = make_id(length=10)
+        self.http_apis[api_id] = {
+            "ApiId": api_id, "Name": name, "ProtocolType": "HTTP", "CreatedDate": now(),
+            "Authorizers": {}, "Integrations": {}, "Routes": {}, "Stages": {}}
+        return api_id
+
+    #
+    # dispatch
+    #
+
+    def _service_latency(self, service_name):
+        return self.service_latency.get(service_name, self.latency)
+
+    def _is_throttled(self, service_name):
+        if self.throttle_probability and self.random.random() < self.throttle_probability:
+            return True
+        rate_limit = self.rate_limits.get(service_name)
+        if rate_limit:
+            current_time = time.monotonic()
+            recent = [t for t in self.recent_calls.get(service_name, []) if current_time - t < 1.0]
+            if len(recent) >= rate_limit:
+                self.recent_calls[service_name] = recent
+                return True
+            recent.append(current_time)
+            self.recent_calls[service_name] = recent
+        return False
+
+    def handle(self, service_name, operation_name, params):
+        '''return (status code, parsed response) for one request'''
+        method_name = f'{service_name.replace("-", "_")}_{camel_to_snake(operation_name)}'
+        with self.lock:
+            self.calls.append(f"{service_name}.{operation_name}")
+            try:
+                if self._is_throttled(service_name):
+                    self.throttled_count += 1
+                    code, status_code = THROTTLING_ERRORS.get(service_name, ("ThrottlingException", 400))
+                    raise FakeAwsError(code, "Rate exceeded", status_code)
+                method = getattr(self, method_name, None)
+                if method is None:
+                    raise FakeAwsError("UnsupportedOperation", f"{method_name} is not faked")
+                parsed = method(**params)
+                status_code = 200
+            except FakeAwsError as e:
+                parsed = {"Error": {"Code": e.code, "Message": e.message}}
+                status_code = e.status_code
+            latency = self._service_latency(service_name) + self.item_latency * count_items(parsed)
+            self.simulated_time += latency
+        if self.sleep and latency > 0:
+            time.sleep(latency)
+        return status_code, parsed
+
+    # the wait before a retry: 50ms doubling per attempt, jittered
+    def backoff(self, attempt):
+        with self.lock:
+            delay = self.random.random() * 0.05 * (2 ** attempt)
+            self.simulated_time += delay
+        if self.sleep:
+            time.sleep(delay)
+
+    def _tag(self, arn, tags):
+        if tags:
+            self.tags.setdefault(arn, {}).update(tags)
+
+    #
+    # gamelift
+    #
+
+    def _build(self, BuildId):
+        if BuildId not in self.builds:
+            raise FakeAwsError("NotFoundException", f"build {BuildId} not found")
+        return self.builds[BuildId]
+
+    def _fleet(self, FleetId):
+        if FleetId not in self.fleets:
+            raise FakeAwsError("NotFoundException", f"fleet {FleetId} not found")
+        return self.fleets[FleetId]
+
+    def _fleet_attributes(self, fleet):
+        # each describe moves an activating fleet one step closer to ACTIVE
+        if fleet["Status"] in FLEET_ACTIVATION_STATUSES and fleet["Status"] != "ACTIVE":
+            fleet["ActivationStep"] += 1
+            steps = max(self.fleet_activation_steps, 1)
+            index = min(len(FLEET_ACTIVATION_STATUSES) - 1,
+                fleet["ActivationStep"] * (len(FLEET_ACTIVATION_STATUSES) - 1) // steps)
+            if FLEET_ACTIVATION_STATUSES[index] != fleet["Status"]:
+                fleet["Status"] = FLEET_ACTIVATION_STATUSES[index]
+                self._add_fleet_event(fleet["FleetId"], "FLEET_STATE_" + fleet["Status"],
+                    f'Fleet {fleet["FleetId"]} changed state to {fleet["Status"]}')
+        return self._public_fleet(fleet)
+
+    def _public_fleet(self, fleet):
+        return {key: value for key, value in fleet.items() if key not in ("ActivationStep", "Locations")}
+
+    def _fleet_location(self, fleet, location):
+        if location not in fleet["Locations"]:
+            raise FakeAwsError("InvalidRequestException", f'fleet {fleet["FleetId"]} has no location {location}')
+        return fleet["Locations"][location]
+
+    def gamelift_list_builds(self, Status=None, Limit=None, NextToken=None):
+        builds = [build for build in self.builds.values() if Status is None or build["Status"] == Status]
+        page, next_token = page_of(builds, NextToken, Limit, 100)
+        return with_token({"Builds": page}, "NextToken", next_token)
+
+    # the build waits in INITIALIZED until its zip is uploaded to StorageLocation
+    def gamelift_create_build(self, Name, Version="", OperatingSystem="WINDOWS_2016", Tags=None, **kwargs):
+        build_id = self.add_build(Name, "INITIALIZED", Version, OperatingSystem)
+        build = self.builds[build_id]
+        self._tag(build["BuildArn"], {tag["Key"]: tag["Value"] for tag in Tags or []})
+        location = {
+            "Bucket": f"prod-gamescale-builds-{self.region_name}",
+            "Key": f"{FAKE_ACCOUNT_ID}/{build_id}/{make_id(length=32)}",
+            "RoleArn": f"arn:aws:iam::{FAKE_ACCOUNT_ID}:role/GameLiftBuildUpload",
+        }
+        self.build_storage[(location["Bucket"], location["Key"])] = build_id
+        return {
+            "Build": dict(build),
+            "UploadCredentials": {"AccessKeyId": "fake", "SecretAccessKey": "fake", "SessionToken": "fake"},
+            "StorageLocation": location,
+        }
+
+    def gamelift_describe_build(self, BuildId):
+        return {"Build": self._build(BuildId)}
+
+    def gamelift_delete_build(self, BuildId):
+        self.tags.pop(self._build(BuildId)["BuildArn"], None)
+        del self.builds[BuildId]
+        return {}
+
+    def gamelift_tag_resource(self, ResourceARN, Tags):
+        self._tag(ResourceARN, {tag["Key"]: tag["Value"] for tag in Tags})
+        return {}
+
+    def gamelift_create_fleet(self, Name, BuildId=None, Tags=None, EC2InstanceType="c5.large", Locations=None, **kwargs):
+        self._build(BuildId)
+        fleet_id = self.add_fleet(Name, BuildId)
+        fleet = self.fleets[fleet_id]
+        fleet["InstanceType"] = EC2InstanceType
+        for location in Locations or []:
+            self._add_fleet_location(fleet, location["Location"], 1)
+        if self.fleet_activation_steps:
+            fleet["Status"] = "NEW"
+            fleet["ActivationStep"] = 0
+        self._tag(fleet["FleetArn"], {tag["Key"]: tag["Value"] for tag in Tags or []})
+        return {"FleetAttributes": self._public_fleet(fleet), "LocationStates": [
+            {"Location": location, "Status": fleet["Status"]} for location in fleet["Locations"]]}
+
+    def gamelift_create_fleet_locations(self, FleetId, Locations):
+        fleet = self._fleet(FleetId)
+        for location in Locations:
+            if location["Location"] not in fleet["Locations"]:
+                self._add_fleet_location(fleet, location["Location"], 1)
+        return {"FleetId": FleetId, "FleetArn": fleet["FleetArn"], "LocationStates": [
+            {"Location": location["Location"], "Status": fleet["Status"]} for location in Locations]}
+
+    def gamelift_describe_fleet_location_attributes(self, FleetId, Locations=None, Limit=None, NextToken=None):
+        fleet = self._fleet(FleetId)
+        status = self._fleet_attributes(fleet)["Status"]
+        locations = [location for location in fleet["Locations"] if Locations is None or location in Locations]
+        page, next_token = page_of(locations, NextToken, Limit, 100)
+        return with_token({"FleetId": FleetId, "FleetArn": fleet["FleetArn"], "LocationAttributes": [
+            {"LocationState": {"Location": location, "Status": status}, "StoppedActions": [], "UpdateStatus": "PENDING_UPDATE"}
+            for location in page]}, "NextToken", next_token)
+
+    # instances come up as soon as they are asked for
+    def gamelift_describe_fleet_location_capacity(self, FleetId, Location):
+        fleet = self._fleet(FleetId)
+        capacity = self._fleet_location(fleet, Location)
+        active = capacity["DESIRED"] if fleet["Status"] == "ACTIVE" else 0
+        return {"FleetCapacity": {
+            "FleetId": FleetId,
+            "FleetArn": fleet["FleetArn"],
+            "InstanceType": fleet["InstanceType"],
+            "Location": Location,
+            "InstanceCounts": dict(capacity, PENDING=capacity["DESIRED"] - active, ACTIVE=active, IDLE=active, TERMINATING=0),
+        }}
+
+    def gamelift_update_fleet_capacity(self, FleetId, DesiredInstances=None, MinSize=None, MaxSize=None, Location=None, **kwargs):
+        fleet = self._fleet(FleetId)
+        if fleet["Status"] != "ACTIVE":
+            raise FakeAwsError("InvalidFleetStatusException", f'fleet {FleetId} is {fleet["Status"]}')
+        capacity = self._fleet_location(fleet, Location or self.region_name)
+        updated = dict(capacity)
+        for key, value in [("DESIRED", DesiredInstances), ("MINIMUM", MinSize), ("MAXIMUM", MaxSize)]:
+            if value is not None:
+                updated[key] = value
+        if not updated["MINIMUM"] <= updated["DESIRED"] <= updated["MAXIMUM"]:
+            raise FakeAwsError("InvalidRequestException", "desired instances must be between min and max")
+        capacity.update(updated)
+        return {"FleetId": FleetId, "FleetArn": fleet["FleetArn"], "Location": Location or self.region_name}
+
+    def gamelift_list_fleets(self, BuildId=None, Limit=None, NextToken=None):
+        fleet_ids = [fleet["FleetId"] for fleet in self.fleets.values()
+            if BuildId is None or fleet["BuildId"] == BuildId]
+        page, next_token = page_of(fleet_ids, NextToken, Limit, 100)
+        return with_token({"FleetIds": page}, "NextToken", next_token)
+
+    def gamelift_describe_fleet_attributes(self, FleetIds=None, Limit=None, NextToken=None):
+        if FleetIds:
+            return {"FleetAttributes": [self._fleet_attributes(self.fleets[fleet_id])
+                for fleet_id in FleetIds if fleet_id in self.fleets]}
+        page, next_token = page_of(list(self.fleets.values()), NextToken, Limit, 50)
+        return with_token({"FleetAttributes": [self._fleet_attributes(fleet) for fleet in page]}, "NextToken", next_token)
+
+    # oldest first.  Like describe_fleet_attributes, each call moves an
+    # activating fleet along
+    def gamelift_describe_fleet_events(self, FleetId, StartTime=None, EndTime=None, Limit=None, NextToken=None):
+        self._fleet_attributes(self._fleet(FleetId))
+        events = [event for event in self.fleet_events[FleetId]
+            if (StartTime is None or event["EventTime"] >= StartTime) and (EndTime is None or event["EventTime"] <= EndTime)]
+        page, next_token = page_of(events, NextToken, Limit, 100)
+        return with_token({"Events": page}, "NextToken", next_token)
+
+    def gamelift_delete_fleet(self, FleetId):
+        self.tags.pop(self._fleet(FleetId)["FleetArn"], None)
+        del self.fleets[FleetId]
+        self.fleet_events.pop(FleetId, None)
+        return {}
+
+    def gamelift_create_game_session(self, FleetId, MaximumPlayerSessionCount, Location=None, **kwargs):
+        fleet = self._fleet(FleetId)
+        if fleet["Status"] != "ACTIVE":
+            raise FakeAwsError("InvalidFleetStatusException", f'fleet {FleetId} is {fleet["Status"]}')
+        location = Location or self.region_name
+        self._fleet_location(fleet, location)
+        game_session_id = f'arn:aws:gamelift:{self.region_name}::gamesession/{FleetId}/{make_id("gsess-")}'
+        game_session = {
+            "GameSessionId": game_session_id,
+            "FleetId": FleetId,
+            "Location": location,
+            "CreationTime": now(),
+            "CurrentPlayerSessionCount": 0,
+            "MaximumPlayerSessionCount": MaximumPlayerSessionCount,
+            "Status": "ACTIVATING",
+            "IpAddress": "127.0.0.1",
+            "DnsName": "localhost",
+            "Port": 7777,
+            "PlayerSessionCreationPolicy": "ACCEPT_ALL",
+        }
+        self.game_sessions[game_session_id] = game_session
+        return {"GameSession": dict(game_session)}
+
+    def _game_session(self, GameSessionId):
+        if GameSessionId not in self.game_sessions:
+            raise FakeAwsError("NotFoundException", f"game session {GameSessionId} not found")
+        return self.game_sessions[GameSessionId]
+
+    def gamelift_describe_game_session_details(self, GameSessionId=None, FleetId=None, **kwargs):
+        if GameSessionId:
+            game_sessions = [self._game_session(GameSessionId)]
+        else:
+            game_sessions = [session for session in self.game_sessions.values() if session["FleetId"] == FleetId]
+        for game_session in game_sessions:
+            # a new game session is activated by the first describe
+            if game_session["Status"] == "ACTIVATING":
+                game_session["Status"] = "ACTIVE"
+        return {"GameSessionDetails": [
+            {"GameSession": dict(game_session), "ProtectionPolicy": "NoProtection"}
+            for game_session in game_sessions]}
+
+    # only understands the hasAvailablePlayerSessions=true filter the lambda uses
+    def gamelift_search_game_sessions(self, FleetId=None, FilterExpression="", Location=None, Limit=None, NextToken=None, **kwargs):
+        self._fleet(FleetId)
+        available_only = "hasAvailablePlayerSessions=true" in FilterExpression.replace(" ", "")
+        game_sessions = [dict(session) for session in self.game_sessions.values()
+            if session["FleetId"] == FleetId and session["Status"] == "ACTIVE" and
+                (Location is None or session["Location"] == Location) and
+                (not available_only or session["CurrentPlayerSessionCount"] < session["MaximumPlayerSessionCount"])]
+        page, next_token = page_of(game_sessions, NextToken, Limit, 20)
+        return with_token({"GameSessions": page}, "NextToken", next_token)
+
+    def gamelift_create_player_session(self, GameSessionId, PlayerId, **kwargs):
+        game_session = self._game_session(GameSessionId)
+        if game_session["Status"] != "ACTIVE":
+            raise FakeAwsError("InvalidGameSessionStatusException", f'game session is {game_session["Status"]}')
+        if game_session["CurrentPlayerSessionCount"] >= game_session["MaximumPlayerSessionCount"]:
+            raise FakeAwsError("GameSessionFullException", "game session is full")
+        game_session["CurrentPlayerSessionCount"] += 1
+        player_session_id = make_id("psess-", 32)
+        player_session = {
+            "PlayerSessionId": player_session_id,
+            "PlayerId": PlayerId,
+            "GameSessionId": GameSessionId,
+            "FleetId": game_session["FleetId"],
+            "CreationTime": now(),
+            "Status": "RESERVED",
+            "IpAddress": game_session["IpAddress"],
+            "DnsName": game_session["DnsName"],
+            "Port": game_session["Port"],
+        }
+        self.player_sessions[player_session_id] = player_session
+        return {"PlayerSession": dict(player_session)}
+
+    #
+    # s3 (only what build uploads use)
+    #
+
+    def _store_object(self, bucket, key, size):
+        self.s3_objects[(bucket, key)] = size
+        build = self.builds.get(self.build_storage.get((bucket, key)))
+        if build is not None:
+            build["Status"] = "READY"
+            build["SizeOnDisk"] = size
+
+    def _read_body(self, Body):
+        # s3transfer only counts bytes (for upload_file callbacks) once the
+        # request is being sent, which the fake never gets to
+        if hasattr(Body, "signal_transferring"):
+            Body.signal_transferring()
+        data = Body if isinstance(Body, bytes) else Body.read()
+        return data, '"' + hashlib.md5(data).hexdigest() + '"'
+
+    def s3_put_object(self, Bucket, Key, Body=b"", **kwargs):
+        data, etag = self._read_body(Body)
+        self._store_object(Bucket, Key, len(data))
+        return {"ETag": etag}
+
+    def s3_create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = make_id("upload-", 32)
+        self.multipart_uploads[upload_id] = {"Bucket": Bucket, "Key": Key, "Parts": {}}
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def s3_upload_part(self, Bucket, Key, UploadId, PartNumber, Body=b"", **kwargs):
+        if UploadId not in self.multipart_uploads:
+            raise FakeAwsError("NoSuchUpload", "The specified upload does not exist.", 404)
+        data, etag = self._read_body(Body)
+        self.multipart_uploads[UploadId]["Parts"][PartNumber] = len(data)
+        return {"ETag": etag}
+
+    def s3_complete_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        if UploadId not in self.multipart_uploads:
+            raise FakeAwsError("NoSuchUpload", "The specified upload does not exist.", 404)
+        upload = self.multipart_uploads.pop(UploadId)
+        self._store_object(Bucket, Key, sum(upload["Parts"].values()))
+        return {"Bucket": Bucket, "Key": Key, "ETag": '"' + make_id(length=32) + '-1"'}
+
+    def s3_abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self.multipart_uploads.pop(UploadId, None)
+        return {}
+
+    #
+    # cognito
+    #
+
+    def _user_pool(self, UserPoolId):
+        if UserPoolId not in self.user_pools:
+            raise FakeAwsError("ResourceNotFoundException", f"user pool {UserPoolId} not found")
+        return self.user_pools[UserPoolId]
+
+    def _user(self, UserPoolId, Username):
+        users = self._user_pool(UserPoolId)["Users"]
+        if Username not in users:
+            raise FakeAwsError("UserNotFoundException", "User does not exist.")
+        return users[Username]
+
+    def cognito_idp_create_user_pool(self, PoolName, UserPoolTags=None, **kwargs):
+        pool_id = self.add_user_pool(PoolName)
+        self._tag(self.user_pools[pool_id]["Arn"], UserPoolTags)
+        return self.cognito_idp_describe_user_pool(pool_id)
+
+    def cognito_idp_list_user_pools(self, MaxResults, NextToken=None):
+        pools = [{"Id": pool["Id"], "Name": pool["Name"]} for pool in self.user_pools.values()]
+        page, next_token = page_of(pools, NextToken, MaxResults, 60)
+        return with_token({"UserPools": page}, "NextToken", next_token)
+
+    def cognito_idp_describe_user_pool(self, UserPoolId):
+        pool = self._user_pool(UserPoolId)
+        return {"UserPool": {key: value for key, value in pool.items() if key not in ("Clients", "Users")}}
+
+    def cognito_idp_update_user_pool(self, UserPoolId, **kwargs):
+        self._user_pool(UserPoolId).update(kwargs)
+        return {}
+
+    def cognito_idp_delete_user_pool(self, UserPoolId):
+        pool = self._user_pool(UserPoolId)
+        if "Domain" in pool:
+            raise FakeAwsError("InvalidParameterException", "delete the user pool domain first")
+        self.tags.pop(pool["Arn"], None)
+        del self.user_pools[UserPoolId]
+        return {}
+
+    def cognito_idp_create_user_pool_domain(self, Domain, UserPoolId, **kwargs):
+        pool = self._user_pool(UserPoolId)
+        if Domain in self.domains:
+            raise FakeAwsError("InvalidParameterException", f"domain {Domain} already exists")
+        self.domains[Domain] = UserPoolId
+        pool["Domain"] = Domain
+        return {}
+
+    def cognito_idp_delete_user_pool_domain(self, Domain, UserPoolId):
+        pool = self._user_pool(UserPoolId)
+        self.domains.pop(Domain, None)
+        pool.pop("Domain", None)
+        return {}
+
+    def cognito_idp_create_user_pool_client(self, UserPoolId, ClientName, **kwargs):
+        self._user_pool(UserPoolId)
+        client_id = self.add_user_pool_client(UserPoolId, ClientName)
+        client = self.user_pools[UserPoolId]["Clients"][client_id]
+        client.update(kwargs)
+        return {"UserPoolClient": dict(client)}
+
+    def cognito_idp_list_user_pool_clients(self, UserPoolId, MaxResults=None, NextToken=None):
+        clients = [{"ClientId": client["ClientId"], "ClientName": client["ClientName"], "UserPoolId": UserPoolId}
+            for client in self._user_pool(UserPoolId)["Clients"].values()]
+        page, next_token = page_of(clients, NextToken, MaxResults, 60)
+        return with_token({"UserPoolClients": page}, "NextToken", next_token)
+
+    def cognito_idp_describe_user_pool_client(self, UserPoolId, ClientId):
+        clients = self._user_pool(UserPoolId)["Clients"]
+        if ClientId not in clients:
+            raise FakeAwsError("ResourceNotFoundException", f"client {ClientId} not found")
+        return {"UserPoolClient": clients[ClientId]}
+
+    def cognito_idp_admin_create_user(self, UserPoolId, Username, TemporaryPassword=None, UserAttributes=None, **kwargs):
+        users = self._user_pool(UserPoolId)["Users"]
+        if Username in users:
+            raise FakeAwsError("UsernameExistsException", "User account already exists")
+        users[Username] = {
+            "Username": Username,
+            "Attributes": UserAttributes or [],
+            "Password": TemporaryPassword,
+            "UserStatus": "FORCE_CHANGE_PASSWORD",
+            "UserCreateDate": now(),
+        }
+        return {"User": {key: value for key, value in users[Username].items() if key != "Password"}}
+
+    def cognito_idp_admin_set_user_password(self, UserPoolId, Username, Password, Permanent=False):
+        user = self._user(UserPoolId, Username)
+        user["Password"] = Password
+        user["UserStatus"] = "CONFIRMED" if Permanent else "FORCE_CHANGE_PASSWORD"
+        return {}
+
+    def cognito_idp_initiate_auth(self, AuthFlow, ClientId, AuthParameters=None, **kwargs):
+        if AuthFlow != "USER_PASSWORD_AUTH":
+            raise FakeAwsError("InvalidParameterException", f"{AuthFlow} is not faked")
+        pool = next((pool for pool in self.user_pools.values() if ClientId in pool["Clients"]), None)
+        if pool is None:
+            raise FakeAwsError("ResourceNotFoundException", f"client {ClientId} not found")
+        username = (AuthParameters or {}).get("USERNAME", "")
+        password = (AuthParameters or {}).get("PASSWORD", "")
+        if not username or not password:
+            raise FakeAwsError("InvalidParameterException", "Missing required parameter USERNAME or PASSWORD")
+        user = pool["Users"].get(username)
+        if user is None:
+            raise FakeAwsError("UserNotFoundException", "User does not exist.")
+        if user["Password"] != password:
+            raise FakeAwsError("NotAuthorizedException", "Incorrect username or password.")
+        expires_in = 3600
+        claims = {
+            "sub": str(uuid.uuid5(uuid.NAMESPACE_URL, pool["Id"] + "/" + username)),
+            "aud": ClientId,
+            "iss": f'https://cognito-idp.{self.region_name}.amazonaws.com/{pool["Id"]}',
+            "cognito:username": username,
+            "token_use": "id",
+            "exp": int(time.time()) + expires_in,
+        }
+        header = base64url({"alg": "none", "typ": "JWT"})
+        return {"AuthenticationResult": {
+            "IdToken": f"{header}.{base64url(claims)}.fake",
+            "AccessToken": f'{header}.{base64url(dict(claims, token_use="access"))}.fake',
+            "RefreshToken": make_id(length=32),
+            "ExpiresIn": expires_in,
+            "TokenType": "Bearer",
+        }}
+
+    #
+    # iam
+    #
+
+    def _role(self, RoleName):
+        if RoleName not in self.roles:
+            raise FakeAwsError("NoSuchEntity", f"The role with name {RoleName} cannot be found.", 404)
+        return self.roles[RoleName]
+
+    def iam_get_role(self, RoleName):
+        role = self._role(RoleName)
+        return {"Role": {key: value for key, value in role.items() if key != "Policies"}}
+
+    def iam_create_role(self, RoleName, AssumeRolePolicyDocument, Tags=None, **kwargs):
+        if RoleName in self.roles:
+            raise FakeAwsError("EntityAlreadyExists", f"Role with name {RoleName} already exists.", 409)
+        arn = f"arn:aws:iam::{FAKE_ACCOUNT_ID}:role/{RoleName}"
+        self.roles[RoleName] = {
+            "RoleName": RoleName,
+            "RoleId": make_id("AROA", 17).upper(),
+            "Arn": arn,
+            "Path": "/",
+            "CreateDate": now(),
+            "AssumeRolePolicyDocument": AssumeRolePolicyDocument,
+            "Policies": {},
+        }
+        self._tag(arn, {tag["Key"]: tag["Value"] for tag in Tags or []})
+        return self.iam_get_role(RoleName)
+
+    def iam_put_role_policy(self, RoleName, PolicyName, PolicyDocument):
+        self._role(RoleName)["Policies"][PolicyName] = PolicyDocument
+        return {}
+
+    # the document as put.  botocore url-decodes and parses it, as it does AWS's
+    def iam_get_role_policy(self, RoleName, PolicyName):
+        policies = self._role(RoleName)["Policies"]
+        if PolicyName not in policies:
+            raise FakeAwsError("NoSuchEntity", f"The role policy with name {PolicyName} cannot be found.", 404)
+        return {"RoleName": RoleName, "PolicyName": PolicyName, "PolicyDocument": policies[PolicyName]}
+
+    def iam_delete_role_policy(self, RoleName, PolicyName):
+        policies = self._role(RoleName)["Policies"]
+        if PolicyName not in policies:
+            raise FakeAwsError("NoSuchEntity", f"The role policy with name {PolicyName} cannot be found.", 404)
+        del policies[PolicyName]
+        return {}
+
+    def iam_delete_role(self, RoleName):
+        if self._role(RoleName)["Policies"]:
+            raise FakeAwsError("DeleteConflict", "Cannot delete entity, must delete policies first.", 409)
+        self.tags.pop(self.roles[RoleName]["Arn"], None)
+        del self.roles[RoleName]
+        return {}
+
+    #
+    # sts
+    #
+
+    def sts_get_caller_identity(self):
+        return {
+            "Account": FAKE_ACCOUNT_ID,
+            "UserId": "AIDAFAKEFAKEFAKEFAKE",
+            "Arn": f"arn:aws:iam::{FAKE_ACCOUNT_ID}:user/fake",
+        }
+
+    #
+    # lambda
+    #
+
+    def _function(self, FunctionName):
+        # accepts a name or an arn
+        name = FunctionName.split(":")[-1] if FunctionName.startswith("arn:") else FunctionName
+        if name not in self.functions:
+            raise FakeAwsError("ResourceNotFoundException", f"Function not found: {FunctionName}", 404)
+        return self.functions[name]
+
+    def _function_configuration(self, function):
+        return {key: value for key, value in function.items() if key not in ("ZipFile", "Policy")}
+
+    def lambda_create_function(self, FunctionName, Role, Code, Handler, Runtime=None, Tags=None, **kwargs):
+        if FunctionName in self.functions:
+            raise FakeAwsError("ResourceConflictException", f"Function already exist: {FunctionName}", 409)
+        if Role.split("/")[-1] not in self.roles:
+            raise FakeAwsError("InvalidParameterValueException", "The role defined for the function cannot be assumed by Lambda.")
+        arn = f"arn:aws:lambda:{self.region_name}:{FAKE_ACCOUNT_ID}:function:{FunctionName}"
+        self.functions[FunctionName] = {
+            "FunctionName": FunctionName,
+            "FunctionArn": arn,
+            "Runtime": Runtime,
+            "Role": Role,
+            "Handler": Handler,
+            "Version": "1",
+            "State": "Active",
+            "LastModified": now().isoformat(),
+            "Policy": {},
+        }
+        self._set_function_code(self.functions[FunctionName], Code["ZipFile"])
+        self._tag(arn, Tags)
+        return self._function_configuration(self.functions[FunctionName])
+
+    def _set_function_code(self, function, zip_file):
+        function["ZipFile"] = zip_file
+        function["CodeSize"] = len(zip_file)
+        function["CodeSha256"] = base64.b64encode(hashlib.sha256(zip_file).digest()).decode('ascii')
+
+    def lambda_get_function(self, FunctionName, **kwargs):
+        function = self._function(FunctionName)
+        return {"Configuration": self._function_configuration(function), "Code": {"RepositoryType": "S3"}}
+
+    def lambda_update_function_code(self, FunctionName, ZipFile, Publish=False, **kwargs):
+        function = self._function(FunctionName)
+        self._set_function_code(function, ZipFile)
+        if Publish:
+            function["Version"] = str(int(function["Version"]) + 1)
+        return self._function_configuration(function)
+
+    def lambda_delete_function(self, FunctionName, **kwargs):
+        function = self._function(FunctionName)
+        self.tags.pop(function["FunctionArn"], None)
+        del self.functions[function["FunctionName"]]
+        return {}
+
+    def lambda_add_permission(self, FunctionName, StatementId, **kwargs):
+        policy = self._function(FunctionName)["Policy"]
+        if StatementId in policy:
+            raise FakeAwsError("ResourceConflictException", f"The statement id ({StatementId}) provided already exists.", 409)
+        policy[StatementId] = kwargs
+        return {"Statement": json.dumps(dict(kwargs, Sid=StatementId))}
+
+    def lambda_invoke(self, FunctionName, Payload=b"{}", **kwargs):
+        result = self.invoke(FunctionName, json.loads(Payload or b"{}"))
+        data = json.dumps(result, default=str).encode('utf-8') if not isinstance(result, bytes) else result
+        return {"StatusCode": 200, "Payload": StreamingBody(io.BytesIO(data), len(data))}
+
+    def invoke(self, function_name, event):
+        '''run a deployed function's handler in-process, against this account'''
+        with self.lock:
+            function = self._function(function_name)
+            key = (function["FunctionName"], function["CodeSha256"])
+            if key not in self.loaded_handlers:
+                module_name, handler_name = function["Handler"].rsplit(".", 1)
+                with zipfile.ZipFile(io.BytesIO(function["ZipFile"])) as code_zip:
+                    source = code_zip.read(module_name + ".py").decode('utf-8')
+                module = load_handler_module(self, source, module_name)
+                self.loaded_handlers[key] = getattr(module, handler_name)
+            handler = self.loaded_handlers[key]
+        return handler(event, None)
+
+    #
+    # api gateway (rest)
+    #
+
+    def _rest_api(self, restApiId):
+        if restApiId not in self.rest_apis:
+            raise FakeAwsError("NotFoundException", "Invalid API identifier specified", 404)
+        return self.rest_apis[restApiId]
+
+    def _rest_api_summary(self, api):
+        return {key: value for key, value in api.items() if key not in ("Resources", "Authorizers", "Stages")}
+
+    def _add_rest_resource(self, api, parent_id, path_part):
+        resource_id = make_id(length=6)
+        parent_path = api["Resources"][parent_id]["path"] if parent_id else ""
+        path = "/" if parent_id is None else (parent_path.rstrip("/") + "/" + path_part)
+        api["Resources"][resource_id] = {"id": resource_id, "parentId": parent_id, "pathPart": path_part,
+            "path": path, "resourceMethods": {}}
+        return api["Resources"][resource_id]
+
+    def apigateway_create_rest_api(self, name, tags=None, **kwargs):
+        api_id = self.add_rest_api(name)
+        self._tag(f"arn:aws:apigateway:{self.region_name}::/restapis/{api_id}", tags)
+        return self._rest_api_summary(self.rest_apis[api_id])
+
+    def apigateway_get_rest_apis(self, limit=None, position=None):
+        apis = [self._rest_api_summary(api) for api in self.rest_apis.values()]
+        page, next_position = page_of(apis, position, limit, 500)
+        return with_token({"items": page}, "position", next_position)
+
+    def apigateway_get_rest_api(self, restApiId):
+        return self._rest_api_summary(self._rest_api(restApiId))
+
+    def apigateway_delete_rest_api(self, restApiId):
+        api = self._rest_api(restApiId)
+        self.tags.pop(f"arn:aws:apigateway:{self.region_name}::/restapis/{restApiId}", None)
+        del self.rest_apis[api["id"]]
+        return {}
+
+    def apigateway_tag_resource(self, resourceArn, tags):
+        self._tag(resourceArn, tags)
+        return {}
+
+    def apigateway_get_resources(self, restApiId, **kwargs):
+        api = self._rest_api(restApiId)
+        return {"items": [dict(resource) for resource in api["Resources"].values()]}
+
+    def apigateway_create_resource(self, restApiId, parentId, pathPart):
+        api = self._rest_api(restApiId)
+        if parentId not in api["Resources"]:
+            raise FakeAwsError("NotFoundException", "Invalid Resource identifier specified", 404)
+        return dict(self._add_rest_resource(api, parentId, pathPart))
+
+    def _rest_method(self, restApiId, resourceId, httpMethod):
+        api = self._rest_api(restApiId)
+        if resourceId not in api["Resources"]:
+            raise FakeAwsError("NotFoundException", "Invalid Resource identifier specified", 404)
+        return api["Resources"][resourceId]["resourceMethods"].setdefault(httpMethod, {"httpMethod": httpMethod})
+
+    def apigateway_put_method(self, restApiId, resourceId, httpMethod, authorizationType, authorizerId=None, **kwargs):
+        method = self._rest_method(restApiId, resourceId, httpMethod)
+        method.update(authorizationType=authorizationType, authorizerId=authorizerId)
+        return dict(method)
+
+    def apigateway_put_integration(self, restApiId, resourceId, httpMethod, type, uri=None, **kwargs):
+        method = self._rest_method(restApiId, resourceId, httpMethod)
+        method["methodIntegration"] = {"type": type, "uri": uri}
+        return dict(method["methodIntegration"])
+
+    def apigateway_put_integration_response(self, restApiId, resourceId, httpMethod, statusCode, **kwargs):
+        self._rest_method(restApiId, resourceId, httpMethod)
+        return {"statusCode": statusCode}
+
+    def apigateway_put_method_response(self, restApiId, resourceId, httpMethod, statusCode, **kwargs):
+        self._rest_method(restApiId, resourceId, httpMethod)
+        return {"statusCode": statusCode}
+
+    def apigateway_create_authorizer(self, restApiId, name, type, providerARNs=None, authorizerResultTtlInSeconds=300, **kwargs):
+        api = self._rest_api(restApiId)
+        authorizer_id = make_id(length=6)
+        api["Authorizers"][authorizer_id] = {"id": authorizer_id, "name": name, "type": type,
+            "providerARNs": providerARNs or [], "authorizerResultTtlInSeconds": authorizerResultTtlInSeconds}
+        return dict(api["Authorizers"][authorizer_id])
+
+    def apigateway_get_authorizers(self, restApiId, **kwargs):
+        return {"items": [dict(authorizer) for authorizer in self._rest_api(restApiId)["Authorizers"].values()]}
+
+    def apigateway_update_authorizer(self, restApiId, authorizerId, patchOperations=None):
+        authorizer = self._rest_api(restApiId)["Authorizers"].get(authorizerId)
+        if authorizer is None:
+            raise FakeAwsError("NotFoundException", "Invalid Authorizer identifier specified", 404)
+        for operation in patchOperations or []:
+            if operation["path"] == "/authorizerResultTtlInSeconds":
+                authorizer["authorizerResultTtlInSeconds"] = int(operation["value"])
+        return dict(authorizer)
+
+    def apigateway_create_deployment(self, restApiId, stageName=None, cacheClusterEnabled=False, cacheClusterSize=None, **kwargs):
+        api = self._rest_api(restApiId)
+        deployment_id = make_id(length=6)
+        if stageName:
+            stage = api["Stages"].setdefault(stageName, {"stageName": stageName, "methodSettings": {}})
+            stage.update(deploymentId=deployment_id, cacheClusterEnabled=cacheClusterEnabled)
+            if cacheClusterSize:
+                stage["cacheClusterSize"] = cacheClusterSize
+        return {"id": deployment_id, "createdDate": now()}
+
+    def _rest_stage(self, restApiId, stageName):
+        stage = self._rest_api(restApiId)["Stages"].get(stageName)
+        if stage is None:
+            raise FakeAwsError("NotFoundException", "Invalid Stage identifier specified", 404)
+        return stage
+
+    def apigateway_get_stage(self, restApiId, stageName):
+        return json.loads(json.dumps(self._rest_stage(restApiId, stageName)))
+
+    # understands the /<resource>/<method>/<setting> paths _apply_rest_api_stage_settings uses
+    def apigateway_update_stage(self, restApiId, stageName, patchOperations=None):
+        stage = self._rest_stage(restApiId, stageName)
+        settings_keys = {
+            "throttling/rateLimit": ("throttlingRateLimit", float),
+            "throttling/burstLimit": ("throttlingBurstLimit", int),
+            "caching/enabled": ("cachingEnabled", lambda value: value == "true"),
+            "caching/ttlInSeconds": ("cacheTtlInSeconds", int),
+        }
+        for operation in patchOperations or []:
+            parts = operation["path"].strip("/").split("/")
+            if len(parts) == 4 and "/".join(parts[2:]) in settings_keys:
+                key, convert = settings_keys["/".join(parts[2:])]
+                stage["methodSettings"].setdefault(f"{parts[0]}/{parts[1]}", {})[key] = convert(operation["value"])
+        return self.apigateway_get_stage(restApiId, stageName)
+
+    # build resources, methods and the cognito authorizer from an OpenAPI body
+    def _apply_openapi(self, api, body):
+        definition = json.loads(body)
+        api["Resources"] = {}
+        api["Authorizers"] = {}
+        root = self._add_rest_resource(api, None, "")
+        authorizer_ids = {}
+        for name, scheme in definition.get("components", {}).get("securitySchemes", {}).items():
+            authorizer = scheme.get("x-amazon-apigateway-authorizer", {})
+            created = self.apigateway_create_authorizer(api["id"], name, "COGNITO_USER_POOLS",
+                authorizer.get("providerARNs"), authorizer.get("authorizerResultTtlInSeconds", 300))
+            authorizer_ids[name] = created["id"]
+        for path, operations in definition.get("paths", {}).items():
+            resource = self._add_rest_resource(api, root["id"], path.strip("/"))
+            for http_method, operation in operations.items():
+                security = [name for requirement in operation.get("security", []) for name in requirement]
+                integration = operation.get("x-amazon-apigateway-integration", {})
+                resource["resourceMethods"][http_method.upper()] = {
+                    "httpMethod": http_method.upper(),
+                    "authorizationType": "COGNITO_USER_POOLS" if security else "NONE",
+                    "authorizerId": authorizer_ids.get(security[0]) if security else None,
+                    "methodIntegration": {"type": integration.get("type", "").upper(), "uri": integration.get("uri")},
+                }
+
+    def apigateway_import_rest_api(self, body, **kwargs):
+        definition = json.loads(body)
+        api_id = self.add_rest_api(definition.get("info", {}).get("title", "imported"))
+        self._apply_openapi(self.rest_apis[api_id], body)
+        return self._rest_api_summary(self.rest_apis[api_id])
+
+    def apigateway_put_rest_api(self, restApiId, body, **kwargs):
+        api = self._rest_api(restApiId)
+        self._apply_openapi(api, body)
+        return self._rest_api_summary(api)
+
+    #
+    # api gateway (http)
+    #
+
+    def _http_api(self, ApiId):
+        if ApiId not in self.http_apis:
+            raise FakeAwsError("NotFoundException", f"Invalid API identifier specified {ApiId}", 404)
+        return self.http_apis[ApiId]
+
+    def _http_api_summary(self, api):
+        return {key: value for key, value in api.items() if key not in ("Authorizers", "Integrations", "Routes", "Stages")}
+
+    def apigatewayv2_create_api(self, Name, ProtocolType, Tags=None, **kwargs):
+        api_id = self.add_http_api(Name)
+        self._tag(f"arn:aws:apigateway:{self.region_name}::/apis/{api_id}", Tags)
+        return self._http_api_summary(self.http_apis[api_id])
+
+    def apigatewayv2_get_apis(self, MaxResults=None, NextToken=None):
+        apis = [self._http_api_summary(api) for api in self.http_apis.values()]
+        page, next_token = page_of(apis, NextToken, MaxResults, 500)
+        return with_token({"Items": page}, "NextToken", next_token)
+
+    def apigatewayv2_get_api(self, ApiId):
+        return self._http_api_summary(self._http_api(ApiId))
+
+    def apigatewayv2_delete_api(self, ApiId):
+        self._http_api(ApiId)
+        self.tags.pop(f"arn:aws:apigateway:{self.region_name}::/apis/{ApiId}", None)
+        del self.http_apis[ApiId]
+        return {}
+
+    def apigatewayv2_create_authorizer(self, ApiId, Name, AuthorizerType, **kwargs):
+        authorizer_id = make_id(length=6)
+        self._http_api(ApiId)["Authorizers"][authorizer_id] = dict(kwargs, AuthorizerId=authorizer_id,
+            Name=Name, AuthorizerType=AuthorizerType)
+        return {"AuthorizerId": authorizer_id, "Name": Name, "AuthorizerType": AuthorizerType}
+
+    def apigatewayv2_create_integration(self, ApiId, IntegrationType, **kwargs):
+        integration_id = make_id(length=7)
+        self._http_api(ApiId)["Integrations"][integration_id] = dict(kwargs,
+            IntegrationId=integration_id, IntegrationType=IntegrationType)
+        return {"IntegrationId": integration_id, "IntegrationType": IntegrationType}
+
+    def apigatewayv2_create_route(self, ApiId, RouteKey, **kwargs):
+        route_id = make_id(length=7)
+        route = dict(kwargs, RouteId=route_id, RouteKey=RouteKey)
+        route.setdefault("AuthorizationType", "NONE")
+        self._http_api(ApiId)["Routes"][route_id] = route
+        return dict(route)
+
+    def apigatewayv2_get_routes(self, ApiId, **kwargs):
+        return {"Items": [dict(route) for route in self._http_api(ApiId)["Routes"].values()]}
+
+    def apigatewayv2_create_stage(self, ApiId, StageName, **kwargs):
+        stage = dict(kwargs, StageName=StageName)
+        self._http_api(ApiId)["Stages"][StageName] = stage
+        return dict(stage)
+
+    def apigatewayv2_get_stage(self, ApiId, StageName):
+        stage = self._http_api(ApiId)["Stages"].get(StageName)
+        if stage is None:
+            raise FakeAwsError("NotFoundException", f"Invalid stage identifier specified {StageName}", 404)
+        return dict(stage)
+
+    def apigatewayv2_update_stage(self, ApiId, StageName, **kwargs):
+        stage = self.apigatewayv2_get_stage(ApiId, StageName)
+        self._http_api(ApiId)["Stages"][StageName].update(kwargs)
+        return dict(stage, **kwargs)
+
+    #
+    # tagging
+    #
+
+    def resourcegroupstaggingapi_get_resources(self, TagFilters=None, PaginationToken=None, **kwargs):
+        mappings = []
+        for arn, tags in self.tags.items():
+            if all(tag_filter["Key"] in tags and
+                    (not tag_filter.get("Values") or tags[tag_filter["Key"]] in tag_filter["Values"])
+                    for tag_filter in TagFilters or []):
+                mappings.append({"ResourceARN": arn, "Tags": [{"Key": key, "Value": value} for key, value in tags.items()]})
+        page, next_token = page_of(mappings, PaginationToken, None, 100)
+        return {"ResourceTagMappingList": page, "PaginationToken": next_token or ""}
+
+
+# execute a lambda handler's source as a fresh module whose `import boto3`
+# gets clients of the fake account.  Nothing global is patched, so handlers of
+# several fake accounts can be loaded side by side.
+def load_handler_module(fake, source, module_name="handler"):
+    fake_session = fake.session()
+    fake_boto3 = types.ModuleType("boto3")
+    fake_boto3.client = lambda service_name, *args, **kwargs: fake_session.client(service_name)
+    fake_boto3.Session = lambda *args, **kwargs: fake_session
+
+    def fake_import(name, *args, **kwargs):
+        if name == "boto3":
+            return fake_boto3
+        return builtins.__import__(name, *args, **kwargs)
+
+    module = types.ModuleType(module_name)
+    module.__dict__["__builtins__"] = dict(builtins.__dict__, __import__=fake_import)
+    exec(compile(source, f"<fake lambda {module_name}>", "exec"), module.__dict__)
+    return module
+
+
+def load_handler_file(fake, path, replace_old=None, replace_new=None):
+    '''load one of the GameLiftUnreal-*.py handlers against the fake account, with
+    the same string substitution create_lambdas applies'''
+    with open(path) as source_file:
+        source = source_file.read()
+    if replace_old:
+        source = source.replace(replace_old, replace_new)
+    return load_handler_module(fake, source)
+
+
+class FakeSession:
+    '''stands in for boto3.Session.  The clients are real but every request is
+    answered by the FakeAws account from a before-call hook'''
+    def __init__(self, fake):
+        self.fake = fake
+        self.boto3_session = boto3.Session(
+            aws_access_key_id="fake",
+            aws_secret_access_key="fake",
+            region_name=fake.region_name)
+        self.region_name = fake.region_name
+
+    def client(self, service_name, **kwargs):
+        client = self.boto3_session.client(service_name)
+        client.meta.events.register('before-parameter-build', self._remember_params)
+        # last, so hooks registered later (like AwsCallStats) still see the call
+        client.meta.events.register_last(
+            'before-call',
+            lambda model, context, **kwargs: self._respond(service_name, model, context))
+        return client
+
+    def _remember_params(self, params, context, **kwargs):
+        context["fake_aws_params"] = dict(params)
+
+    # the fake answers from before-call, which skips botocore's own retry
+    # handling, so throttled calls are retried here the way the default
+    # (legacy) retry mode would: up to 5 attempts with exponential backoff
+    def _respond(self, service_name, model, context):
+        for attempt in range(MAX_ATTEMPTS):
+            status_code, parsed = self.fake.handle(service_name, model.name, context.get("fake_aws_params", {}))
+            if parsed.get("Error", {}).get("Code") not in THROTTLING_CODES or attempt == MAX_ATTEMPTS - 1:
+                break
+            self.fake.backoff(attempt)
+        body = json.dumps(parsed, default=str).encode()
+        parsed.setdefault("ResponseMetadata", {"HTTPStatusCode": status_code, "RetryAttempts": attempt})
+        return AWSResponse(None, status_code, {"content-length": str(len(body))}, None), parsed
@@ -0,0 +1,546 @@
+#!/usr/bin/env python
+
+# Copyright 2022 Sean Payne
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# Load generator for the login -> startsession path.
+#
+# Every arrival is one player: POST /login as one of the test users that
+# create_user_pool made, then GET /startsession with the IdToken.  Arrivals
+# follow a rate curve (players per second over time) and are replayed with
+# asyncio, so thousands of players can be in flight from one process.
+#
+# It runs against the deployed api (found from the backend options, or given
+# with --invoke_url), or with --local against a stand-in http server that runs
+# the two lambda handler modules against an in-memory account
+# (aws_backend_fake.py).
+#
+# curves (--curve, spread over --duration seconds):
+#   constant:500          500 players per second
+#   ramp:10:500           linear from 10 to 500 per second
+#   step:50,100,200,500   equal length steps
+#   points:0=10,30=500,60=0
+#                         piecewise linear through (second=rate) points
+#
+# usage:
+#   python aws_backend_load.py --local --curve ramp:10:500 --duration 30
+#   python aws_backend_load.py --prefix mygame --curve constant:50 --duration 60
+#   python aws_backend_load.py --invoke_url https://abc.execute-api.us-west-2.amazonaws.com/stage --curve step:10,50,100
+
+import sys
+import argparse
+import asyncio
+import json
+import logging
+import random
+import ssl
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_backend
+
+ENDPOINTS = ["login", "startsession"]
+
+
+#
+# arrival curves
+#
+
+def parse_curve(spec, duration):
+    '''return rate(t) in players per second for 0 <= t < duration'''
+    kind, _, value = spec.partition(":")
+    try:
+        if kind == "constant":
+            rate = float(value)
+            return lambda t: rate
+        if kind == "ramp":
+            start_rate, end_rate = (float(part) for part in value.split(":"))
+            return lambda t: start_rate + (end_rate - start_rate) * t / duration
+        if kind == "step":
+            rates = [float(part) for part in value.split(",")]
+            return lambda t: rates[min(int(t * len(rates) / duration), len(rates) - 1)]
+        if kind == "points":
+            points = sorted((float(at), float(rate)) for at, rate in
+                (part.split("=") for part in value.split(",")))
+            def rate_at(t):
+                if t <= points[0][0]:
+                    return points[0][1]
+                for (t0, r0), (t1, r1) in zip(points, points[1:]):
+                    if t < t1:
+                        return r0 + (r1 - r0) * (t - t0) / (t1 - t0)
+                return points[-1][1]
+            return rate_at
+    except (ValueError, ZeroDivisionError):
+        pass
+    raise ValueError(f"can't parse curve {spec}")
+
+
+def make_arrival_times(rate, duration, poisson=False, seed=None, resolution=0.001):
+    '''seconds from the start at which players arrive.  even arrivals are spaced
+    1/rate apart; poisson arrivals have the same mean rate, thinned from the
+    curve's peak'''
+    grid = [i * resolution for i in range(int(duration / resolution))]
+    if not poisson:
+        arrivals = []
+        expected = 0.0
+        for t in grid:
+            expected += max(rate(t), 0.0) * resolution
+            while expected >= len(arrivals) + 1:
+                arrivals.append(t)
+        return arrivals
+    peak = max((rate(t) for t in grid), default=0.0)
+    if peak <= 0:
+        return []
+    generator = random.Random(seed)
+    arrivals = []
+    t = generator.expovariate(peak)
+    while t < duration:
+        if generator.random() * peak < rate(t):
+            arrivals.append(t)
+        t += generator.expovariate(peak)
+    return arrivals
+
+
+#
+# a small http/1.1 client on asyncio streams.  Keeps idle connections for
+# reuse so tls handshakes don't dominate at high rates
+#
+
+class HttpError(Exception):
+    pass
+
+
+class HttpConnectionPool:
+    def __init__(self, base_url, max_idle=1000):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.secure = parsed.scheme == "https"
+        self.port = parsed.port or (443 if self.secure else 80)
+        self.base_path = parsed.path.rstrip("/")
+        self.ssl_context = ssl.create_default_context() if self.secure else None
+        self.max_idle = max_idle
+        self.idle = []
+        self.connections_opened = 0
+
+    async def _open(self):
+        self.connections_opened += 1
+        return await asyncio.open_connection(self.host, self.port, ssl=self.ssl_context)
+
+    async def _exchange(self, connection, request):
+        reader, writer = connection
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed before the response")
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise HttpError(f"bad status line {status_line!r}")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = headers.get("connection", "").lower() != "close"
+        if "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                body += await reader.readexactly(size)
+                await reader.readline()
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return status, body, keep_alive
+
+    async def request(self, method, path, body=b"", headers=None):
+        '''return (status, body bytes)'''
+        lines = [f"{method} {self.base_path}/{path} HTTP/1.1", f"Host: {self.host}",
+            f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+        # an idle connection may have been closed by the server; retry those once
+        while True:
+            reused = bool(self.idle)
+            connection = self.idle.pop() if reused else await self._open()
+            try:
+                status, response_body, keep_alive = await self._exchange(connection, request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                connection[1].close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                connection[1].close()
+                raise
+            if keep_alive and len(self.idle) < self.max_idle:
+                self.idle.append(connection)
+            else:
+                connection[1].close()
+            return status, response_body
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+#
+# results
+#
+
+def percentile(sorted_values, fraction):
+    '''nearest rank'''
+    if not sorted_values:
+        return None
+    index = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class LoadResults:
+    def __init__(self):
+        self.latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors = {endpoint: {} for endpoint in ENDPOINTS}
+        self.players = 0
+        self.player_sessions = 0
+        self.game_session_ids = set()
+        self.max_start_lag = 0.0
+        self.elapsed = 0.0
+
+    def record(self, endpoint, latency, error=None):
+        self.latencies[endpoint].append(latency)
+        if error is not None:
+            self.errors[endpoint][error] = self.errors[endpoint].get(error, 0) + 1
+
+    def endpoint_summary(self, endpoint):
+        latencies = sorted(self.latencies[endpoint])
+        errors = sum(self.errors[endpoint].values())
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "error_rate": errors / len(latencies) if latencies else 0.0,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None,
+            "error_kinds": dict(self.errors[endpoint]),
+        }
+
+    def summary(self):
+        return {
+            "players": self.players,
+            "elapsed": self.elapsed,
+            "max_start_lag": self.max_start_lag,
+            "endpoints": {endpoint: self.endpoint_summary(endpoint) for endpoint in ENDPOINTS},
+            "player_sessions": self.player_sessions,
+            "game_sessions": len(self.game_session_ids),
+            "game_sessions_per_player":
+                len(self.game_session_ids) / self.player_sessions if self.player_sessions else 0.0,
+        }
+
+
+def format_ms(seconds):
+    return f"{seconds*1000:8.1f}ms" if seconds is not None else f'{"-":>10}'
+
+
+def print_summary(summary):
+    print(f'{"endpoint":<14} {"requests":>8} {"errors":>7} {"error%":>7} {"p50":>10} {"p95":>10} {"p99":>10} {"max":>10}')
+    for endpoint, row in summary["endpoints"].items():
+        print(f'{endpoint:<14} {row["requests"]:>8} {row["errors"]:>7} {row["error_rate"]*100:>6.2f}% '
+            f'{format_ms(row["p50"])} {format_ms(row["p95"])} {format_ms(row["p99"])} {format_ms(row["max"])}')
+        for error, count in sorted(row["error_kinds"].items(), key=lambda item: -item[1])[:5]:
+            print(f'    {count:>6} x {error}')
+    print(f'{summary["players"]} players in {summary["elapsed"]:.1f}s '
+        f'({summary["players"] / summary["elapsed"] if summary["elapsed"] else 0:.1f}/s), '
+        f'generator lag up to {summary["max_start_lag"]*1000:.0f}ms')
+    print(f'{summary["player_sessions"]} player sessions on {summary["game_sessions"]} game sessions '
+        f'({summary["game_sessions_per_player"]:.3f} game sessions per player)')
+
+
+#
+# players
+#
+
+def decode_json_body(body):
+    '''the start session handler returns json bytes, which the integration
+    may wrap in a json string once more'''
+    value = json.loads(body)
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value
+
+
+async def timed(results, endpoint, timeout, request):
+    '''await request() and record its latency.  Returns (status, body) or None'''
+    start = time.perf_counter()
+    try:
+        status, body = await asyncio.wait_for(request(), timeout)
+    except asyncio.TimeoutError:
+        results.record(endpoint, time.perf_counter() - start, "timeout")
+        return None
+    except (OSError, HttpError, asyncio.IncompleteReadError) as e:
+        results.record(endpoint, time.perf_counter() - start, type(e).__name__)
+        return None
+    latency = time.perf_counter() - start
+    results.record(endpoint, latency, None if status == 200 else f"http {status}")
+    return (status, body) if status == 200 else None
+
+
+async def run_player(pool, results, user_name, password, timeout):
+    response = await timed(results, "login", timeout, lambda: pool.request(
+        "POST", "login", json.dumps({"username": user_name, "password": password}).encode("utf-8"),
+        {"Content-Type": "application/json"}))
+    if response is None:
+        return
+    try:
+        login = json.loads(response[1])
+        id_token = login["tokens"]["IdToken"]
+    except (ValueError, KeyError, TypeError):
+        # a 200 that isn't a login; count it against the login endpoint
+        results.errors["login"]["login failed"] = results.errors["login"].get("login failed", 0) + 1
+        return
+
+    response = await timed(results, "startsession", timeout, lambda: pool.request(
+        "GET", "startsession", headers={"Authorization": f"Bearer {id_token}"}))
+    if response is None:
+        return
+    try:
+        player_session = decode_json_body(response[1])["PlayerSession"]
+    except (ValueError, KeyError, TypeError):
+        results.errors["startsession"]["no player session"] = \
+            results.errors["startsession"].get("no player session", 0) + 1
+        return
+    results.player_sessions += 1
+    results.game_session_ids.add(player_session["GameSessionId"])
+
+
+async def run_load(invoke_url, arrival_times, user_names, password, max_in_flight, timeout):
+    pool = HttpConnectionPool(invoke_url, max_idle=max_in_flight)
+    results = LoadResults()
+    in_flight = asyncio.Semaphore(max_in_flight)
+    loop = asyncio.get_running_loop()
+
+    async def player(index):
+        try:
+            await run_player(pool, results, user_names[index % len(user_names)], password, timeout)
+        finally:
+            in_flight.release()
+
+    tasks = []
+    start = loop.time()
+    for index, at in enumerate(arrival_times):
+        delay = start + at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await in_flight.acquire()
+        results.max_start_lag = max(results.max_start_lag, loop.time() - start - at)
+        results.players += 1
+        tasks.append(asyncio.ensure_future(player(index)))
+    await asyncio.gather(*tasks)
+    results.elapsed = loop.time() - start
+    pool.close()
+    return results
+
+
+#
+# local stand-in for the deployed api: the two lambda handlers, deployed into
+# an in-memory account, behind a small http server that checks the IdToken
+# the way the cognito authorizer would
+#
+
+def deploy_fake_backend(backend_config, latency):
+    from aws_backend_fake import FakeAws
+
+    fake = FakeAws(backend_config["region_name"], latency, sleep=latency > 0)
+    backend = aws_backend.AwsBackend(backend_config, session=fake.session())
+    build_id = fake.add_build(backend_config["server_package_name"], version=backend_config["server_package_version"])
+    backend.state.set("build_id", backend_config["server_package_name"], build_id)
+    for component in ["fleet", "user_pool", "lambdas"]:
+        getattr(backend, f"create_{component}")(backend_config)
+    return fake, backend
+
+
+class LocalApiServer:
+    def __init__(self, fake, backend, backend_config, workers):
+        self.fake = fake
+        self.backend_config = backend_config
+        self.client_id = backend._discover_user_pool_client_id(
+            backend._discover_user_pool_id(backend_config["user_pool_name"]),
+            backend_config["user_pool_login_client_name"])
+        self.stage_path = "/" + backend_config["rest_api_stage_name"]
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.server = None
+        # {serving task: writer} of the open keep-alive connections
+        self.connections = {}
+
+    def _authorized(self, headers):
+        from aws_backend_fake import decode_fake_token
+
+        token = headers.get("authorization", "")
+        if token.startswith("Bearer "):
+            token = token[len("Bearer "):]
+        claims = decode_fake_token(token)
+        return claims is not None and claims.get("aud") == self.client_id and \
+            claims.get("token_use") == "id" and claims.get("exp", 0) > time.time()
+
+    def _handle(self, method, path, headers, body):
+        '''(status, body bytes) for one request.  Runs on the executor'''
+        if method == "POST" and path == self.stage_path + "/login":
+            try:
+                event = json.loads(body or b"{}")
+            except ValueError:
+                event = {}
+            result = self.fake.invoke(self.backend_config["lambda_login_function_name"], event)
+            return 200, json.dumps(result).encode("utf-8")
+        if method == "GET" and path == self.stage_path + "/startsession":
+            if not self._authorized(headers):
+                return 401, b'{"message":"Unauthorized"}'
+            result = self.fake.invoke(self.backend_config["lambda_start_session_function_name"], {})
+            return 200, result if isinstance(result, bytes) else json.dumps(result).encode("utf-8")
+        return 404, b'{"message":"Missing Authentication Token"}'
+
+    async def _serve_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        self.connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path = request_line.decode("latin-1").split()[:2]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                try:
+                    status, response_body = await loop.run_in_executor(
+                        self.executor, self._handle, method, path, headers, body)
+                except Exception as e:
+                    # what api gateway answers when the lambda raises
+                    logging.debug("local api: %s %s failed: %s", method, path, e)
+                    status, response_body = 502, b'{"message": "Internal server error"}'
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(response_body)}\r\n\r\n"
+                    .encode("latin-1") + response_body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self.connections.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve_connection, "127.0.0.1", 0, backlog=4096)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}{self.stage_path}"
+
+    async def stop(self):
+        self.server.close()
+        # closing the transports ends the connections' read loops
+        for writer in list(self.connections.values()):
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.server.wait_closed()
+        self.executor.shutdown()
+
+
+def find_invoke_url(backend_config):
+    '''the deployed api's invoke url, looked up by name (in the first region of a multi-region config)'''
+    backend_config = aws_backend.make_region_config(backend_config, aws_backend.get_region_names(backend_config)[0])
+    backend = aws_backend.AwsBackend(backend_config)
+    if backend_config["rest_api_type"] == "http":
+        api_id = next(backend._iter_http_api_ids(backend_config["rest_api_name"]), None)
+    else:
+        api_id = next(backend._iter_rest_api_ids(backend_config["rest_api_name"]), None)
+    if api_id is None:
+        return None
+    return aws_backend.make_invoke_url(backend_config, api_id)
+
+
+async def run_local(args, backend_config, arrival_times, user_names):
+    fake, backend = deploy_fake_backend(backend_config, args.fake_latency)
+    server = LocalApiServer(fake, backend, backend_config, args.local_workers)
+    invoke_url = await server.start()
+    print(f"local stand-in api at {invoke_url}")
+    try:
+        return await run_load(invoke_url, arrival_times, user_names,
+            backend_config["user_pool_test_user_password"], args.max_in_flight, args.timeout)
+    finally:
+        await server.stop()
+
+
+def run_main(argv):
+    parser = argparse.ArgumentParser(description="Load generator for the deployed login and startsession api. "
+        "Options not listed here (--prefix, --region_name, ...) are passed to aws_backend.py's config")
+    parser.add_argument("--curve", default="constant:10", help="arrival curve, see the top of this file")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to replay the curve over")
+    parser.add_argument("--arrivals", default="even", choices=["even", "poisson"])
+    parser.add_argument("--seed", type=int, default=None, help="poisson arrivals: random seed")
+    parser.add_argument("--invoke_url", default="", help="the api to load; default: look it up by --rest_api_name")
+    parser.add_argument("--local", action="store_true", help="load a local stand-in api instead of aws")
+    parser.add_argument("--fake_latency", type=float, default=0.0, help="local: seconds added to every aws call")
+    parser.add_argument("--local_workers", type=int, default=64, help="local: handler threads")
+    parser.add_argument("--max_in_flight", type=int, default=2000, help="players in progress at once")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds per request")
+    parser.add_argument("--result_file", default="", help="also write the summary as json")
+    parser.add_argument("--verbose", action="store_true", help="show the backend's log")
+    args, backend_argv = parser.parse_known_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if args.local:
+        backend_argv = backend_argv + ["--state_file", "", "--trace_file", "", "--bulk_service_rates", "default=100000"]
+    backend_config = aws_backend.make_backend_config_from_args(backend_argv)
+    user_names = [backend_config["user_pool_test_user_name_pattern"].format(index=index)
+        for index in range(backend_config["user_pool_test_user_count"])]
+    if not user_names:
+        print("no test users; set --user_pool_test_user_count")
+        return 1
+
+    arrival_times = make_arrival_times(parse_curve(args.curve, args.duration), args.duration,
+        poisson=args.arrivals == "poisson", seed=args.seed)
+    print(f"{len(arrival_times)} players over {args.duration:.0f}s ({args.curve}, {args.arrivals}) "
+        f"as {len(user_names)} test users")
+
+    if args.local:
+        results = asyncio.run(run_local(args, backend_config, arrival_times, user_names))
+    else:
+        invoke_url = args.invoke_url or find_invoke_url(backend_config)
+        if not invoke_url:
+            print(f'no api named {backend_config["rest_api_name"]}; pass --invoke_url')
+            return 1
+        print(f"loading {invoke_url}")
+        results = asyncio.run(run_load(invoke_url, arrival_times, user_names,
+            backend_config["user_pool_test_user_password"], args.max_in_flight, args.timeout))
+
+    summary = results.summary()
+    print_summary(summary)
+    if args.result_file:
+        with open(args.result_file, "w") as result_file:
+            json.dump(summary, result_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run_main(sys.argv[1:]))
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+# Copyright 2022 Sean Payne
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# Structured timing trace for aws_backend.py runs, and a small analyzer for it.
+#
+# Every run (a command line invocation or an editor request) appends JSON
+# lines to the trace file, one per finished span:
+#
+#   {"run_id": ..., "span_id": ..., "parent_id": ..., "kind": "run|step|aws_call",
+#    "name": "create_fleet", "start": <epoch secs>, "duration": <secs>,
+#    "status": "ok|error", "attrs": {...}}
+#
+# Once the file grows past its size limit it is renamed to <file>.1 (replacing
+# any older one) and a new file is started.  A file that can't be written
+# turns tracing off for that path.
+#
+# aws_backend.py writes the file under the project_root (see its --trace_file),
+# so run the analyzer from there or pass --trace_file.
+#
+# usage:
+#   python aws_backend_trace.py list
+#   python aws_backend_trace.py critical_path [run_id]
+#   python aws_backend_trace.py compare [base_run_id new_run_id]
+
+import sys
+import argparse
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+DEFAULT_TRACE_FILE = "aws_backend_trace.jsonl"
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+
+trace_logger = logging.getLogger(__name__)
+
+# (run_id, span_id) of the innermost open span in this context
+current_span = contextvars.ContextVar("aws_backend_trace_span", default=(None, None))
+
+# (path, max bytes) of the trace file of this context, so concurrent requests
+# can each trace to their own file.  Worker threads started with
+# contextvars.copy_context() inherit it
+current_trace_file = contextvars.ContextVar("aws_backend_trace_file", default=("", DEFAULT_MAX_BYTES))
+
+
+class Tracer:
+    '''appends finished spans to the JSON lines file of the current context.
+    Disabled while that path is empty'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        # paths that couldn't be written
+        self.failed_paths = set()
+
+    def configure(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        '''trace to path from this context (and the threads it starts) on'''
+        current_trace_file.set((path, max_bytes))
+
+    @property
+    def path(self):
+        return current_trace_file.get()[0]
+
+    @property
+    def enabled(self):
+        path = self.path
+        return bool(path) and path not in self.failed_paths
+
+    def _write(self, record):
+        path, max_bytes = current_trace_file.get()
+        line = json.dumps(record, default=str)
+        with self.lock:
+            if path in self.failed_paths:
+                return
+            try:
+                if max_bytes and os.path.exists(path) and os.path.getsize(path) >= max_bytes:
+                    os.replace(path, path + ".1")
+                with open(path, "a") as trace_file:
+                    trace_file.write(line + "\n")
+            except OSError as e:
+                trace_logger.debug(f"tracing to {path} turned off: {e}")
+                self.failed_paths.add(path)
+
+    def record(self, kind, name, start, duration, status="ok", **attrs):
+        '''record a span that has already finished (e.g. an AWS call timed elsewhere)'''
+        if not self.enabled:
+            return
+        run_id, parent_id = current_span.get()
+        self._write({
+            "run_id": run_id,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent_id,
+            "kind": kind,
+            "name": name,
+            "start": start,
+            "duration": duration,
+            "status": status,
+            "attrs": attrs})
+
+    @contextlib.contextmanager
+    def span(self, kind, name, **attrs):
+        '''time the enclosed block.  A span opened with no parent starts a new run'''
+        if not self.enabled:
+            yield
+            return
+        run_id, parent_id = current_span.get()
+        span_id = uuid.uuid4().hex[:16]
+        if run_id is None:
+            run_id = span_id
+        token = current_span.set((run_id, span_id))
+        start = time.time()
+        start_counter = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            current_span.reset(token)
+            self._write({
+                "run_id": run_id,
+                "span_id": span_id,
+                "parent_id": parent_id,
+                "kind": kind,
+                "name": name,
+                "start": start,
+                "duration": time.perf_counter() - start_counter,
+                "status": status,
+                "attrs": attrs})
+
+
+tracer = Tracer()
+
+
+#
+# analyzer
+#
+
+def load_runs(path):
+    '''return {run_id: [span, ...]} in the order the runs started.  Includes the
+    spans of the file rotated out to path.1'''
+    runs = {}
+    for file_path in [path + ".1", path]:
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path) as trace_file:
+            for line in trace_file:
+                line = line.strip()
+                if line:
+                    span = json.loads(line)
+                    runs.setdefault(span["run_id"], []).append(span)
+    return dict(sorted(runs.items(), key=lambda item: min(span["start"] for span in item[1])))
+
+
+def find_root(spans):
+    for span in spans:
+        if span["parent_id"] is None:
+            return span
+    return None
+
+
+def critical_path(spans):
+    '''from the root, repeatedly follow the child that finished last.  Returns the
+    chain of spans that determined the run's duration'''
+    children = {}
+    for span in spans:
+        children.setdefault(span["parent_id"], []).append(span)
+    path = []
+    span = find_root(spans)
+    while span is not None:
+        path.append(span)
+        span_children = children.get(span["span_id"], [])
+        if not span_children:
+            break
+        span = max(span_children, key=lambda child: child["start"] + child["duration"])
+    return path
+
+
+def total_durations(spans):
+    '''{(kind, name): (count, total seconds)} excluding the root'''
+    totals = {}
+    for span in spans:
+        if span["parent_id"] is None:
+            continue
+        count, duration = totals.get((span["kind"], span["name"]), (0, 0.0))
+        totals[(span["kind"], span["name"])] = (count + 1, duration + span["duration"])
+    return totals
+
+
+def compare_runs(base_spans, new_spans):
+    '''return [(kind, name, base_secs, new_secs, delta_secs)] biggest regression first'''
+    base_totals = total_durations(base_spans)
+    new_totals = total_durations(new_spans)
+    rows = []
+    for key in set(base_totals) | set(new_totals):
+        base_secs = base_totals.get(key, (0, 0.0))[1]
+        new_secs = new_totals.get(key, (0, 0.0))[1]
+        rows.append((key[0], key[1], base_secs, new_secs, new_secs - base_secs))
+    rows.sort(key=lambda row: row[4], reverse=True)
+    return rows
+
+
+def describe_run(run_id, spans):
+    root = find_root(spans)
+    if root is None:
+        return f"{run_id}  (incomplete)"
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(root["start"]))
+    aws_calls = sum(1 for span in spans if span["kind"] == "aws_call")
+    return f'{run_id}  {started}  {root["duration"]:8.2f}s  {aws_calls:4d} aws calls  {root["name"]}'
+
+
+def print_critical_path(spans):
+    for depth, span in enumerate(critical_path(spans)):
+        print(f'{"  " * depth}{span["name"]:<40} {span["duration"]:8.2f}s  [{span["kind"]}, {span["status"]}]')
+
+
+def print_comparison(base_spans, new_spans, count):
+    print(f'{"kind":<10} {"name":<45} {"base":>9} {"new":>9} {"delta":>9}')
+    for kind, name, base_secs, new_secs, delta in compare_runs(base_spans, new_spans)[:count]:
+        print(f"{kind:<10} {name:<45} {base_secs:8.2f}s {new_secs:8.2f}s {delta:+8.2f}s")
+
+
+def run_main(argv):
+    parser = argparse.ArgumentParser(description="Analyze aws_backend.py trace files")
+    parser.add_argument("command", choices=["list", "critical_path", "compare"])
+    parser.add_argument("run_ids", nargs="*")
+    parser.add_argument("--trace_file", default=DEFAULT_TRACE_FILE)
+    parser.add_argument("--count", type=int, default=10, help="rows to show when comparing")
+    args = parser.parse_args(argv)
+
+    runs = load_runs(args.trace_file)
+    run_ids = list(runs)
+    if len(run_ids) == 0:
+        print(f"no runs in {args.trace_file}")
+        return
+
+    if args.command == "list":
+        for run_id in run_ids:
+            print(describe_run(run_id, runs[run_id]))
+    elif args.command == "critical_path":
+        run_id = args.run_ids[0] if args.run_ids else run_ids[-1]
+        if run_id not in runs:
+            print(f"no run {run_id} in {args.trace_file}")
+            return
+        print(describe_run(run_id, runs[run_id]))
+        print_critical_path(runs[run_id])
+    elif args.command == "compare":
+        if len(args.run_ids) >= 2:
+            base_run_id, new_run_id = args.run_ids[:2]
+        elif len(run_ids) >= 2:
+            base_run_id, new_run_id = run_ids[-2:]
+        else:
+            print("need two runs to compare")
+            return
+        for run_id in (base_run_id, new_run_id):
+            if run_id not in runs:
+                print(f"no run {run_id} in {args.trace_file}")
+                return
+        print("base: " + describe_run(base_run_id, runs[base_run_id]))
+        print("new:  " + describe_run(new_run_id, runs[new_run_id]))
+        print_comparison(runs[base_run_id], runs[new_run_id], args.count)
+
+
+if __name__ == '__main__':
+    run_main(sys.argv[1:])